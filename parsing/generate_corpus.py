@@ -0,0 +1,348 @@
+"""
+generate large synthetic CoNLL-U corpora for load testing the scorers
+sentences are sampled from (pre-parsed) treebank samples, such as data/conllu/{lg}.conllu,
+and perturbed as in sample_noise_ud.py: a token's Gender, Number or Case is changed to another value
+(with the matching inflection where known) and marked with modified:{feat}={old value} in MISC
+word order errors move a dependent to the other side of its head (marked with modified:wordorder)
+output is streamed, only the samples are kept in memory
+"""
+
+import argparse
+import bisect
+import math
+import random
+import sys
+from collections import Counter, defaultdict
+from itertools import accumulate
+
+FEATS = ["Gender", "Number", "Case"]
+# tokens of these parts of speech keep their form in larger vocabularies
+CLOSED_UPOS = {"PUNCT", "SYM", "NUM", "X"}
+
+
+def parse_feats(feats_str):
+    if feats_str == "_":
+        return {}
+    return dict(feat.split("=", 1) for feat in feats_str.split("|"))
+
+
+def format_feats(feats):
+    if len(feats) == 0:
+        return "_"
+    return "|".join(f"{k}={feats[k]}" for k in sorted(feats, key=str.lower))
+
+
+def load_samples(file_paths):
+    """
+    sentences as lists of tokens, a token is the list of its ten CoNLL-U columns,
+    comments and empty nodes are dropped
+    """
+    sents = []
+    for file_path in file_paths:
+        with open(file_path, "r") as rf:
+            sent = []
+            for line in rf:
+                line = line.rstrip("\n")
+                if not line:
+                    if sent:
+                        sents.append(sent)
+                    sent = []
+                elif not line.startswith("#"):
+                    cols = line.split("\t")
+                    if "." not in cols[0]:
+                        sent.append(cols)
+            if sent:
+                sents.append(sent)
+    return sents
+
+
+def is_word(token):
+    # multiword token ranges (e.g. 1-2) are not words
+    return "-" not in token[0]
+
+
+def sent_length(sent):
+    return sum(1 for token in sent if is_word(token))
+
+
+class Inflections:
+    """
+    alternate inflections of a lemma, looked up in the treebank samples (lemma, upos and features),
+    or else in a UniMorph dictionary (see sample_noise_ud.read_um)
+    """
+
+    def __init__(self, sents, um=None, um2ud=None):
+        self.forms = {}
+        self.values = defaultdict(set)
+        for sent in sents:
+            for token in sent:
+                if is_word(token):
+                    _, form, lemma, upos, _, feats = token[:6]
+                    self.forms[(lemma, upos, feats)] = form
+                    feats = parse_feats(feats)
+                    for feat in FEATS:
+                        if feat in feats:
+                            self.values[(upos, feat)].add(feats[feat])
+        self.values = {key: sorted(values) for key, values in self.values.items()}
+        self.um = um
+        self.um2ud = um2ud
+
+    def alternate_value(self, upos, feat, value):
+        """another value of `feat` seen for the part of speech, None if there is none"""
+        options = [v for v in self.values.get((upos, feat), []) if v != value]
+        return random.choice(options) if options else None
+
+    def form(self, lemma, upos, feats, feat, default):
+        form = self.forms.get((lemma, upos, format_feats(feats)))
+        if form is not None:
+            return form
+        if self.um is not None and lemma in self.um:
+            from sample_noise_ud import convert_um2ud
+
+            options = [
+                o
+                for o, tags in self.um[lemma].items()
+                if " " not in o
+                and feats[feat] in convert_um2ud(tags, self.um2ud)[1].get(feat, ())
+            ]
+            if options:
+                return random.choice(options)
+        return default
+
+
+class Lengths:
+    """sentence lengths: those of the samples, or normal / lognormal with the given mean and standard deviation"""
+
+    def __init__(self, sents, dist="sample", mean=20.0, std=10.0, max_length=200):
+        self.dist = dist
+        self.mean = mean
+        self.std = std
+        self.max_length = max_length
+        self.by_length = defaultdict(list)
+        for sent in sents:
+            self.by_length[sent_length(sent)].append(sent)
+        self.lengths = sorted(self.by_length)
+        if dist == "lognormal":
+            sigma2 = math.log(1 + (std / mean) ** 2)
+            self.mu, self.sigma = math.log(mean) - sigma2 / 2, math.sqrt(sigma2)
+
+    def sample(self):
+        if self.dist == "normal":
+            length = random.gauss(self.mean, self.std)
+        else:
+            length = random.lognormvariate(self.mu, self.sigma)
+        return min(self.max_length, max(1, round(length)))
+
+    def templates(self, sents):
+        """sample sentences that make up a sentence of the next length"""
+        if self.dist == "sample":
+            return [random.choice(sents)]
+        remaining, templates = self.sample(), []
+        while remaining > 0:
+            # the closest length available, long sentences are made of several samples
+            idx = bisect.bisect_left(self.lengths, remaining)
+            if idx == len(self.lengths) or (
+                idx > 0
+                and remaining - self.lengths[idx - 1] < self.lengths[idx] - remaining
+            ):
+                idx -= 1
+            length = self.lengths[idx]
+            templates.append(random.choice(self.by_length[length]))
+            remaining -= length
+        return templates
+
+
+def concat(templates):
+    """copy of the sentences joined into one, later roots attach to the first as parataxis"""
+    sent, offset, root = [], 0, None
+    for template in templates:
+        for token in template:
+            token = list(token)
+            if is_word(token):
+                token[0] = str(int(token[0]) + offset)
+                if token[6] == "0" and root is not None:
+                    token[6], token[7] = root, "parataxis"
+                elif token[6] not in ("0", "_"):
+                    token[6] = str(int(token[6]) + offset)
+                if token[6] == "0":
+                    root = token[0]
+            else:
+                start, end = token[0].split("-")
+                token[0] = f"{int(start) + offset}-{int(end) + offset}"
+            sent.append(token)
+        offset += sent_length(template)
+    return sent
+
+
+def add_misc(token, note):
+    token[9] = note if token[9] == "_" else f"{token[9]}|{note}"
+
+
+def perturb_feats(sent, rates, inflections, stats):
+    for token in sent:
+        if not is_word(token):
+            continue
+        for feat, rate in rates.items():
+            # the features are only parsed for tokens that are perturbed
+            if f"{feat}=" in token[5] and random.random() < rate:
+                feats = parse_feats(token[5])
+                old_value = feats.get(feat)
+                if old_value is None:
+                    continue
+                value = inflections.alternate_value(token[3], feat, old_value)
+                if value is None:
+                    continue
+                feats[feat] = value
+                token[5] = format_feats(feats)
+                token[1] = inflections.form(token[2], token[3], feats, feat, token[1])
+                add_misc(token, f"modified:{feat}={old_value}")
+                stats[feat] += 1
+
+
+def perturb_word_order(sent, stats):
+    """move a random dependent (not punctuation) to the other side of its head"""
+    if any(not is_word(token) for token in sent):
+        # keep multiword tokens intact
+        return
+    candidates = [
+        idx
+        for idx, token in enumerate(sent)
+        if token[6] not in ("0", "_") and token[3] != "PUNCT"
+    ]
+    if not candidates:
+        return
+    idx = random.choice(candidates)
+    token = sent.pop(idx)
+    head_idx = int(token[6]) - 1
+    # before a head that precedes the dependent, right after a head that follows it
+    # (having shifted left by the pop)
+    sent.insert(head_idx, token)
+    new_ids = {t[0]: str(i + 1) for i, t in enumerate(sent)}
+    for t in sent:
+        t[0] = new_ids[t[0]]
+        if t[6] in new_ids:
+            t[6] = new_ids[t[6]]
+    add_misc(token, "modified:wordorder")
+    stats["wordorder"] += 1
+
+
+class Vocabulary:
+    """
+    grows the vocabulary of the samples to about `size` word forms,
+    with numbered variants of the open class forms (e.g. domu~3) drawn from a Zipf distribution
+    """
+
+    def __init__(self, sents, size=None):
+        forms = {t[1] for s in sents for t in s if t[3] not in CLOSED_UPOS}
+        self.n_variants = 1
+        if size is not None and len(forms) > 0:
+            self.n_variants = max(1, math.ceil(size / len(forms)))
+        self.cum_weights = list(accumulate(1 / (k + 1) for k in range(self.n_variants)))
+
+    def apply(self, sent):
+        if self.n_variants == 1:
+            return
+        for token in sent:
+            if token[3] in CLOSED_UPOS:
+                continue
+            k = bisect.bisect(self.cum_weights, random.random() * self.cum_weights[-1])
+            if k > 0:
+                token[1], token[2] = f"{token[1]}~{k}", f"{token[2]}~{k}"
+
+
+def generate(
+    sents,
+    n,
+    wf,
+    rates,
+    word_order_rate=0.0,
+    lengths=None,
+    inflections=None,
+    vocabulary=None,
+):
+    """write `n` synthetic sentences to `wf`, returns the number of perturbations per feature"""
+    lengths = lengths or Lengths(sents)
+    inflections = inflections or Inflections(sents)
+    stats = Counter()
+    for sent_id in range(1, n + 1):
+        sent = concat(lengths.templates(sents))
+        if word_order_rate > 0 and random.random() < word_order_rate:
+            perturb_word_order(sent, stats)
+        perturb_feats(sent, rates, inflections, stats)
+        if vocabulary is not None:
+            vocabulary.apply(sent)
+        lines = [f"# sent_id = {sent_id}"] + ["\t".join(token) for token in sent]
+        wf.write("\n".join(lines) + "\n\n")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="generate large synthetic corpora")
+    parser.add_argument(
+        "-orig", type=str, nargs="+", help="(pre-parsed) conllu samples"
+    )
+    parser.add_argument("-out", type=str, help="output conllu, - for stdout")
+    parser.add_argument("-n", type=int, default=10000, help="number of sentences")
+    parser.add_argument("-gender", type=float, default=0.0, help="per-token rate")
+    parser.add_argument("-number", type=float, default=0.0, help="per-token rate")
+    parser.add_argument("-case", type=float, default=0.0, help="per-token rate")
+    parser.add_argument(
+        "-word-order", type=float, default=0.0, help="per-sentence rate"
+    )
+    parser.add_argument(
+        "-lengths",
+        type=str,
+        default="sample",
+        choices=["sample", "normal", "lognormal"],
+        help="sentence length distribution",
+    )
+    parser.add_argument("-mean-length", type=float, default=20.0)
+    parser.add_argument("-std-length", type=float, default=10.0)
+    parser.add_argument("-max-length", type=int, default=200)
+    parser.add_argument(
+        "-vocab-size", type=int, default=None, help="approximate number of word forms"
+    )
+    parser.add_argument(
+        "-unimorph", type=str, default=None, help="unimorph file for lg (optional)"
+    )
+    parser.add_argument("-seed", type=int, default=23)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    sents = load_samples(args.orig)
+
+    um, um2ud = None, None
+    if args.unimorph is not None:
+        from sample_noise_ud import read_ud_um, read_um
+
+        um = read_um(args.unimorph)
+        um2ud, _ = read_ud_um()
+
+    rates = {"Gender": args.gender, "Number": args.number, "Case": args.case}
+    rates = {feat: rate for feat, rate in rates.items() if rate > 0}
+    lengths = Lengths(
+        sents, args.lengths, args.mean_length, args.std_length, args.max_length
+    )
+    inflections = Inflections(sents, um, um2ud)
+    vocabulary = Vocabulary(sents, args.vocab_size)
+
+    wf = sys.stdout if args.out == "-" else open(args.out, "w")
+    try:
+        stats = generate(
+            sents,
+            args.n,
+            wf,
+            rates,
+            args.word_order,
+            lengths,
+            inflections,
+            vocabulary,
+        )
+    finally:
+        if wf is not sys.stdout:
+            wf.close()
+
+    for key, count in sorted(stats.items()):
+        print(
+            "%s\t%d\t%.3f per sentence" % (key, count, count / args.n), file=sys.stderr
+        )
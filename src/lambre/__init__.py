@@ -5,3 +5,4 @@ RULE_LINKS = f"{Path(__file__).parent.resolve()}/rule_links"
 
 from .download import download_lambre_files as download
 from .metric import score
+from .compare import compare
@@ -0,0 +1,172 @@
+"""
+a fast ascii renderer of the error markup (POS spans and dependency arcs), drawn as ipymarkup's
+format_span_ascii_markup and format_dep_ascii_markup do, without their interval trees and records
+very long sentences are truncated to a window of words around the marked (dependent and head) tokens
+"""
+
+from textwrap import TextWrapper
+from typing import List, Tuple
+
+# placeholder for the words left out of a window
+GAP = "..."
+
+
+def _wrap(text: str, width: int) -> List[str]:
+    """lines of at most `width` characters, whitespace is kept (as in ipymarkup)"""
+    return TextWrapper(
+        width, expand_tabs=False, replace_whitespace=False, drop_whitespace=False
+    ).wrap(text)
+
+
+def format_span_lines(words: List[str], tags: dict, width: int = 70) -> List[str]:
+    """
+    the space-joined words, wrapped at `width`, each line followed by the POS tags (`tags`, word index to tag)
+    of its marked words, underlined with ─
+    """
+    text = " ".join(words)
+    spans = []
+    offset = 0
+    for idx, word in enumerate(words):
+        if idx in tags:
+            spans.append((offset, offset + len(word), tags[idx]))
+        offset += len(word) + 1
+
+    out = []
+    offset = 0
+    span_idx = 0
+    for line in _wrap(text, width) if text else []:
+        stop = offset + len(line)
+        row = None
+        while span_idx < len(spans) and spans[span_idx][0] < stop:
+            start, end, tag = spans[span_idx]
+            if row is None:
+                row = [" "] * len(line)
+            first, last = max(start, offset) - offset, min(end, stop) - offset
+            row[first:last] = ["─"] * (last - first)
+            if start >= offset:
+                label = tag[: min(end - start, len(line) - first)]
+                row[first : first + len(label)] = list(label)
+            if end > stop:
+                break
+            span_idx += 1
+        out.append(line.replace("\t", " "))
+        if row is not None:
+            out.append("".join(row))
+        offset = stop
+    return out
+
+
+def format_dep_lines(words: List[str], deps: List[Tuple[int, int, str]]) -> List[str]:
+    """one line per word with the arcs of `deps`, (head index, dependent index, label) triples"""
+    arcs = []
+    for head, depd, label in deps:
+        if label == "root" or head == depd:
+            continue
+        arcs.append((min(head, depd), max(head, depd), head < depd, label))
+    # shorter arcs are drawn closer to the words
+    arcs.sort(key=lambda arc: (arc[1] - arc[0], arc[0]))
+
+    levels = []
+    for start, stop, _, _ in arcs:
+        overlapping = [
+            level
+            for (start_, stop_, _, _), level in zip(arcs, levels)
+            if start_ < stop and stop_ >= start
+        ]
+        if not overlapping or min(overlapping) > 0:
+            levels.append(0)
+        else:
+            levels.append(max(overlapping) + 1)
+
+    n_words = len(words)
+    sections = [[] for _ in range(n_words)]
+    for (start, stop, rightward, label), level in zip(arcs, levels):
+        for idx in range(max(start, 0), min(stop, n_words - 1) + 1):
+            sections[idx].append((level, idx, start, stop, rightward, label))
+
+    max_level = max((section[0] for arcs_ in sections for section in arcs_), default=-1)
+    width = (max_level + 1) * 2
+
+    blocks, labels = [], []
+    for arcs_ in sections:
+        row = [" "] * width
+        label = None
+        # higher arcs first, as ipymarkup does
+        for level, idx, start, stop, rightward, label_ in sorted(
+            arcs_, key=lambda section: -section[0]
+        ):
+            pos = 2 * level
+            if start < idx < stop:
+                row[pos] = " "
+                row[pos + 1] = "│"
+                continue
+            # the arrow points at the dependent, the head is the other end
+            is_depd = (idx == stop) == rightward
+            if is_depd:
+                row[pos] = "►"
+                label = label_
+            else:
+                row[pos] = "─"
+            row[pos + 1] = "┌" if idx == start else "└"
+        blocks.append(row[::-1])
+        labels.append(label)
+
+    # extend the arc ends up to the words
+    for row in blocks:
+        for x in range(1, width):
+            if row[x] == " " and row[x - 1] in "►─":
+                row[x] = row[x - 1]
+                row[x - 1] = "─"
+
+    size = max((len(word) for word in words), default=0)
+    return [
+        " ".join(["".join(row), word.ljust(size), label or ""])
+        for row, word, label in zip(blocks, words, labels)
+    ]
+
+
+def window(
+    words: List[str], tags: dict, deps: List[Tuple[int, int, str]], context: int
+):
+    """
+    the words within `context` words of a marked token or an arc end, the left out words are replaced by GAP
+    returns the words, tags and deps re-indexed to the window
+    """
+    positions = set(tags)
+    for head, depd, _ in deps:
+        positions.update([head, depd])
+    kept = set()
+    for pos in positions:
+        if pos < 0 or pos >= len(words):
+            continue
+        kept.update(range(max(pos - context, 0), min(pos + context + 1, len(words))))
+
+    window_words, index = [], {}
+    previous = -1
+    for idx in sorted(kept):
+        if idx > previous + 1:
+            window_words.append(GAP)
+        index[idx] = len(window_words)
+        window_words.append(words[idx])
+        previous = idx
+    if previous < len(words) - 1:
+        window_words.append(GAP)
+
+    window_tags = {index[idx]: tag for idx, tag in tags.items() if idx in index}
+    # arc ends outside the sentence (e.g. the root's head) stay outside
+    window_deps = [
+        (index.get(head, -1), index.get(depd, -1), label) for head, depd, label in deps
+    ]
+    return window_words, window_tags, window_deps
+
+
+def format_window(
+    words: List[str],
+    tags: dict,
+    deps: List[Tuple[int, int, str]],
+    context: int = 5,
+    width: int = 70,
+) -> Tuple[List[str], List[str]]:
+    """span and dependency lines of the window of `context` words around the marked tokens"""
+    words, tags, deps = window(words, tags, deps, context)
+    return format_span_lines(words, tags, width), format_dep_lines(words, deps)
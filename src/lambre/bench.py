@@ -0,0 +1,454 @@
+"""
+benchmarks of rule loading, scoring and visualization on the pre-parsed sample corpora,
+replicated to larger sizes, with throughput and memory scaling curves and a baseline comparison
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing as mp
+import os
+import traceback
+from pathlib import Path
+from typing import List
+
+import pyconll
+
+from lambre import (
+    RELATION_MAP,
+    RULE_LINKS,
+    bundle,
+    memory_utils,
+    rule_utils,
+    score_utils_chaudhary,
+    score_utils_pratapa,
+    timing_utils,
+    visualize,
+)
+
+RULE_SETS = ["chaudhary-etal-2021", "pratapa-etal-2021"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="benchmark L'AMBRE scoring on replicated pre-parsed corpora (runs offline)"
+    )
+    parser.add_argument(
+        "--data",
+        type=Path,
+        default=Path("data") / "conllu",
+        help="directory of pre-parsed {lg}.conllu samples",
+    )
+    parser.add_argument(
+        "--langs",
+        type=str,
+        nargs="+",
+        default=None,
+        help="languages to benchmark (default: every sample in --data)",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10000, 100000],
+        help="number of sentences the samples are replicated to, e.g. 10000 100000 1000000",
+    )
+    parser.add_argument(
+        "--rule-sets",
+        type=str,
+        nargs="+",
+        choices=RULE_SETS,
+        default=RULE_SETS,
+        help="rule sets to benchmark",
+    )
+    parser.add_argument(
+        "--rules-path",
+        type=Path,
+        default=Path.home() / "lambre_files" / "rules",
+        help="path to rule sets, or a bundle (see lambre-bundle)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes for rule evaluation (chaudhary-etal-2021 rule set)",
+    )
+    parser.add_argument(
+        "--max-errors",
+        type=int,
+        default=None,
+        metavar="K",
+        help="visualize a uniform sample of at most K errors",
+    )
+    parser.add_argument(
+        "--synthetic-rules",
+        type=int,
+        default=0,
+        metavar="N",
+        help="also score with the pratapa-etal-2021 rules padded with N synthetic agreement and N argstruct rules, as for languages with large rule sets",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default="out",
+        help="specify path to output directory. Stores bench.json.",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=None,
+        help="bench.json of an earlier run to compare against",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative slowdown of a stage over the baseline reported as a regression",
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.05,
+        help="stages faster than this (in seconds) in the baseline are not compared",
+    )
+
+    return parser.parse_args()
+
+
+def replicate(sentences, size: int):
+    """
+    `size` sentences cycling through `sentences`, the sentences are shared rather than copied,
+    so the corpus itself takes little memory and the memory curves reflect the scorers
+    """
+    return [sentences[idx % len(sentences)] for idx in range(size)]
+
+
+def _score_and_visualize(
+    timer, data, lg: str, rule_set: str, rules_file_path: Path, workers, max_errors
+):
+    """time rule loading, document and sentence scoring and visualization of one rule set"""
+    name = rule_set.split("-")[0]
+    if rule_set == "pratapa-etal-2021":
+        with timer.stage(f"{name}: load rules", throughput=False):
+            rules = rule_utils.load_pratapa_etal_2021_rules(rules_file_path)
+        scorer, rule_args, kwargs = score_utils_pratapa, rules, {}
+    else:
+        with timer.stage(f"{name}: load rules", throughput=False):
+            rules = rule_utils.load_chaudhury_etal_2021_rules(rules_file_path)
+        scorer, rule_args, kwargs = (
+            score_utils_chaudhary,
+            (rules,),
+            {"workers": workers},
+        )
+
+    for mode, get_score in [
+        ("doc", scorer.get_doc_score),
+        ("sent", scorer.get_sent_score),
+    ]:
+        # the scorers time their own stages, e.g. feature extraction and rule matching
+        stage_timer = timing_utils.StageTimer()
+        with timer.stage(f"{name}: {mode} score"):
+            _, errors = get_score(
+                data,
+                *rule_args,
+                report=False,
+                max_errors=max_errors,
+                timer=stage_timer,
+                **kwargs,
+            )
+        for stage, record in stage_timer.stages.items():
+            timer.add(
+                f"{name}: {mode} {stage}",
+                record["wall"],
+                record["cpu"],
+                record["throughput"],
+            )
+
+    # visualizations are generated (for the errors of the sentence-level run) but not written,
+    # errors.txt is rendered across the `workers` as in lambre
+    if rule_set == "pratapa-etal-2021":
+        with timer.stage(f"{name}: visualize txt"):
+            visualize.write_ascii_visualizations(
+                os.devnull,
+                visualize.iter_sentence_error_markup(
+                    scorer.materialize_sentence_errors(data, errors)
+                ),
+                workers=workers,
+            )
+        with timer.stage(f"{name}: visualize html"):
+            visualize.visualize_sentence_conll_errors(
+                scorer.materialize_sentence_errors(data, errors)
+            )
+    else:
+        with timer.stage(f"{name}: visualize load resources", throughput=False):
+            relation_map = visualize.load_relation_map(RELATION_MAP)
+            rule_links = visualize.load_rule_links(RULE_LINKS)
+        with timer.stage(f"{name}: visualize txt"):
+            visualize.write_ascii_visualizations(
+                os.devnull,
+                visualize.iter_sentence_error_markup_chau(
+                    scorer.materialize_sentence_errors(data, errors), relation_map
+                ),
+                workers=workers,
+            )
+        with timer.stage(f"{name}: visualize html"):
+            visualize.visualize_sentence_conll_errors_chau(
+                scorer.materialize_sentence_errors(data, errors),
+                relation_map,
+                rule_links.get(lg, ""),
+            )
+
+
+def synthetic_pratapa_rules(lang_agr, lang_argstruct, n_rules: int):
+    """
+    copies of pratapa-etal-2021 rules (see rule_utils.load_pratapa_etal_2021_rules) with `n_rules` more
+    agreement and argstruct rules, on relations that never occur, so scores are unchanged
+    but the scorer has to handle a large rule set
+    """
+    lang_agr = {agr_type: list(feats) for agr_type, feats in lang_agr.items()}
+    lang_argstruct = {
+        depd_type: dict(feats) for depd_type, feats in lang_argstruct.items()
+    }
+    for idx in range(n_rules):
+        lang_agr[f"synthetic{idx}-NOUN-VERB"] = ["Number"]
+        lang_argstruct[f"synthetic{idx}"] = {"Case": ("Nom", "NOUN")}
+    return lang_agr, lang_argstruct
+
+
+def _score_synthetic_rules(timer, data, rules_file_path: Path, n_rules: int):
+    """time document and sentence scoring with the pratapa-etal-2021 rules padded with `n_rules` synthetic rules"""
+    name = f"pratapa +{n_rules} rules"
+    rules = synthetic_pratapa_rules(
+        *rule_utils.load_pratapa_etal_2021_rules(rules_file_path), n_rules
+    )
+    for mode, get_score in [
+        ("doc", score_utils_pratapa.get_doc_score),
+        ("sent", score_utils_pratapa.get_sent_score),
+    ]:
+        with timer.stage(f"{name}: {mode} score"):
+            get_score(data, *rules, report=False)
+
+
+def run_case(
+    data_path: Path,
+    lg: str,
+    size: int,
+    rule_sets: List[str],
+    rules_path: Path,
+    workers: int = 1,
+    max_errors: int = None,
+    synthetic_rules: int = 0,
+):
+    """
+    benchmark one language at one corpus size, returns the stage timings (see timing_utils.StageTimer.to_dict)
+    with the peak resident memory and its growth over the run
+    with `synthetic_rules`, pratapa-etal-2021 scoring is also timed with that many synthetic rules added
+    """
+    rss_start = memory_utils.current_rss()
+    timer = timing_utils.StageTimer()
+    with timer.stage("load conllu", throughput=False):
+        sample = pyconll.load_from_file(data_path / f"{lg}.conllu")
+    data = replicate(sample, size)
+    timer.set_corpus_size(data)
+
+    # rules are read from disk, or from a bundle
+    rules_path = bundle.rules_root(rules_path)
+    for rule_set in rule_sets:
+        rules_file_path = rules_path / rule_set / f"{lg}.txt"
+        if not rules_file_path.is_file():
+            logging.warning(f"{lg} is not supported for rule set {rule_set}")
+            continue
+        _score_and_visualize(
+            timer, data, lg, rule_set, rules_file_path, workers, max_errors
+        )
+        if rule_set == "pratapa-etal-2021" and synthetic_rules > 0:
+            _score_synthetic_rules(timer, data, rules_file_path, synthetic_rules)
+
+    result = {"lang": lg, **timer.to_dict(), "table": timer.table()}
+    peak_rss = memory_utils.peak_rss()
+    if peak_rss is not None:
+        result["peak_rss_mb"] = peak_rss / memory_utils.MB
+        result["rss_growth_mb"] = (peak_rss - rss_start) / memory_utils.MB
+    return result
+
+
+def _run_case_process(conn, kwargs):
+    try:
+        conn.send(("ok", run_case(**kwargs)))
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def run_isolated(**kwargs):
+    """
+    run_case in a fresh process, so the peak resident memory is that of a single case
+    (not a pool process, the chaudhary scorer may start its own workers)
+    """
+    ctx = mp.get_context("fork" if "fork" in mp.get_all_start_methods() else "spawn")
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_run_case_process, args=(child_conn, kwargs))
+    process.start()
+    child_conn.close()
+    status, result = parent_conn.recv()
+    process.join()
+    if status != "ok":
+        raise RuntimeError(f"benchmark failed\n{result}")
+    return result
+
+
+def scaling_curves(results):
+    """per language, the wall time, throughput and memory of every stage as a function of the corpus size"""
+    curves = {}
+    for result in sorted(results, key=lambda result: result["n_sents"]):
+        curve = curves.setdefault(
+            result["lang"],
+            {"sizes": [], "peak_rss_mb": [], "rss_growth_mb": [], "stages": {}},
+        )
+        curve["sizes"].append(result["n_sents"])
+        curve["peak_rss_mb"].append(result.get("peak_rss_mb"))
+        curve["rss_growth_mb"].append(result.get("rss_growth_mb"))
+        for stage, record in result["stages"].items():
+            stage_curve = curve["stages"].setdefault(
+                stage, {"wall": [], "sents_per_sec": []}
+            )
+            stage_curve["wall"].append(record["wall"])
+            stage_curve["sents_per_sec"].append(record.get("sents_per_sec"))
+    return curves
+
+
+def compare_baseline(results, baseline, threshold: float, min_time: float):
+    """
+    stages whose wall time grew by more than `threshold` (relative) over the baseline,
+    for the (language, size) cases found in both runs
+    """
+    baseline_results = {
+        (result["lang"], result["n_sents"]): result for result in baseline["results"]
+    }
+    regressions = []
+    for result in results:
+        baseline_result = baseline_results.get((result["lang"], result["n_sents"]))
+        if baseline_result is None:
+            continue
+        for stage, record in result["stages"].items():
+            baseline_record = baseline_result["stages"].get(stage)
+            if baseline_record is None or baseline_record["wall"] < min_time:
+                continue
+            ratio = record["wall"] / baseline_record["wall"]
+            if ratio > 1 + threshold:
+                regressions.append(
+                    {
+                        "lang": result["lang"],
+                        "n_sents": result["n_sents"],
+                        "stage": stage,
+                        "baseline_wall": baseline_record["wall"],
+                        "wall": record["wall"],
+                        "ratio": ratio,
+                    }
+                )
+    return regressions
+
+
+def run_benchmarks(
+    data_path: Path = Path("data") / "conllu",
+    langs: List[str] = None,
+    sizes: List[int] = (10000, 100000),
+    rule_sets: List[str] = RULE_SETS,
+    rules_path: Path = Path.home() / "lambre_files" / "rules",
+    workers: int = 1,
+    max_errors: int = None,
+    synthetic_rules: int = 0,
+    baseline: dict = None,
+    threshold: float = 0.2,
+    min_time: float = 0.05,
+):
+    """
+    benchmark every language and size, returns the results, scaling curves
+    and (given a `baseline`, an earlier return value) the regressions
+    """
+    if langs is None:
+        langs = sorted(path.stem for path in Path(data_path).glob("*.conllu"))
+
+    results = []
+    for lg in langs:
+        for size in sizes:
+            logging.info(f"benchmarking {lg} with {size} sentences")
+            result = run_isolated(
+                data_path=Path(data_path),
+                lg=lg,
+                size=size,
+                rule_sets=list(rule_sets),
+                rules_path=Path(rules_path),
+                workers=workers,
+                max_errors=max_errors,
+                synthetic_rules=synthetic_rules,
+            )
+            logging.info(f"{result.pop('table')}\n")
+            results.append(result)
+
+    bench = {
+        "config": {
+            "sizes": list(sizes),
+            "rule_sets": list(rule_sets),
+            "workers": workers,
+            "max_errors": max_errors,
+            "synthetic_rules": synthetic_rules,
+        },
+        "results": results,
+        "curves": scaling_curves(results),
+    }
+    if baseline is not None:
+        bench["regressions"] = compare_baseline(results, baseline, threshold, min_time)
+    return bench
+
+
+def main():
+
+    logging.basicConfig(
+        format="%(message)s",
+        level=logging.INFO,
+        handlers=[logging.StreamHandler()],
+    )
+
+    args = vars(parse_args())
+
+    baseline = None
+    if args["baseline"] is not None:
+        with open(args["baseline"], "r") as rf:
+            baseline = json.load(rf)
+
+    bench = run_benchmarks(
+        data_path=args["data"],
+        langs=args["langs"],
+        sizes=args["sizes"],
+        rule_sets=args["rule_sets"],
+        rules_path=args["rules_path"],
+        workers=args["workers"],
+        max_errors=args["max_errors"],
+        synthetic_rules=args["synthetic_rules"],
+        baseline=baseline,
+        threshold=args["threshold"],
+        min_time=args["min_time"],
+    )
+
+    args["output"].mkdir(exist_ok=True, parents=True)
+    bench_path = args["output"] / "bench.json"
+    logging.info(f"writing benchmark results to {bench_path}")
+    with open(bench_path, "w") as wf:
+        json.dump(bench, wf, indent=2)
+
+    if baseline is not None:
+        regressions = bench["regressions"]
+        for regression in regressions:
+            logging.warning(
+                f"regression: {regression['lang']} ({regression['n_sents']} sentences) {regression['stage']}: "
+                f"{regression['baseline_wall']:.3f}s -> {regression['wall']:.3f}s ({regression['ratio']:.2f}x)"
+            )
+        if len(regressions) > 0:
+            exit(1)
+        logging.info(f"no regressions over {args['baseline']}")
+
+
+if __name__ == "__main__":
+    main()
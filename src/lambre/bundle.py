@@ -0,0 +1,307 @@
+"""
+offline resource bundles: the rules, resources.json and parsers of lambre_files packed into a single zip archive
+an index (index.json) lists the members of each language with their sha256 checksums,
+so installs only read the members of the requested languages, and the rules can be read straight from the bundle
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import logging
+import shutil
+import tempfile
+import zipfile
+from functools import lru_cache
+from pathlib import Path
+
+from lambre.download import (
+    RULE_SETS,
+    install_extracted,
+    read_installed,
+    write_installed,
+)
+
+INDEX = "index.json"
+BUNDLE_VERSION = 1
+# members of these types are compressed, parser models are stored as they are
+COMPRESSED_SUFFIXES = {".txt", ".json"}
+
+
+def _rule_members(dir: Path):
+    for rule_set in RULE_SETS:
+        for file_path in sorted((dir / "rules" / rule_set).glob("*.txt")):
+            yield file_path.stem, f"rules/{rule_set}/{file_path.name}"
+
+
+def _parser_members(dir: Path, lg: str):
+    lang_dir = dir / "lambre_stanza_resources" / lg
+    for file_path in sorted(lang_dir.rglob("*")):
+        if file_path.is_file():
+            yield file_path.relative_to(dir).as_posix()
+
+
+def installed_parsers(dir: Path):
+    """languages with a parser in `dir`"""
+    parser_dir = dir / "lambre_stanza_resources"
+    if not parser_dir.is_dir():
+        return []
+    return sorted(
+        entry.name
+        for entry in parser_dir.iterdir()
+        if entry.is_dir() and not entry.name.startswith(".")
+    )
+
+
+def _write_member(zf: zipfile.ZipFile, file_path: Path, name: str, chunk_size: int):
+    """copy `file_path` into the bundle as `name`, returns its index entry"""
+    info = zipfile.ZipInfo.from_file(file_path, name)
+    if file_path.suffix in COMPRESSED_SUFFIXES:
+        info.compress_type = zipfile.ZIP_DEFLATED
+    sha256 = hashlib.sha256()
+    size = file_path.stat().st_size
+    with open(file_path, "rb") as rf, zf.open(
+        info, "w", force_zip64=size >= zipfile.ZIP64_LIMIT
+    ) as wf:
+        for chunk in iter(lambda: rf.read(chunk_size), b""):
+            sha256.update(chunk)
+            wf.write(chunk)
+    return {"sha256": sha256.hexdigest(), "size": size}
+
+
+def create_bundle(
+    bundle_path: Path,
+    dir: Path = Path.home() / "lambre_files",
+    langs=None,
+    chunk_size: int = 1 << 20,
+) -> dict:
+    """
+    pack the rules of both rule sets (all languages), resources.json and the parsers of `langs`
+    (all the installed parsers by default) from `dir` into `bundle_path`, returns the bundle's index
+    """
+    dir = Path(dir)
+    langs = installed_parsers(dir) if langs is None else list(langs)
+    missing = [
+        lg for lg in langs if not (dir / "lambre_stanza_resources" / lg).is_dir()
+    ]
+    if missing:
+        raise FileNotFoundError(f"no parser for {', '.join(missing)} in {dir}")
+
+    index = {
+        "version": BUNDLE_VERSION,
+        "files": {},
+        "rules": {},
+        "parsers": {},
+        "shared": [],
+        "installed": {},
+    }
+    installed = read_installed(dir)
+    part_path = Path(bundle_path).with_name(Path(bundle_path).name + ".part")
+    with zipfile.ZipFile(part_path, "w") as zf:
+        for lg, name in _rule_members(dir):
+            index["files"][name] = _write_member(zf, dir / name, name, chunk_size)
+            index["rules"].setdefault(lg, []).append(name)
+        resources = "lambre_stanza_resources/resources.json"
+        if (dir / resources).is_file():
+            index["files"][resources] = _write_member(
+                zf, dir / resources, resources, chunk_size
+            )
+            index["shared"].append(resources)
+        for lg in langs:
+            names = list(_parser_members(dir, lg))
+            for name in names:
+                index["files"][name] = _write_member(zf, dir / name, name, chunk_size)
+            index["parsers"][lg] = names
+            if lg in installed:
+                index["installed"][lg] = installed[lg]
+        # the index is written last, it is found through the archive's central directory
+        zf.writestr(INDEX, json.dumps(index, indent=1, sort_keys=True))
+    part_path.replace(bundle_path)
+    logging.info(
+        f"bundled the rules of {len(index['rules'])} languages and the parsers of {len(langs)} into {bundle_path}"
+    )
+    return index
+
+
+@lru_cache(maxsize=None)
+def _read_index(bundle_path: Path, mtime: float) -> dict:
+    with zipfile.ZipFile(bundle_path) as zf:
+        return json.loads(zf.read(INDEX))
+
+
+def read_index(bundle_path: Path) -> dict:
+    """the index of a bundle, read once as long as the bundle is unchanged"""
+    bundle_path = Path(bundle_path)
+    return _read_index(bundle_path, bundle_path.stat().st_mtime)
+
+
+def _copy_member(
+    zf: zipfile.ZipFile, name: str, entry: dict, file_path: Path, chunk_size: int
+):
+    """extract member `name` to `file_path`, verified against its index `entry`"""
+    if Path(name).is_absolute() or ".." in Path(name).parts:
+        raise ValueError(f"unsafe member path {name}")
+    sha256 = hashlib.sha256()
+    file_path.parent.mkdir(exist_ok=True, parents=True)
+    with zf.open(name) as rf, open(file_path, "wb") as wf:
+        for chunk in iter(lambda: rf.read(chunk_size), b""):
+            sha256.update(chunk)
+            wf.write(chunk)
+    if sha256.hexdigest() != entry["sha256"]:
+        raise ValueError(f"checksum mismatch for {name}")
+
+
+def install_bundle(
+    bundle_path: Path,
+    dir: Path = Path.home() / "lambre_files",
+    langs=None,
+    chunk_size: int = 1 << 20,
+):
+    """
+    install the rules and parsers of `langs` (all the bundled parsers by default) and resources.json
+    from `bundle_path` into `dir`, only the members of these languages are read (and verified)
+    parsers are extracted to a temporary directory and renamed into place, as downloaded ones are
+    """
+    dir = Path(dir)
+    index = read_index(bundle_path)
+    langs = sorted(index["parsers"]) if langs is None else list(langs)
+    missing = [lg for lg in langs if lg not in index["parsers"]]
+    if missing:
+        raise ValueError(f"no parser for {', '.join(missing)} in {bundle_path}")
+
+    parser_dir = dir / "lambre_stanza_resources"
+    parser_dir.mkdir(exist_ok=True, parents=True)
+    installed = read_installed(dir)
+    with zipfile.ZipFile(bundle_path) as zf:
+        files = list(index["shared"])
+        for lg in langs:
+            files += index["rules"].get(lg, [])
+        for name in files:
+            file_path = dir / name
+            part_path = file_path.with_name(file_path.name + ".part")
+            _copy_member(zf, name, index["files"][name], part_path, chunk_size)
+            part_path.replace(file_path)
+
+        for lg in langs:
+            extract_dir = Path(tempfile.mkdtemp(prefix=".extract-", dir=parser_dir))
+            try:
+                (extract_dir / lg).mkdir()
+                for name in index["parsers"][lg]:
+                    _copy_member(
+                        zf,
+                        name,
+                        index["files"][name],
+                        extract_dir / Path(name).relative_to(parser_dir.name),
+                        chunk_size,
+                    )
+                install_extracted(extract_dir, parser_dir)
+            finally:
+                shutil.rmtree(extract_dir, ignore_errors=True)
+            if lg in index["installed"]:
+                installed[lg] = index["installed"][lg]
+            else:
+                installed.pop(lg, None)
+            logging.info(f"installed parser and rules for {lg} from {bundle_path}")
+    write_installed(dir, installed)
+
+
+class BundlePath:
+    """
+    a path inside a bundle, with the parts of the pathlib.Path interface the rule loaders use
+    (joining with /, is_file and open), files are verified against the index when opened
+    """
+
+    def __init__(self, bundle_path: Path, member: str = ""):
+        self.bundle_path = Path(bundle_path)
+        self.member = member.strip("/")
+
+    def __truediv__(self, other) -> "BundlePath":
+        return BundlePath(self.bundle_path, f"{self.member}/{other}")
+
+    def __str__(self):
+        return f"{self.bundle_path}:{self.member}"
+
+    def __repr__(self):
+        return f"BundlePath({str(self)!r})"
+
+    def is_file(self) -> bool:
+        return self.member in read_index(self.bundle_path)["files"]
+
+    def is_dir(self) -> bool:
+        prefix = f"{self.member}/"
+        return any(
+            name.startswith(prefix) for name in read_index(self.bundle_path)["files"]
+        )
+
+    def open(self, mode: str = "r"):
+        entry = read_index(self.bundle_path)["files"][self.member]
+        with zipfile.ZipFile(self.bundle_path) as zf:
+            data = zf.read(self.member)
+        if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+            raise ValueError(f"checksum mismatch for {self}")
+        if "b" in mode:
+            return io.BytesIO(data)
+        return io.StringIO(data.decode("utf-8"))
+
+
+def rules_root(rules_path):
+    """the rules directory, `rules_path` itself or the rules in a bundle (see BundlePath)"""
+    if isinstance(rules_path, BundlePath):
+        return rules_path
+    rules_path = Path(rules_path)
+    if rules_path.is_file() and zipfile.is_zipfile(rules_path):
+        return BundlePath(rules_path, "rules")
+    return rules_path
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="create and install offline bundles of lambre resources"
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+    create = subparsers.add_parser(
+        "create", help="pack the rules, resources.json and parsers into a bundle"
+    )
+    install = subparsers.add_parser("install", help="install languages from a bundle")
+    for subparser in [create, install]:
+        subparser.add_argument("bundle", type=Path, help="bundle file (.zip)")
+        subparser.add_argument(
+            "--langs",
+            type=str,
+            nargs="+",
+            default=None,
+            help="languages (ISO 639-1 codes) whose parsers are bundled/installed, all by default",
+        )
+        subparser.add_argument(
+            "--dir",
+            type=Path,
+            default=Path.home() / "lambre_files",
+            help="path to lambre related files",
+        )
+
+    return parser.parse_args()
+
+
+def main():
+
+    logging.basicConfig(
+        format="%(message)s",
+        level=logging.INFO,
+        handlers=[logging.StreamHandler()],
+    )
+
+    args = vars(parse_args())
+    command = args.pop("command")
+    try:
+        if command == "create":
+            create_bundle(args["bundle"], args["dir"], args["langs"])
+        else:
+            install_bundle(args["bundle"], args["dir"], args["langs"])
+    except (OSError, ValueError, zipfile.BadZipFile) as e:
+        logging.warning(f"lambre-bundle {command} failed: {e}")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""
+compare the L'AMBRE scores of several aligned system outputs with paired significance tests
+"""
+
+import argparse
+import logging
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pyconll
+
+from lambre import (
+    bundle,
+    rule_utils,
+    score_utils_chaudhary,
+    score_utils_pratapa,
+    stat_utils,
+)
+from lambre.metric import check_lang
+from lambre.parse_utils import get_depd_tree
+
+TESTS = {
+    "bootstrap": ("paired bootstrap", stat_utils.paired_bootstrap),
+    "randomization": (
+        "approximate randomization",
+        stat_utils.approximate_randomization,
+    ),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="compare morphological well-formedness of aligned system outputs"
+    )
+    parser.add_argument("lg", type=str, help="input language ISO 639-1 code")
+    parser.add_argument(
+        "inputs",
+        type=Path,
+        nargs="+",
+        help="system output files (.txt with one sentence per line, or .conllu), aligned by line/sentence",
+    )
+    parser.add_argument(
+        "--rule-set",
+        type=str,
+        choices=["chaudhary-etal-2021", "pratapa-etal-2021"],
+        default="chaudhary-etal-2021",
+        help="rule set name",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default="out",
+        help="specify path to output directory. Stores parser outputs and comparison.",
+    )
+    parser.add_argument(
+        "--test",
+        type=str,
+        choices=list(TESTS),
+        default="bootstrap",
+        help="paired significance test",
+    )
+    parser.add_argument(
+        "--resamples", type=int, default=1000, help="number of resamples/permutations"
+    )
+    parser.add_argument("--seed", type=int, default=None, help="random seed")
+    parser.add_argument(
+        "--rules-path",
+        type=Path,
+        default=Path.home() / "lambre_files" / "rules",
+        help="path to rule sets, or a bundle (see lambre-bundle)",
+    )
+    parser.add_argument(
+        "--stanza-path",
+        type=Path,
+        default=Path.home() / "lambre_files" / "lambre_stanza_resources",
+        help="path to stanza resources",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes for rule evaluation (chaudhary-etal-2021 rule set)",
+    )
+    parser.add_argument("--verbose", action="store_true", help="verbose output")
+
+    return parser.parse_args()
+
+
+def parse_systems(docs: List[List[str]], lg: str, stanza_path: Path, verbose: bool):
+    """
+    parse the sentences (one per line) of all systems in a single pass through one pipeline
+    empty lines are not parsed, returns the parsed sentences of each system and their line indices
+    """
+
+    lines, line_indices = [], []
+    for doc in docs:
+        line_idx = [idx for idx, line in enumerate(doc) if line.strip()]
+        line_indices.append(np.array(line_idx, dtype=np.int64))
+        lines += [doc[idx].strip() for idx in line_idx]
+
+    sentences = []
+    if len(lines) > 0:
+        depd_tree = get_depd_tree(
+            doc="\n\n".join(lines),
+            lg=lg,
+            stanza_model_path=stanza_path,
+            verbose=verbose,
+        )
+        sentences = pyconll.load_from_string(depd_tree)
+    if len(sentences) != len(lines):
+        logging.warning(
+            f"parser returned {len(sentences)} sentences for {len(lines)} input lines"
+        )
+        exit(1)
+
+    systems, start = [], 0
+    for line_idx in line_indices:
+        systems.append((sentences[start : start + len(line_idx)], line_idx))
+        start += len(line_idx)
+    return systems
+
+
+def check_aligned(names: List[str], lengths: List[int]):
+    """exit if the system outputs differ in length, logging the number of sentences of each"""
+    if len(set(lengths)) > 1:
+        logging.warning(
+            "system outputs are not aligned:\n"
+            + "\n".join(
+                f"{name}: {length} sentences" for name, length in zip(names, lengths)
+            )
+        )
+        exit(1)
+
+
+def compare_systems(
+    systems,
+    n_sents: int,
+    lg: str,
+    rule_set: str,
+    rules_path: Path,
+    test: str,
+    n_resamples: int,
+    seed: int,
+    verbose: bool,
+    output: Path,
+    workers: int = 1,
+    names: List[str] = None,
+):
+    """
+    score every system with the same rules and test every pair of systems for a significant difference,
+    `systems` are (parsed sentences, line indices) pairs over `n_sents` aligned lines
+    """
+
+    # rules are read from disk, or from a bundle
+    rules_path = bundle.rules_root(rules_path)
+    rules_file_path = rules_path / rule_set / f"{lg}.txt"
+
+    if not rules_file_path.is_file():
+        logging.warning(f"{lg} is not supported for rule set {rule_set}")
+        exit(1)
+
+    # load rules once and collect per-sentence rule counts of every system
+    if rule_set == "pratapa-etal-2021":
+        scorer = score_utils_pratapa
+        rule_index = scorer.index_rules(
+            *rule_utils.load_pratapa_etal_2021_rules(rules_file_path)
+        )
+        system_counts = [
+            scorer.get_rule_counts(sentences, rule_index, verbose=verbose)
+            for sentences, _ in systems
+        ]
+    elif rule_set == "chaudhary-etal-2021":
+        scorer = score_utils_chaudhary
+        compiled_rules = scorer.compile_rules(
+            rule_utils.load_chaudhury_etal_2021_rules(rules_file_path)
+        )
+        system_counts = [
+            scorer.get_rule_counts(
+                sentences, compiled_rules, verbose=verbose, workers=workers
+            )
+            for sentences, _ in systems
+        ]
+
+    # number the rules seen in any system consistently across systems
+    rule_ids = {}
+    remaps = [
+        np.array(
+            [rule_ids.setdefault(key, len(rule_ids)) for key in counts.keys],
+            dtype=np.int64,
+        )
+        for counts in system_counts
+    ]
+    require_total = scorer.require_total(list(rule_ids))
+    matrices = []
+    for counts, remap, (_, line_idx) in zip(system_counts, remaps, systems):
+        sent_idx, sent_rule_ids, sent_counts = counts.sentence_counts()
+        matrices.append(
+            stat_utils.count_matrix(
+                line_idx[sent_idx],
+                remap[sent_rule_ids],
+                sent_counts,
+                n_sents,
+                require_total,
+            )
+        )
+
+    test_name, test_fn = TESTS[test]
+    logging.info(f"computing {test_name} p-values over {n_resamples} resamples")
+    scores, p_values = test_fn(matrices, require_total, n_resamples, seed)
+
+    if names is None:
+        names = [str(idx) for idx in range(len(systems))]
+    compare_path = output / "compare.txt"
+    logging.info(f"writing scores and p-values to {compare_path}")
+    with open(compare_path, "w") as wf:
+        wf.write("L'AMBRE scores\n")
+        for idx, (name, score) in enumerate(zip(names, scores)):
+            logging.info(f"system {idx} ({name}) lambre_score: {score:.4f}")
+            wf.write(f"system_idx: {idx}\tlambre_score: {score:.4f}\tsystem: {name}\n")
+        wf.write(f"\n{test_name} p-values ({n_resamples} resamples)\n")
+        wf.write("\t".join(["system_idx"] + [str(idx) for idx in range(len(names))]))
+        for idx, row in enumerate(p_values):
+            wf.write(f"\n{idx}\t" + "\t".join([f"{p:.4f}" for p in row]))
+        wf.write("\n")
+
+    return [round(score, 4) for score in scores.tolist()], p_values
+
+
+def compare(
+    lg: str,
+    docs: List[List[str]],
+    rule_set: str = "chaudhary-etal-2021",
+    output: Path = "out",
+    test: str = "bootstrap",
+    n_resamples: int = 1000,
+    seed: int = None,
+    rules_path: Path = Path.home() / "lambre_files" / "rules",
+    stanza_path: Path = Path.home() / "lambre_files" / "lambre_stanza_resources",
+    verbose: bool = False,
+    workers: int = 1,
+):
+    """
+    scores of aligned system outputs `docs` (lists of sentences) and the matrix of pairwise p-values
+    """
+    check_aligned(
+        [f"system {idx}" for idx in range(len(docs))], [len(doc) for doc in docs]
+    )
+    if not check_lang(lg=lg, stanza_path=stanza_path):
+        return
+
+    Path(output).mkdir(exist_ok=True, parents=True)
+    systems = parse_systems(docs, lg=lg, stanza_path=stanza_path, verbose=verbose)
+    return compare_systems(
+        systems,
+        n_sents=len(docs[0]),
+        lg=lg,
+        rule_set=rule_set,
+        rules_path=Path(rules_path),
+        test=test,
+        n_resamples=n_resamples,
+        seed=seed,
+        verbose=verbose,
+        output=Path(output),
+        workers=workers,
+    )
+
+
+def main():
+
+    logging.basicConfig(
+        format="%(message)s",
+        level=logging.INFO,
+        handlers=[logging.StreamHandler()],
+    )
+
+    args = vars(parse_args())
+
+    # .conllu inputs are loaded directly, .txt inputs are parsed together
+    systems, docs, lengths = {}, {}, []
+    for idx, input in enumerate(args["inputs"]):
+        if input.suffix == ".conllu":
+            sentences = pyconll.load_from_file(input)
+            systems[idx] = (sentences, np.arange(len(sentences)))
+            lengths.append(len(sentences))
+        else:
+            with open(input, "r") as rf:
+                docs[idx] = [line.rstrip("\n") for line in rf]
+            lengths.append(len(docs[idx]))
+    check_aligned([str(input) for input in args["inputs"]], lengths)
+
+    if len(docs) > 0:
+        # the parser is only needed (and downloaded if missing) for .txt inputs
+        if not check_lang(lg=args["lg"], stanza_path=args["stanza_path"]):
+            return
+    elif not (
+        bundle.rules_root(args["rules_path"]) / args["rule_set"] / f"{args['lg']}.txt"
+    ).is_file():
+        logging.warning(
+            f"{args['lg']} is not supported for rule set {args['rule_set']}"
+        )
+        exit(1)
+
+    args["output"].mkdir(exist_ok=True, parents=True)
+
+    if len(docs) > 0:
+        parsed = parse_systems(
+            list(docs.values()),
+            lg=args["lg"],
+            stanza_path=args["stanza_path"],
+            verbose=args["verbose"],
+        )
+        for idx, (sentences, line_idx) in zip(docs, parsed):
+            systems[idx] = (sentences, line_idx)
+            parser_out_path = (
+                args["output"] / f"{idx}-{args['inputs'][idx].stem}.conllu"
+            )
+            logging.info(f"storing .conllu file at {parser_out_path}")
+            with open(parser_out_path, "w") as wf:
+                for sentence in sentences:
+                    wf.write(sentence.conll() + "\n\n")
+
+    compare_systems(
+        [systems[idx] for idx in range(len(args["inputs"]))],
+        n_sents=lengths[0],
+        lg=args["lg"],
+        rule_set=args["rule_set"],
+        rules_path=args["rules_path"],
+        test=args["test"],
+        n_resamples=args["resamples"],
+        seed=args["seed"],
+        verbose=args["verbose"],
+        output=args["output"],
+        workers=args["workers"],
+        names=[str(input) for input in args["inputs"]],
+    )
+
+
+if __name__ == "__main__":
+    main()
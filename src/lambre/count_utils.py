@@ -0,0 +1,213 @@
+"""
+rule counts held in integer arrays indexed by rule id
+"""
+
+from array import array
+
+import numpy as np
+
+MISMATCH, MATCH, TOTAL = 0, 1, 2
+
+
+class RuleCounts:
+    """
+    [mismatch, match, total] counts per rule
+
+    rules are identified by (section, group, name) keys and numbered in the order they are first seen.
+    rule evaluations are appended to a flat buffer and periodically reduced into the count array,
+    with `track_sentences` the buffer is also reduced into sparse per-sentence counts
+    """
+
+    def __init__(
+        self, keys=(), track_sentences: bool = False, flush_size: int = 1 << 20
+    ):
+        self.keys = []
+        self.ids = {}
+        self.track_sentences = track_sentences
+        self.flush_size = flush_size
+
+        self._counts = np.zeros((max(len(keys), 64), 3), dtype=np.int64)
+        # one event per rule evaluation: rule_id << 2 | match << 1 | counts_towards_total
+        self._events = array("q")
+        # sentence index and buffer offset of every sentence closed since the last flush
+        self._sent_idx = array("q")
+        self._sent_ends = array("q")
+        # flushed sparse sentence counts, (sent_idx, rule_id, counts) per flush
+        self._sent_tables = []
+
+        for key in keys:
+            self.rule_id(key)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def rule_id(self, key) -> int:
+        rule_id = self.ids.get(key)
+        if rule_id is None:
+            rule_id = self.ids[key] = len(self.keys)
+            self.keys.append(key)
+        return rule_id
+
+    def add(self, rule_id: int, match: bool, total: bool = True):
+        self._events.append(rule_id << 2 | match << 1 | total)
+
+    def end_sentence(self, sent_idx: int):
+        if self.track_sentences:
+            self._sent_idx.append(sent_idx)
+            self._sent_ends.append(len(self._events))
+        if len(self._events) >= self.flush_size:
+            self.flush()
+
+    def _grow(self, n_rules: int):
+        if n_rules > len(self._counts):
+            counts = np.zeros((max(n_rules, 2 * len(self._counts)), 3), dtype=np.int64)
+            counts[: len(self._counts)] = self._counts
+            self._counts = counts
+
+    def flush(self):
+        """reduce buffered rule evaluations into the count arrays"""
+        n_rules = len(self.keys)
+        self._grow(n_rules)
+        codes = np.frombuffer(self._events, dtype=np.int64)
+        if len(codes) > 0:
+            rule_ids = codes >> 2
+            match = (codes >> 1) & 1
+            total = codes & 1
+            event_counts = np.stack([1 - match, match, total], axis=1)
+            for col in (MISMATCH, MATCH, TOTAL):
+                self._counts[:n_rules, col] += np.bincount(
+                    rule_ids, weights=event_counts[:, col], minlength=n_rules
+                ).astype(np.int64)
+
+            if self.track_sentences:
+                ends = np.frombuffer(self._sent_ends, dtype=np.int64)
+                sent_pos = np.repeat(np.arange(len(ends)), np.diff(ends, prepend=0))
+                cells, first, inverse = np.unique(
+                    sent_pos * n_rules + rule_ids,
+                    return_index=True,
+                    return_inverse=True,
+                )
+                cell_counts = np.zeros((len(cells), 3), dtype=np.int64)
+                np.add.at(cell_counts, inverse, event_counts)
+                # rows of a sentence are kept in the order their rules were first evaluated
+                order = np.argsort(first)
+                cells, cell_counts = cells[order], cell_counts[order]
+                sent_idx = np.frombuffer(self._sent_idx, dtype=np.int64)
+                self._sent_tables.append(
+                    (sent_idx[cells // n_rules], cells % n_rules, cell_counts)
+                )
+
+        self._events = array("q")
+        self._sent_idx = array("q")
+        self._sent_ends = array("q")
+
+    @property
+    def counts(self) -> np.ndarray:
+        """(n_rules, 3) document counts"""
+        if len(self._events) > 0 or len(self._counts) < len(self.keys):
+            self.flush()
+        return self._counts[: len(self.keys)]
+
+    def sentence_counts(self):
+        """
+        sparse per-sentence counts as parallel arrays (sent_idx, rule_id, counts),
+        only rules evaluated in a sentence have a row, in the order they were first evaluated
+        """
+        self.flush()
+        if len(self._sent_tables) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros((0, 3), dtype=np.int64)
+        if len(self._sent_tables) > 1:
+            self._sent_tables = [
+                tuple(np.concatenate(cols) for cols in zip(*self._sent_tables))
+            ]
+        return self._sent_tables[0]
+
+    def merge(self, other: "RuleCounts"):
+        """
+        add the counts of `other` into this table, rules new to this table are numbered in the order of `other`,
+        so merging contiguous chunks in order reproduces the rule numbering of a serial run
+        """
+        remap = np.array([self.rule_id(key) for key in other.keys], dtype=np.int64)
+        self._grow(len(self.keys))
+        if len(remap) > 0:
+            self.counts[remap] += other.counts
+        if self.track_sentences:
+            sent_idx, rule_ids, counts = other.sentence_counts()
+            self.flush()
+            self._sent_tables.append((sent_idx, remap[rule_ids], counts))
+
+
+def score_order(keys) -> np.ndarray:
+    """
+    positions of `keys` ordered by section, then by group (in order of first appearance), then by position
+    this is the order in which nested {group: {name: counts}} dicts used to be traversed
+    """
+    group_rank = {}
+    sections = np.array([key[0] for key in keys], dtype=np.int64)
+    groups = np.array(
+        [group_rank.setdefault(key[:2], len(group_rank)) for key in keys],
+        dtype=np.int64,
+    )
+    return np.lexsort((np.arange(len(keys)), groups, sections))
+
+
+def sent_score_order(
+    sent_idx: np.ndarray, sections: np.ndarray, groups: np.ndarray
+) -> np.ndarray:
+    """
+    score_order applied within every sentence of sparse (sentence, rule) rows
+    `groups` are integer group ids, rows of a sentence must be in order of first appearance
+    """
+    n_groups = groups.max() + 1 if len(groups) > 0 else 1
+    _, first, inverse = np.unique(
+        sent_idx * n_groups + groups, return_index=True, return_inverse=True
+    )
+    group_pos = first[inverse]
+    return np.lexsort((np.arange(len(sent_idx)), group_pos, sections, sent_idx))
+
+
+def match_ratios(counts: np.ndarray, require_total: np.ndarray = None):
+    """
+    per-row match / (match + mismatch), rows without any matches or mismatches
+    (or with a zero total, where `require_total` is set) are invalid
+    """
+    mismatch, match, total = counts[:, MISMATCH], counts[:, MATCH], counts[:, TOTAL]
+    valid = mismatch + match > 0
+    if require_total is not None:
+        valid &= ~require_total | (total > 0)
+    ratio = np.zeros(len(counts))
+    np.divide(match, mismatch + match, out=ratio, where=valid)
+    return ratio, valid
+
+
+def mean_score(ratio: np.ndarray, valid: np.ndarray):
+    """uniform average over the valid rules, 1.0 if no rule applies"""
+    scores = ratio[valid]
+    if len(scores) > 0:
+        return np.sum(scores / len(scores))
+    # no errors or correct examples found for the pre-specified rules
+    return 1.0
+
+
+def sent_mean_scores(
+    sent_idx: np.ndarray, ratio: np.ndarray, valid: np.ndarray, n_sents: int
+):
+    """
+    mean_score for every sentence, computed over sparse (sentence, rule) rows, grouped by sentence
+    every sentence is summed as in mean_score (np.sum's pairwise summation), so the scores are identical
+    """
+    sent_idx, ratio = sent_idx[valid], ratio[valid]
+    n_rules = np.bincount(sent_idx, minlength=n_sents)
+    scores = np.ones(n_sents)
+    if len(sent_idx) == 0:
+        return scores
+    shares = ratio / n_rules[sent_idx]
+    starts = np.flatnonzero(np.r_[True, sent_idx[1:] != sent_idx[:-1]])
+    sents = sent_idx[starts]
+    # sentences with the same number of rules are summed together, one row each
+    for n in np.unique(n_rules[sents]):
+        group = n_rules[sents] == n
+        rows = starts[group][:, None] + np.arange(n)
+        scores[sents[group]] = np.sum(shares[rows], axis=1)
+    return scores
@@ -1,145 +1,526 @@
 import argparse
+import hashlib
 import json
 import logging
-import subprocess
+import shutil
+import tarfile
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import List, Union
 
 URL_REMOTE_PATH = (
     "https://cmu.box.com/shared/static/lsww58ezotrpvnpo7foq9efskxz5nq7c.json"
 )
 
+# client errors worth retrying (timeout, too many requests)
+RETRY_STATUS = {408, 429}
+# seconds for which the cached manifest is used without asking the server
+MANIFEST_TTL = 24 * 60 * 60
+# manifest keys of the rule files
+RULE_SETS = {
+    "pratapa-etal-2021": "rules_pratapa_etal_2021",
+    "chaudhary-etal-2021": "rules_chaudhary_etal_2021",
+}
 
-def download_url_file(dir_path: Path):
-    subprocess.run(
-        [
-            "wget",
-            "-q",
-            "--show-progress",
-            URL_REMOTE_PATH,
-            "-O",
-            dir_path / "lambre_urls.json",
+
+def resource_entry(entry):
+    """
+    (url, sha256) of a manifest entry, either the URL itself
+    or a {"url": ..., "sha256": ...} object when the manifest lists checksums
+    """
+    if isinstance(entry, dict):
+        return entry["url"], entry.get("sha256")
+    return entry, None
+
+
+def file_sha256(file_path: Path, chunk_size: int = 1 << 20) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as rf:
+        for chunk in iter(lambda: rf.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _fetch_once(url: str, part_path: Path, timeout: float, chunk_size: int):
+    """
+    download `url` to `part_path`, resuming from its current size with a range request
+    the download starts over if the server does not honor the range
+    """
+    offset = part_path.stat().st_size if part_path.is_file() else 0
+    request = urllib.request.Request(url)
+    if offset > 0:
+        request.add_header("Range", f"bytes={offset}-")
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code == 416 and offset > 0:
+            # the partial file is no prefix of the resource (e.g. it changed), start over
+            part_path.unlink()
+            return _fetch_once(url, part_path, timeout, chunk_size)
+        raise
+    with response:
+        mode = "ab" if offset > 0 and response.getcode() == 206 else "wb"
+        length = response.headers.get("Content-Length")
+        n_bytes = 0
+        with open(part_path, mode) as wf:
+            for chunk in iter(lambda: response.read(chunk_size), b""):
+                wf.write(chunk)
+                n_bytes += len(chunk)
+    # a dropped connection can end the response early, the next attempt resumes from there
+    if length is not None and n_bytes < int(length):
+        raise ConnectionError(f"incomplete download, {n_bytes} of {length} bytes")
+
+
+def _retry(attempt, url: str, retries: int, backoff: float):
+    """
+    call `attempt` until it succeeds, at most `retries` times more, waiting `backoff` seconds,
+    doubled after every failure, client errors (HTTP 4xx but RETRY_STATUS) are raised right away
+    """
+    for n in range(retries + 1):
+        try:
+            return attempt()
+        except (OSError, ValueError) as e:
+            if (
+                isinstance(e, urllib.error.HTTPError)
+                and e.code < 500
+                and e.code not in RETRY_STATUS
+            ):
+                raise
+            if n == retries:
+                raise
+            wait = backoff * 2**n
+            logging.warning(f"downloading {url} failed ({e}), retrying in {wait:g}s")
+            time.sleep(wait)
+
+
+def fetch(
+    url: str,
+    file_path: Path,
+    sha256: str = None,
+    retries: int = 3,
+    backoff: float = 1.0,
+    timeout: float = 60.0,
+    chunk_size: int = 1 << 20,
+) -> Path:
+    """
+    download `url` to `file_path`, through a partial file (.part) that later attempts resume
+    with a `sha256` checksum, the download is verified (and skipped if `file_path` already matches)
+    failed attempts are retried `retries` times, waiting `backoff` seconds, doubled after every attempt
+    raises the last error (OSError, or ValueError on a checksum mismatch) once the retries run out
+    """
+    file_path = Path(file_path)
+    if sha256 is not None and file_path.is_file() and file_sha256(file_path) == sha256:
+        logging.info(f"{file_path} is up to date")
+        return file_path
+    part_path = file_path.with_name(file_path.name + ".part")
+
+    def attempt():
+        _fetch_once(url, part_path, timeout, chunk_size)
+        if sha256 is not None and file_sha256(part_path) != sha256:
+            # a corrupt partial file can not be resumed
+            part_path.unlink()
+            raise ValueError(f"checksum mismatch for {url}")
+        part_path.replace(file_path)
+        logging.info(f"downloaded {file_path} ({file_path.stat().st_size} bytes)")
+        return file_path
+
+    return _retry(attempt, url, retries, backoff)
+
+
+class _HashingReader:
+    """file-like wrapper of a response, hashing and counting the bytes read through it"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+        self.n_bytes = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.sha256.update(data)
+        self.n_bytes += len(data)
+        return data
+
+
+def install_extracted(extract_dir: Path, dir_path: Path):
+    """
+    move the entries extracted to `extract_dir` into `dir_path`, each with a single rename
+    an entry being replaced is first moved aside (into `extract_dir`, removed with it)
+    """
+    for entry in sorted(extract_dir.iterdir()):
+        if entry.name.startswith(".old-"):
+            continue
+        target = dir_path / entry.name
+        if target.exists():
+            target.rename(extract_dir / f".old-{entry.name}")
+        entry.rename(target)
+
+
+def fetch_extract(
+    url: str,
+    dir_path: Path,
+    sha256: str = None,
+    retries: int = 3,
+    backoff: float = 1.0,
+    timeout: float = 60.0,
+    chunk_size: int = 1 << 20,
+) -> Path:
+    """
+    stream the tar archive at `url` into `dir_path`, the archive itself is never written to disk
+    it is extracted to a temporary directory first, whose entries are then renamed into `dir_path`,
+    so an interrupted download never leaves a partial install behind
+    with a `sha256` checksum, the streamed archive is verified before anything is installed
+    failed attempts start over, and are retried as in fetch
+    """
+    dir_path = Path(dir_path)
+    # members are checked for unsafe paths and links where tarfile supports it
+    extract_kwargs = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+
+    def attempt():
+        extract_dir = Path(tempfile.mkdtemp(prefix=".extract-", dir=dir_path))
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                length = response.headers.get("Content-Length")
+                reader = _HashingReader(response)
+                try:
+                    with tarfile.open(fileobj=reader, mode="r|*") as tar:
+                        tar.extractall(extract_dir, **extract_kwargs)
+                    # the padding after the last member is part of the checksum
+                    while reader.read(chunk_size):
+                        pass
+                except (tarfile.TarError, EOFError) as e:
+                    raise ValueError(f"could not extract {url}: {e}")
+            if length is not None and reader.n_bytes < int(length):
+                raise ConnectionError(
+                    f"incomplete download, {reader.n_bytes} of {length} bytes"
+                )
+            if sha256 is not None and reader.sha256.hexdigest() != sha256:
+                raise ValueError(f"checksum mismatch for {url}")
+            install_extracted(extract_dir, dir_path)
+            logging.info(f"extracted {url} to {dir_path} ({reader.n_bytes} bytes)")
+            return dir_path
+        finally:
+            shutil.rmtree(extract_dir, ignore_errors=True)
+
+    return _retry(attempt, url, retries, backoff)
+
+
+def fetch_all(downloads, archives=(), workers: int = 4, **kwargs):
+    """
+    download (url, file path, sha256) triples, and extract (url, directory, sha256) archives
+    concurrently with `workers` threads (see fetch and fetch_extract)
+    all downloads are finished, or given up on, before the first error is raised
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [
+            executor.submit(fetch, url, file_path, sha256, **kwargs)
+            for url, file_path, sha256 in downloads
+        ] + [
+            executor.submit(fetch_extract, url, dir_path, sha256, **kwargs)
+            for url, dir_path, sha256 in archives
         ]
-    )
+    errors = [future.exception() for future in futures if future.exception()]
+    if errors:
+        raise errors[0]
+    return [future.result() for future in futures]
+
+
+def fetch_cached(
+    url: str,
+    file_path: Path,
+    ttl: float = MANIFEST_TTL,
+    sha256: str = None,
+    retries: int = 3,
+    backoff: float = 1.0,
+    timeout: float = 60.0,
+) -> Path:
+    """
+    small files fetched once for many languages (the manifest, resources.json), cached at `file_path`
+    a copy younger than `ttl` seconds is used as is, an older one is revalidated with its ETag
+    (a conditional request, the file is only downloaded again if it changed)
+    if the file can not be fetched, a cached copy is used regardless of its age
+    """
+    file_path = Path(file_path)
+    etag_path = file_path.with_name(file_path.name + ".etag")
+    if file_path.is_file() and time.time() - file_path.stat().st_mtime < ttl:
+        return file_path
+
+    def attempt():
+        request = urllib.request.Request(url)
+        if file_path.is_file() and etag_path.is_file():
+            request.add_header("If-None-Match", etag_path.read_text())
+        try:
+            response = urllib.request.urlopen(request, timeout=timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                # unchanged, valid for another `ttl` seconds
+                file_path.touch()
+                return file_path
+            raise
+        with response:
+            length = response.headers.get("Content-Length")
+            etag = response.headers.get("ETag")
+            data = response.read()
+        if length is not None and len(data) < int(length):
+            raise ConnectionError(f"incomplete download, {len(data)} of {length} bytes")
+        if sha256 is not None and hashlib.sha256(data).hexdigest() != sha256:
+            raise ValueError(f"checksum mismatch for {url}")
+        part_path = file_path.with_name(file_path.name + ".part")
+        part_path.write_bytes(data)
+        part_path.replace(file_path)
+        if etag is not None:
+            etag_path.write_text(etag)
+        elif etag_path.is_file():
+            etag_path.unlink()
+        logging.info(f"downloaded {file_path} ({len(data)} bytes)")
+        return file_path
+
+    try:
+        return _retry(attempt, url, retries, backoff)
+    except (OSError, ValueError) as e:
+        if not file_path.is_file():
+            raise
+        logging.warning(f"could not update {file_path} ({e}), using the cached copy")
+        return file_path
 
 
-def load_resource_paths(dir_path: Path):
-    # download file with to latest URLs
-    download_url_file(dir_path)
+def load_resource_paths(
+    dir_path: Path,
+    url: str = URL_REMOTE_PATH,
+    ttl: float = MANIFEST_TTL,
+    retries: int = 3,
+):
+    # file with the latest URLs, cached for `ttl` seconds
+    fetch_cached(url, dir_path / "lambre_urls.json", ttl, retries=retries)
     with open(dir_path / "lambre_urls.json", "r") as rf:
         return json.load(rf)
 
 
 def parse_args():
     parser = argparse.ArgumentParser(
-        description="download parsers and rules for the input language"
+        description="download parsers and rules for the input languages"
+    )
+    parser.add_argument("lg", type=str, nargs="*", help="language ISO 639-1 codes")
+    parser.add_argument(
+        "--all", action="store_true", help="download all the supported languages"
     )
-    parser.add_argument("lg", type=str, help="language ISO 639-1 code")
     parser.add_argument(
         "--dir",
         type=Path,
         default=Path.home() / "lambre_files",
         help="path to store lambre related files",
     )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="number of concurrent downloads"
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="number of retries of a failed download, with exponential backoff",
+    )
+    parser.add_argument(
+        "--manifest-url",
+        type=str,
+        default=URL_REMOTE_PATH,
+        help="URL of the resource manifest (lambre_urls.json)",
+    )
+    parser.add_argument(
+        "--ttl",
+        type=float,
+        default=MANIFEST_TTL,
+        help="seconds for which the cached manifest and resources.json are used without revalidation",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="download the languages again, even if they are up to date",
+    )
 
     return parser.parse_args()
 
 
-def download_lambre_files(lg: str, dir: Path = Path.home() / "lambre_files"):
-
-    logging.basicConfig(
-        format="%(message)s",
-        level=logging.INFO,
-        handlers=[logging.StreamHandler()],
+def supported_languages(resource_mapping: dict) -> List[str]:
+    return sorted(
+        lg
+        for lg, v in resource_mapping.items()
+        if isinstance(v, dict) and "parser" in v
     )
 
-    dir.mkdir(exist_ok=True, parents=True)
 
-    resource_mapping = load_resource_paths(dir)
+def read_installed(dir: Path) -> dict:
+    """the manifest entries the installed languages were downloaded from (installed.json)"""
+    installed_path = dir / "installed.json"
+    if not installed_path.is_file():
+        return {}
+    with open(installed_path, "r") as rf:
+        return json.load(rf)
 
-    if lg not in resource_mapping:
-        logging.warning(f"Language {lg} is not supported!")
-        logging.warning(
-            "Current supported languages: "
-            + ", ".join(
-                [
-                    f'{v["name"]} ({k})'
-                    for k, v in resource_mapping.items()
-                    if "name" in v
-                ]
-            )
+
+def write_installed(dir: Path, installed: dict):
+    with open(dir / "installed.json", "w") as wf:
+        json.dump(installed, wf, indent=2, sort_keys=True)
+
+
+def is_installed(lg: str, resources: dict, dir: Path, installed: dict) -> bool:
+    """whether `lg` was installed from the same manifest `resources`, and its files are still there"""
+    return (
+        installed.get(lg) == resources
+        and (dir / "lambre_stanza_resources" / lg).is_dir()
+        and all(
+            (dir / "rules" / rule_set / f"{lg}.txt").is_file() for rule_set in RULE_SETS
         )
-        return
+    )
+
 
+def download_language(
+    lg: str,
+    resources: dict,
+    dir: Path,
+    workers: int = 4,
+    retries: int = 3,
+) -> bool:
+    """download the rules and parser of `lg`, as listed in its manifest entry `resources`"""
     rules_dir = dir / "rules"
     parser_dir = dir / "lambre_stanza_resources"
 
     logging.info(f"downloading parser and rules for language: {lg}")
 
+    downloads = []
     """
     download rules
     """
-    # download rules for pratapa-etal-2021
-    local_path = rules_dir / "pratapa-etal-2021"
-    local_path.mkdir(exist_ok=True, parents=True)
-    subprocess.run(
-        [
-            "wget",
-            "-q",
-            "--show-progress",
-            resource_mapping[lg]["rules_pratapa_etal_2021"],
-            "-O",
-            local_path / f"{lg}.txt",
-        ]
-    )
-    # download rules for chaudhary-etal-2021
-    local_path = rules_dir / "chaudhary-etal-2021"
-    local_path.mkdir(exist_ok=True, parents=True)
-    subprocess.run(
-        [
-            "wget",
-            "-q",
-            "--show-progress",
-            resource_mapping[lg]["rules_chaudhary_etal_2021"],
-            "-O",
-            local_path / f"{lg}.txt",
-        ]
-    )
+    for rule_set, key in RULE_SETS.items():
+        local_path = rules_dir / rule_set
+        local_path.mkdir(exist_ok=True, parents=True)
+        url, sha256 = resource_entry(resources[key])
+        downloads.append((url, local_path / f"{lg}.txt", sha256))
 
     """
     download parser
     """
-    # download resources.json
+    # the parser archive is extracted as it is downloaded
     parser_dir.mkdir(exist_ok=True, parents=True)
-    subprocess.run(
-        [
-            "wget",
-            "-q",
-            "--show-progress",
-            resource_mapping["resources.json"],
-            "-O",
-            parser_dir / "resources.json",
-        ]
-    )
+    url, sha256 = resource_entry(resources["parser"])
+    archives = [(url, parser_dir, sha256)]
+
+    try:
+        fetch_all(downloads, archives, workers=workers, retries=retries)
+    except (OSError, ValueError) as e:
+        logging.warning(f"downloading resources for {lg} failed: {e}")
+        return False
+    return True
+
+
+def download_lambre_files(
+    lg: Union[str, List[str]],
+    dir: Path = Path.home() / "lambre_files",
+    workers: int = 4,
+    retries: int = 3,
+    manifest_url: str = URL_REMOTE_PATH,
+    ttl: float = MANIFEST_TTL,
+    force: bool = False,
+) -> bool:
+    """
+    download the rules and parsers for `lg`, one or more languages (or "all"),
+    the languages are downloaded concurrently, `workers` files at a time each
+    the manifest and resources.json are fetched once and cached (see fetch_cached),
+    languages installed from the current manifest are skipped unless `force`
+    partial downloads are resumed, and checked against the manifest's sha256 checksums where given
+    returns whether all the languages were downloaded
+    """
+    dir = Path(dir)
+    dir.mkdir(exist_ok=True, parents=True)
 
-    # download parser and decompress
-    subprocess.run(
-        [
-            "wget",
-            "-q",
-            "--show-progress",
-            resource_mapping[lg]["parser"],
-            "-O",
-            parser_dir / f"{lg}.tar.gz",
+    try:
+        resource_mapping = load_resource_paths(dir, manifest_url, ttl, retries)
+    except (OSError, ValueError) as e:
+        logging.warning(f"could not download the resource manifest: {e}")
+        return False
+
+    langs = [lg] if isinstance(lg, str) else list(lg)
+    if langs == ["all"]:
+        langs = supported_languages(resource_mapping)
+    unsupported = [lg for lg in langs if lg not in resource_mapping]
+    if unsupported:
+        for lg in unsupported:
+            logging.warning(f"Language {lg} is not supported!")
+        logging.warning(
+            "Current supported languages: "
+            + ", ".join(
+                [
+                    f'{v["name"]} ({k})'
+                    for k, v in resource_mapping.items()
+                    if "name" in v
+                ]
+            )
+        )
+        return False
+
+    installed = read_installed(dir)
+    if not force:
+        for lg in langs:
+            if is_installed(lg, resource_mapping[lg], dir, installed):
+                logging.info(f"parser and rules for {lg} are up to date")
+        langs = [
+            lg
+            for lg in langs
+            if not is_installed(lg, resource_mapping[lg], dir, installed)
         ]
-    )
-    subprocess.run(["tar", "-xf", parser_dir / f"{lg}.tar.gz", "-C", parser_dir])
-    subprocess.run(["rm", parser_dir / f"{lg}.tar.gz"])
+    if not langs:
+        return True
+
+    # resources.json is shared by all the parsers
+    parser_dir = dir / "lambre_stanza_resources"
+    parser_dir.mkdir(exist_ok=True, parents=True)
+    url, sha256 = resource_entry(resource_mapping["resources.json"])
+    try:
+        fetch_cached(url, parser_dir / "resources.json", ttl, sha256, retries=retries)
+    except (OSError, ValueError) as e:
+        logging.warning(f"could not download resources.json: {e}")
+        return False
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(langs)))) as executor:
+        done = list(
+            executor.map(
+                lambda lg: download_language(
+                    lg, resource_mapping[lg], dir, workers, retries
+                ),
+                langs,
+            )
+        )
+
+    for lg, ok in zip(langs, done):
+        if ok:
+            installed[lg] = resource_mapping[lg]
+    write_installed(dir, installed)
+
+    failed = [lg for lg, ok in zip(langs, done) if not ok]
+    if failed:
+        logging.warning(f"could not download: {', '.join(failed)}")
+    return not failed
 
 
 def main():
 
-    args = parse_args()
-    download_lambre_files(**vars(args))
+    logging.basicConfig(
+        format="%(message)s",
+        level=logging.INFO,
+        handlers=[logging.StreamHandler()],
+    )
+
+    args = vars(parse_args())
+    if args.pop("all"):
+        args["lg"] = "all"
+    elif not args["lg"]:
+        logging.warning("specify the languages to download, or --all")
+        exit(1)
+    if not download_lambre_files(**args):
+        exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,528 @@
+"""
+compact error records, kept in integer arrays instead of tuples holding pyconll sentences
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import weakref
+from array import array
+
+import numpy as np
+import pyconll
+
+FIELDS = (
+    "sent_idx",
+    "token_num",
+    "head_num",
+    "rule_id",
+    "observed",
+    "expected",
+    "error_num",
+)
+SENT_IDX, TOKEN_NUM, HEAD_NUM, RULE_ID, OBSERVED, EXPECTED, ERROR_NUM = range(
+    len(FIELDS)
+)
+
+
+def sample_keys(sent_idx: np.ndarray, error_num: np.ndarray, seed: int = 0):
+    """
+    pseudo-random sampling keys (splitmix64) of errors, identified by sentence index and position within the sentence,
+    keys do not depend on the order or chunking in which errors were recorded
+    """
+    with np.errstate(over="ignore"):
+        x = sent_idx.astype(np.uint64) << np.uint64(20)
+        x ^= error_num.astype(np.uint64)
+        x += np.uint64(seed + 1) * np.uint64(0x9E3779B97F4A7C15)
+        x ^= x >> np.uint64(30)
+        x *= np.uint64(0xBF58476D1CE4E5B9)
+        x ^= x >> np.uint64(27)
+        x *= np.uint64(0x94D049BB133111EB)
+        x ^= x >> np.uint64(31)
+    return x
+
+
+class ErrorRecords:
+    """
+    one record per violated rule: sentence index, token and head positions within the sentence,
+    the rule (id into `keys`), the observed and expected values (ids into `values`, -1 if missing)
+    and the position of the error within its sentence
+
+    sentences are not referenced, they are re-materialized from the scored data when errors get rendered
+
+    with `max_errors` and/or `errors_per_rule`, only a uniform sample of at most as many errors
+    (overall and per rule) is kept, while `error_counts` still counts every error.
+    the sample is the errors with the smallest sample_keys, so buffers can be compacted as they grow
+    and samples of consecutive chunks merge into the sample of a single pass
+
+    without sampling, `spill_bytes` bounds the in-memory buffer: once it grows larger, records are appended
+    to a temporary file and `records` is a read-only memory map of that file
+    """
+
+    def __init__(
+        self,
+        max_errors: int = None,
+        errors_per_rule: int = None,
+        seed: int = 0,
+        spill_bytes: int = None,
+    ):
+        self.keys = []
+        self.ids = {}
+        self.values = []
+        self.value_ids = {}
+        self.error_counts = []
+        self.max_errors = max_errors
+        self.errors_per_rule = errors_per_rule
+        self.seed = seed
+        self.spill_bytes = spill_bytes
+        self._records = array("q")
+        self._last_sent = -1
+        self._error_num = 0
+        self._spill_path = None
+        self._n_spilled = 0
+
+    def __len__(self):
+        """number of records kept, once sampled"""
+        if self.sampled:
+            self._compact()
+        return self._n_spilled + self._n_buffered()
+
+    def _n_buffered(self) -> int:
+        return len(self._records) // len(FIELDS)
+
+    def __getstate__(self):
+        # spilled records are sent along (e.g. from worker processes), the receiver spills them again
+        state = self.__dict__.copy()
+        if self._n_spilled > 0:
+            state["_records"] = array("q", self.records.tobytes())
+        state.update(_spill_path=None, _n_spilled=0, _finalizer=None)
+        return state
+
+    @property
+    def n_errors(self) -> int:
+        """number of errors recorded, including those left out of the sample"""
+        return sum(self.error_counts)
+
+    @property
+    def sampled(self) -> bool:
+        return self.max_errors is not None or self.errors_per_rule is not None
+
+    def limits(self):
+        return {
+            "max_errors": self.max_errors,
+            "errors_per_rule": self.errors_per_rule,
+            "seed": self.seed,
+        }
+
+    def rule_id(self, key) -> int:
+        rule_id = self.ids.get(key)
+        if rule_id is None:
+            rule_id = self.ids[key] = len(self.keys)
+            self.keys.append(key)
+            self.error_counts.append(0)
+        return rule_id
+
+    def value_id(self, value) -> int:
+        if value is None:
+            return -1
+        value_id = self.value_ids.get(value)
+        if value_id is None:
+            value_id = self.value_ids[value] = len(self.values)
+            self.values.append(value)
+        return value_id
+
+    def value(self, value_id: int):
+        return self.values[value_id] if value_id >= 0 else None
+
+    def add(
+        self,
+        sent_idx: int,
+        token_num: int,
+        head_num: int,
+        rule_id: int,
+        observed=None,
+        expected=None,
+    ):
+        if sent_idx != self._last_sent:
+            self._last_sent, self._error_num = sent_idx, 0
+        self._records.extend(
+            (
+                sent_idx,
+                token_num,
+                head_num,
+                rule_id,
+                self.value_id(observed),
+                self.value_id(expected),
+                self._error_num,
+            )
+        )
+        self._error_num += 1
+        self.error_counts[rule_id] += 1
+        if self.sampled and self._n_buffered() > 2 * self._capacity():
+            self._compact()
+        elif self._over_spill_size():
+            self._spill()
+
+    def _capacity(self) -> int:
+        capacity = []
+        if self.max_errors is not None:
+            capacity.append(self.max_errors)
+        if self.errors_per_rule is not None:
+            capacity.append(self.errors_per_rule * len(self.keys))
+        return max(min(capacity), 1024)
+
+    def _compact(self):
+        """drop the records that can no longer be part of the sample"""
+        records = np.frombuffer(self._records, dtype=np.int64).reshape(-1, len(FIELDS))
+        keys = sample_keys(records[:, SENT_IDX], records[:, ERROR_NUM], self.seed)
+        keep = np.ones(len(records), dtype=bool)
+        if self.errors_per_rule is not None:
+            order = np.lexsort((keys, records[:, RULE_ID]))
+            rule_ids = records[order, RULE_ID]
+            group_start = np.flatnonzero(np.r_[True, rule_ids[1:] != rule_ids[:-1]])
+            ranks = np.arange(len(order)) - np.repeat(
+                group_start, np.diff(np.r_[group_start, len(order)])
+            )
+            keep[order[ranks >= self.errors_per_rule]] = False
+        if self.max_errors is not None and keep.sum() > self.max_errors:
+            kept = np.flatnonzero(keep)
+            keep[kept[np.argsort(keys[kept], kind="stable")[self.max_errors :]]] = False
+        self._records = array("q", records[keep].tobytes())
+
+    def _over_spill_size(self) -> bool:
+        return (
+            not self.sampled
+            and self.spill_bytes is not None
+            and self._records.itemsize * len(self._records) > self.spill_bytes
+        )
+
+    def _spill(self):
+        """move the buffered records to the spill file"""
+        if self._spill_path is None:
+            fd, self._spill_path = tempfile.mkstemp(
+                prefix="lambre-errors-", suffix=".bin"
+            )
+            os.close(fd)
+            self._finalizer = weakref.finalize(self, os.remove, self._spill_path)
+        with open(self._spill_path, "ab") as wf:
+            self._records.tofile(wf)
+        self._n_spilled += len(self._records) // len(FIELDS)
+        self._records = array("q")
+
+    @property
+    def records(self) -> np.ndarray:
+        """(n_errors, len(FIELDS)) records ordered by sentence and position within the sentence"""
+        if self.sampled:
+            self._compact()
+            records = np.frombuffer(self._records, dtype=np.int64).reshape(
+                -1, len(FIELDS)
+            )
+            return records[np.lexsort((records[:, ERROR_NUM], records[:, SENT_IDX]))]
+        if self._n_spilled > 0:
+            self._spill()
+            return np.memmap(
+                self._spill_path,
+                dtype=np.int64,
+                mode="r",
+                shape=(self._n_spilled, len(FIELDS)),
+            )
+        return np.frombuffer(self._records, dtype=np.int64).reshape(-1, len(FIELDS))
+
+    def merge(self, other: "ErrorRecords"):
+        """append the records of `other` (a later chunk of sentences), remapping its rule and value ids"""
+        rule_remap = np.array([self.rule_id(key) for key in other.keys], dtype=np.int64)
+        for rule_id, count in zip(rule_remap.tolist(), other.error_counts):
+            self.error_counts[rule_id] += count
+        if len(other) == 0:
+            return
+        # -1 (missing value) maps to itself through the last entry
+        value_remap = np.array(
+            [self.value_id(value) for value in other.values] + [-1], dtype=np.int64
+        )
+        records = other.records.copy()
+        records[:, RULE_ID] = rule_remap[records[:, RULE_ID]]
+        records[:, OBSERVED] = value_remap[records[:, OBSERVED]]
+        records[:, EXPECTED] = value_remap[records[:, EXPECTED]]
+        self._records.frombytes(records.tobytes())
+        if self.sampled and self._n_buffered() > 2 * self._capacity():
+            self._compact()
+        elif self._over_spill_size():
+            self._spill()
+
+    def groups(self, fields=(SENT_IDX, TOKEN_NUM)):
+        """
+        (start, end) bounds of consecutive records (see `records`) sharing the values of `fields`,
+        e.g. all rules violated by one token
+        """
+        records = self.records
+        if len(records) == 0:
+            return []
+        keys = records[:, list(fields)]
+        starts = np.flatnonzero(np.any(keys[1:] != keys[:-1], axis=1)) + 1
+        bounds = np.concatenate([[0], starts, [len(records)]]).tolist()
+        return list(zip(bounds[:-1], bounds[1:]))
+
+
+def write_error_counts(file_path, errors: ErrorRecords, rule_name):
+    """exact number of errors per rule (most frequent first), `rule_name` formats error rule keys"""
+    order = np.argsort(-np.array(errors.error_counts, dtype=np.int64), kind="stable")
+    with open(file_path, "w") as wf:
+        for rule_id in order.tolist():
+            wf.write(
+                f"{errors.error_counts[rule_id]}\t{rule_name(errors.keys[rule_id])}\n"
+            )
+
+
+def _json_value(value):
+    """observed/expected values in the error store, feature value sets are joined by commas"""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (set, frozenset, list, tuple)):
+        return ",".join(sorted(str(v) for v in value))
+    return str(value)
+
+
+def _feats_str(feats) -> str:
+    """FEATS column of a pyconll feature dict (token.conll() is much slower)"""
+    if not feats:
+        return "_"
+    return "|".join(
+        f"{feat}={','.join(sorted(feats[feat]))}"
+        for feat in sorted(feats, key=str.lower)
+    )
+
+
+def write_error_store(
+    file_path, data, errors: ErrorRecords, rule_name, block_size=4096
+):
+    """
+    compact JSON store of the errors, read by the static error viewer (html_templates/viewer.html)
+    every erroneous sentence is stored once, as [id, form, lemma, upos, feats, head, deprel] tokens,
+    and errors are [sentence, token, head, rule, observed, expected] lists of indices into
+    `sents` (the stored sentences), the sentence's tokens, `rules` and `values`
+    `rule_name` formats error rule keys (tab-separated, the rule type first)
+    records are written in blocks, the store is never held in memory as a whole
+    """
+    records = errors.records
+    sent_ids = np.unique(records[:, SENT_IDX]) if len(records) > 0 else np.array([])
+    with open(file_path, "w") as wf:
+        wf.write('{"rules":')
+        json.dump(
+            [
+                [rule_name(key), count]
+                for key, count in zip(errors.keys, errors.error_counts)
+            ],
+            wf,
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        wf.write(',"values":')
+        json.dump(
+            [_json_value(value) for value in errors.values],
+            wf,
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        wf.write(',"sents":[')
+        for idx, sent_idx in enumerate(sent_ids.tolist()):
+            tokens = [
+                [
+                    token.id,
+                    token.form,
+                    token.lemma,
+                    token.upos,
+                    _feats_str(token.feats),
+                    token.head,
+                    token.deprel,
+                ]
+                for token in data[sent_idx]
+            ]
+            if idx > 0:
+                wf.write(",")
+            wf.write(json.dumps(tokens, ensure_ascii=False, separators=(",", ":")))
+        wf.write('],"errors":[')
+        for start in range(0, len(records), block_size):
+            block = np.array(records[start : start + block_size])
+            block[:, SENT_IDX] = np.searchsorted(sent_ids, block[:, SENT_IDX])
+            rows = block[
+                :, [SENT_IDX, TOKEN_NUM, HEAD_NUM, RULE_ID, OBSERVED, EXPECTED]
+            ]
+            if start > 0:
+                wf.write(",")
+            wf.write(json.dumps(rows.tolist(), separators=(",", ":"))[1:-1])
+        wf.write("]}\n")
+
+
+ERROR_DB_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE rules (rule_id INTEGER PRIMARY KEY, key TEXT, name TEXT, n_errors INTEGER);
+CREATE TABLE rule_values (value_id INTEGER PRIMARY KEY, value TEXT);
+CREATE TABLE sentences (sent_idx INTEGER PRIMARY KEY, score REAL, conll TEXT);
+CREATE TABLE errors (
+    sent_idx INTEGER, token_num INTEGER, head_num INTEGER, rule_id INTEGER,
+    observed INTEGER, expected INTEGER, error_num INTEGER
+);
+"""
+ERROR_DB_INDEXES = """
+CREATE INDEX errors_rule ON errors (rule_id);
+CREATE INDEX errors_sent ON errors (sent_idx, error_num);
+CREATE INDEX sentences_score ON sentences (score);
+"""
+
+
+def _tuples(value):
+    """rule keys are nested tuples, stored as JSON lists"""
+    if isinstance(value, list):
+        return tuple(_tuples(v) for v in value)
+    return value
+
+
+def write_error_db(
+    file_path,
+    data,
+    errors: ErrorRecords,
+    rule_name,
+    meta: dict = None,
+    sent_scores=None,
+    block_size=4096,
+):
+    """
+    SQLite store of the errors, from which the visualizations can be rendered later (see render.py)
+    every erroneous sentence is stored once as CoNLL-U, with its sentence-level score (`sent_scores`) if known,
+    and errors are the records of `errors` (see FIELDS), indexed by rule and by sentence
+    `meta` (e.g. language and rule set) is stored as JSON values, `rule_name` formats error rule keys
+    records are written in blocks, an existing store is replaced
+    """
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    records = errors.records
+    sent_ids = np.unique(records[:, SENT_IDX]) if len(records) > 0 else np.array([])
+    con = sqlite3.connect(file_path)
+    try:
+        with con:
+            con.executescript(ERROR_DB_SCHEMA)
+            con.executemany(
+                "INSERT INTO meta VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in (meta or {}).items()],
+            )
+            con.executemany(
+                "INSERT INTO rules VALUES (?, ?, ?, ?)",
+                [
+                    (rule_id, json.dumps(key), rule_name(key), count)
+                    for rule_id, (key, count) in enumerate(
+                        zip(errors.keys, errors.error_counts)
+                    )
+                ],
+            )
+            con.executemany(
+                "INSERT INTO rule_values VALUES (?, ?)",
+                [
+                    (value_id, _json_value(value))
+                    for value_id, value in enumerate(errors.values)
+                ],
+            )
+            sent_ids = sent_ids.tolist()
+            for start in range(0, len(sent_ids), block_size):
+                con.executemany(
+                    "INSERT INTO sentences VALUES (?, ?, ?)",
+                    [
+                        (
+                            sent_idx,
+                            None if sent_scores is None else sent_scores[sent_idx],
+                            data[sent_idx].conll(),
+                        )
+                        for sent_idx in sent_ids[start : start + block_size]
+                    ],
+                )
+            for start in range(0, len(records), block_size):
+                con.executemany(
+                    "INSERT INTO errors VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    records[start : start + block_size].tolist(),
+                )
+            # indexes are built once all the rows are in
+            con.executescript(ERROR_DB_INDEXES)
+    finally:
+        con.close()
+
+
+def read_error_db_meta(file_path) -> dict:
+    """the meta data of an error store (see write_error_db)"""
+    con = sqlite3.connect(f"file:{file_path}?mode=ro", uri=True)
+    try:
+        return {
+            key: json.loads(value) for key, value in con.execute("SELECT * FROM meta")
+        }
+    finally:
+        con.close()
+
+
+def read_error_db(file_path, rule_filter=None, min_score=None, max_score=None):
+    """
+    the erroneous sentences (a dict by sentence index) and error records of an error store (see write_error_db),
+    only the errors of the rules whose name passes `rule_filter` and of sentences scored within [`min_score`, `max_score`]
+    rule ids and error counts are those of the store, so the records can be rendered as after scoring
+    """
+    con = sqlite3.connect(f"file:{file_path}?mode=ro", uri=True)
+    try:
+        errors = ErrorRecords()
+        rule_ids = []
+        for rule_id, key, name, count in con.execute(
+            "SELECT rule_id, key, name, n_errors FROM rules ORDER BY rule_id"
+        ):
+            errors.error_counts[errors.rule_id(_tuples(json.loads(key)))] = count
+            if rule_filter is None or rule_filter(name):
+                rule_ids.append(rule_id)
+        # values are only kept for reference, several may have been stored as the same string
+        errors.values = [
+            value
+            for (value,) in con.execute(
+                "SELECT value FROM rule_values ORDER BY value_id"
+            )
+        ]
+
+        conditions, params = [], []
+        if rule_filter is not None:
+            # there can be more rules than sqlite allows query parameters
+            con.execute(
+                "CREATE TEMP TABLE selected_rules (rule_id INTEGER PRIMARY KEY)"
+            )
+            con.executemany(
+                "INSERT INTO selected_rules VALUES (?)",
+                [(rule_id,) for rule_id in rule_ids],
+            )
+            conditions.append("rule_id IN (SELECT rule_id FROM selected_rules)")
+        if min_score is not None or max_score is not None:
+            score_conditions = ["score IS NOT NULL"]
+            if min_score is not None:
+                score_conditions.append("score >= ?")
+                params.append(min_score)
+            if max_score is not None:
+                score_conditions.append("score <= ?")
+                params.append(max_score)
+            conditions.append(
+                f"sent_idx IN (SELECT sent_idx FROM sentences WHERE {' AND '.join(score_conditions)})"
+            )
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = con.execute(
+            f"SELECT {', '.join(FIELDS)} FROM errors {where} ORDER BY sent_idx, error_num",
+            params,
+        ).fetchall()
+        records = np.array(rows, dtype=np.int64).reshape(-1, len(FIELDS))
+        errors._records = array("q", records.tobytes())
+
+        sent_ids = np.unique(records[:, SENT_IDX]).tolist()
+        sentences = {}
+        for start in range(0, len(sent_ids), 512):
+            block = sent_ids[start : start + 512]
+            sent_rows = con.execute(
+                f"SELECT sent_idx, conll FROM sentences WHERE sent_idx IN ({', '.join('?' * len(block))}) ORDER BY sent_idx",
+                block,
+            ).fetchall()
+            parsed = pyconll.load_from_string(
+                "\n\n".join(conll for _, conll in sent_rows) + "\n"
+            )
+            sentences.update(zip([sent_idx for sent_idx, _ in sent_rows], parsed))
+    finally:
+        con.close()
+    return sentences, errors
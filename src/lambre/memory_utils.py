@@ -0,0 +1,78 @@
+"""
+process memory measurements and a soft memory budget
+"""
+
+import logging
+import os
+import sys
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+MB = 1 << 20
+
+
+def peak_rss():
+    """peak resident set size of the process in bytes, None if unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def current_rss():
+    """resident set size of the process in bytes, falls back to the peak outside Linux"""
+    try:
+        with open("/proc/self/statm", "r") as rf:
+            return int(rf.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return peak_rss()
+
+
+class MemoryBudget:
+    """
+    soft limit on the resident memory of a run, in MB
+    the parser is run over chunks of blocks (sentences or paragraphs) whose size adapts to the memory in use,
+    and error records beyond a fraction of the budget are spilled to disk (see error_utils.ErrorRecords)
+    the budget is not enforced, going over it is logged
+    """
+
+    def __init__(
+        self,
+        budget_mb: int,
+        chunk_size: int = 256,
+        min_chunk_size: int = 8,
+        max_chunk_size: int = 8192,
+    ):
+        self.budget = budget_mb * MB
+        self.chunk_size = chunk_size
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.exceeded = False
+
+    @property
+    def spill_bytes(self) -> int:
+        """size of the in-memory error record buffer above which records are spilled to disk"""
+        return max(MB, min(64 * MB, self.budget // 16))
+
+    def next_chunk_size(self) -> int:
+        """
+        halves the chunk size when the resident memory gets close to the budget,
+        doubles it when well below
+        """
+        rss = current_rss()
+        if rss is None:
+            return self.chunk_size
+        if rss > self.budget and not self.exceeded:
+            self.exceeded = True
+            logging.warning(
+                f"memory in use ({rss / MB:.0f} MB) is over the budget of {self.budget / MB:.0f} MB"
+            )
+        if rss > 0.8 * self.budget:
+            self.chunk_size = max(self.min_chunk_size, self.chunk_size // 2)
+        elif rss < 0.5 * self.budget:
+            self.chunk_size = min(self.max_chunk_size, self.chunk_size * 2)
+        return self.chunk_size
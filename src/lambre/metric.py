@@ -1,28 +1,44 @@
 import argparse
 import logging
-import subprocess
+import multiprocessing as mp
 from pathlib import Path
-from typing import List
+from typing import Callable, List
 
 import pyconll
+from pyconll.unit.conll import Conll
 
 from lambre import (
     RELATION_MAP,
     RULE_LINKS,
+    bundle,
+    error_utils,
+    memory_utils,
+    profile_utils,
     rule_utils,
     score_utils_chaudhary,
     score_utils_pratapa,
+    timing_utils,
     visualize,
 )
-from lambre.parse_utils import get_depd_tree
+from lambre.download import download_lambre_files
+from lambre.parse_utils import get_depd_tree, get_depd_trees, load_pipeline
 
 
 def parse_args():
     parser = argparse.ArgumentParser(
         description="compute morphological well-formedness"
     )
-    parser.add_argument("lg", type=str, help="input language ISO 639-1 code")
-    parser.add_argument("input", type=Path, help="input file (.txt or .conllu)")
+    parser.add_argument("lg", type=str, nargs="?", help="input language ISO 639-1 code")
+    parser.add_argument(
+        "input", type=Path, nargs="?", help="input file (.txt or .conllu)"
+    )
+    parser.add_argument(
+        "--batch",
+        type=Path,
+        default=None,
+        metavar="JOBS",
+        help="score the jobs of a tab-separated file (language, input file, output directory and optionally the rule set per line) in one process, instead of lg and input",
+    )
     parser.add_argument(
         "--rule-set",
         type=str,
@@ -39,6 +55,11 @@ def parse_args():
     parser.add_argument(
         "--score-sent", action="store_true", help="return sentence level scores"
     )
+    parser.add_argument(
+        "--score-doc",
+        action="store_true",
+        help="return document level score (default unless --score-sent), use with --score-sent to get both from a single pass",
+    )
     parser.add_argument(
         "--ssplit",
         action="store_true",
@@ -49,7 +70,7 @@ def parse_args():
         "--rules-path",
         type=Path,
         default=Path.home() / "lambre_files" / "rules",
-        help="path to rule sets",
+        help="path to rule sets, or a bundle (see lambre-bundle)",
     )
     parser.add_argument(
         "--stanza-path",
@@ -57,19 +78,107 @@ def parse_args():
         default=Path.home() / "lambre_files" / "lambre_stanza_resources",
         help="path to stanza resources",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes for rule evaluation (chaudhary-etal-2021 rule set) and rendering errors.txt",
+    )
+    parser.add_argument(
+        "--bootstrap",
+        type=int,
+        default=0,
+        metavar="N",
+        help="report mean, std and 95%% interval of the document level score over N bootstrap resamples of the sentences",
+    )
+    parser.add_argument(
+        "--bootstrap-seed", type=int, default=None, help="random seed for --bootstrap"
+    )
+    parser.add_argument(
+        "--max-errors",
+        type=int,
+        default=None,
+        metavar="K",
+        help="visualize a uniform sample of at most K errors",
+    )
+    parser.add_argument(
+        "--errors-per-rule",
+        type=int,
+        default=None,
+        metavar="K",
+        help="visualize a uniform sample of at most K errors per rule",
+    )
+    parser.add_argument(
+        "--html-page-size",
+        type=int,
+        default=500,
+        metavar="N",
+        help="split the html visualizations into pages of N examples with an index page, 0 for a single file",
+    )
+    parser.add_argument(
+        "--ascii-max-words",
+        type=int,
+        default=100,
+        metavar="N",
+        help="render sentences longer than N words in errors.txt on a window around the erroneous tokens, 0 to render them in full",
+    )
+    parser.add_argument(
+        "--error-report",
+        type=str,
+        choices=["html", "json", "db"],
+        default="html",
+        help="html visualizations, a compact errors.json store with a static viewer (errors_viewer.html), or an errors.db store to render later with lambre-render",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="report wall/cpu time and throughput per stage, also stored in timings.json in the output directory",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="cProfile the run, stores profile.prof and a summary of the top functions (profile.txt) in the output directory",
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=30,
+        metavar="N",
+        help="number of functions in the --profile summary",
+    )
+    parser.add_argument(
+        "--profile-rules",
+        action="store_true",
+        help="store per-rule evaluation counts, hits and cumulative match time in rule_profile.tsv in the output directory",
+    )
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="report peak memory per stage (tracemalloc and RSS, slows down the run), also stored in timings.json",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        default=None,
+        metavar="MB",
+        help="stay under MB megabytes: parse in chunks sized to the memory in use and spill error records to disk",
+    )
     parser.add_argument("--verbose", action="store_true", help="verbose output")
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.batch is None and (args.lg is None or args.input is None):
+        parser.error("lg and input are required, unless --batch is given")
+    if args.batch is not None and args.lg is not None:
+        parser.error("lg and input are given in the --batch jobs file")
+    return args
 
 
 def check_lang(lg: str, stanza_path: Path) -> bool:
     """Check language support"""
     lang_parser_path = stanza_path / lg
     if not lang_parser_path.is_dir():
-        # try download
-        try:
-            subprocess.run(["lambre-download", lg], check=True)
-        except:
+        # try download (in-process, see download.download_lambre_files)
+        if not download_lambre_files(lg):
             logging.warning(f"skipping scorer")
             return False
     return True
@@ -83,7 +192,28 @@ def parse_doc(
     ssplit: bool,
     verbose: bool,
     file_name: str = None,
+    timer: timing_utils.StageTimer = None,
+    memory_budget: memory_utils.MemoryBudget = None,
+    pipeline=None,
 ):
+    """
+    parse `doc` with a `pipeline` (see parse_utils.load_pipeline), or one loaded for `lg`,
+    with a `file_name`, the parse is stored in {file_name}.conllu in the output directory
+    """
+
+    if memory_budget is not None:
+        return parse_doc_chunks(
+            doc,
+            lg,
+            stanza_path,
+            output,
+            ssplit,
+            verbose,
+            file_name,
+            timer,
+            memory_budget,
+            pipeline,
+        )
 
     depd_tree = get_depd_tree(
         doc=doc,
@@ -91,8 +221,11 @@ def parse_doc(
         stanza_model_path=stanza_path,
         ssplit=ssplit,
         verbose=verbose,
+        timer=timer,
+        pipeline=pipeline,
     )
-    sentences = pyconll.load_from_string(depd_tree)
+    with timing_utils.stage(timer, "parse: load conllu"):
+        sentences = pyconll.load_from_string(depd_tree)
     if file_name:
         parser_out_path = output / f"{file_name}.conllu"
         logging.info(f"storing .conllu file at {parser_out_path}")
@@ -102,6 +235,64 @@ def parse_doc(
     return sentences
 
 
+def parse_doc_chunks(
+    doc: str,
+    lg: str,
+    stanza_path: Path,
+    output: Path,
+    ssplit: bool,
+    verbose: bool,
+    file_name: str = None,
+    timer: timing_utils.StageTimer = None,
+    memory_budget: memory_utils.MemoryBudget = None,
+    pipeline=None,
+):
+    """
+    parse the blank-line separated blocks of `doc` (sentences, or paragraphs with `ssplit`) in chunks
+    sized to the memory budget, only the parsed sentences of the whole document are kept in memory
+    """
+
+    blocks = [block for block in doc.split("\n\n") if block.strip()]
+    parser_out_path = None
+    if file_name:
+        parser_out_path = output / f"{file_name}.conllu"
+        logging.info(f"storing .conllu file at {parser_out_path}")
+        open(parser_out_path, "w").close()
+
+    sentences = Conll([])
+    for depd_tree in get_depd_trees(
+        blocks,
+        lg=lg,
+        stanza_model_path=stanza_path,
+        memory_budget=memory_budget,
+        ssplit=ssplit,
+        verbose=verbose,
+        timer=timer,
+        pipeline=pipeline,
+    ):
+        with timing_utils.stage(timer, "parse: load conllu"):
+            sentences.extend(pyconll.load_from_string(depd_tree))
+        if parser_out_path is not None:
+            with open(parser_out_path, "a") as wf:
+                wf.write(depd_tree)
+
+    return sentences
+
+
+def scorer_module(rule_set: str):
+    """the scoring module (score_utils_pratapa or score_utils_chaudhary) of `rule_set`"""
+    if rule_set == "pratapa-etal-2021":
+        return score_utils_pratapa
+    return score_utils_chaudhary
+
+
+def load_rules(rules_file_path: Path, rule_set: str):
+    """rules of a language, as expected by the scorer of `rule_set`"""
+    if rule_set == "pratapa-etal-2021":
+        return rule_utils.load_pratapa_etal_2021_rules(rules_file_path)
+    return rule_utils.load_chaudhury_etal_2021_rules(rules_file_path)
+
+
 def compute_metric(
     sentences,
     lg: str,
@@ -111,81 +302,212 @@ def compute_metric(
     report: bool,
     verbose: bool,
     output: Path,
+    workers: int = 1,
+    score_doc: bool = False,
+    bootstrap: int = 0,
+    bootstrap_seed: int = None,
+    max_errors: int = None,
+    errors_per_rule: int = None,
+    timer: timing_utils.StageTimer = None,
+    profile_rules: bool = False,
+    memory_budget: memory_utils.MemoryBudget = None,
+    html_page_size: int = 500,
+    error_report: str = "html",
+    ascii_max_words: int = 100,
+    rules=None,
 ):
 
     """
     Scorer expects CoNLL-U file with morphological feature values and (SUD) dependency parse
+    with a `timer`, every stage of the scoring and visualization is timed (see timing_utils.StageTimer)
+    with `profile_rules`, per-rule evaluation statistics are stored in rule_profile.tsv
+    with a `memory_budget`, error records are spilled to disk beyond a fraction of the budget
+    html visualizations are split into pages of `html_page_size` examples (see visualize.HTMLReport)
+    with `error_report` json, errors are stored in errors.json instead, along with a static viewer
+    with `error_report` db, errors are only stored in errors.db, to be visualized with render.py
+    errors.txt is rendered across `workers` processes, sentences longer than `ascii_max_words` on a window
+    around the erroneous tokens (see visualize.write_ascii_visualizations)
+    `rules` are the rules of `lg` already loaded (see load_rules), they are loaded from `rules_path` otherwise
     """
 
     """
     Load rule sets and score
     """
 
+    # rules are read from disk, or from a bundle
+    rules_path = bundle.rules_root(rules_path)
     rules_file_path = rules_path / rule_set / f"{lg}.txt"
 
-    if not rules_file_path.is_file():
+    if rules is None and not rules_file_path.is_file():
         logging.warning(f"{lg} is not supported for rule set {rule_set}")
         exit(1)
 
-    # error tuples for visualization
-    error_tuples = []
+    if timer is not None:
+        timer.set_corpus_size(sentences)
+
+    # document-level score unless only sentence-level scores are requested
+    score_doc = score_doc or not score_sent or bootstrap > 0
+
+    # compact error records for visualization
+    errors = None
+    rule_stats = profile_utils.RuleStats() if profile_rules else None
+    spill_bytes = memory_budget.spill_bytes if memory_budget is not None else None
 
     if rule_set == "pratapa-etal-2021":
-        lang_agr, lang_argstruct = rule_utils.load_pratapa_etal_2021_rules(
-            rules_file_path
-        )
-        if score_sent:
-            sent_scores, error_tuples = score_utils_pratapa.get_sent_score(
-                sentences, lang_agr, lang_argstruct, verbose=verbose
+        with timing_utils.stage(timer, "load rules", throughput=False):
+            lang_agr, lang_argstruct = (
+                rules if rules is not None else load_rules(rules_file_path, rule_set)
+            )
+        if score_sent and score_doc:
+            (
+                doc_score,
+                sent_scores,
+                errors,
+            ) = score_utils_pratapa.get_doc_and_sent_score(
+                sentences,
+                lang_agr,
+                lang_argstruct,
+                verbose=verbose,
+                report=report,
+                max_errors=max_errors,
+                errors_per_rule=errors_per_rule,
+                spill_bytes=spill_bytes,
+                timer=timer,
+                rule_stats=rule_stats,
+                bootstrap=bootstrap,
+                seed=bootstrap_seed,
+            )
+        elif score_sent:
+            sent_scores, errors = score_utils_pratapa.get_sent_score(
+                sentences,
+                lang_agr,
+                lang_argstruct,
+                verbose=verbose,
+                report=report,
+                max_errors=max_errors,
+                errors_per_rule=errors_per_rule,
+                spill_bytes=spill_bytes,
+                timer=timer,
+                rule_stats=rule_stats,
             )
         else:
-            doc_score, error_tuples = score_utils_pratapa.get_doc_score(
-                sentences, lang_agr, lang_argstruct, verbose=verbose
+            doc_score, errors = score_utils_pratapa.get_doc_score(
+                sentences,
+                lang_agr,
+                lang_argstruct,
+                verbose=verbose,
+                report=report,
+                max_errors=max_errors,
+                errors_per_rule=errors_per_rule,
+                spill_bytes=spill_bytes,
+                timer=timer,
+                rule_stats=rule_stats,
+                bootstrap=bootstrap,
+                seed=bootstrap_seed,
             )
 
     elif rule_set == "chaudhary-etal-2021":
-        lang_rules = rule_utils.load_chaudhury_etal_2021_rules(rules_file_path)
-        if score_sent:
-            sent_scores, error_tuples = score_utils_chaudhary.get_sent_score(
-                sentences, lang_rules, verbose=verbose
+        with timing_utils.stage(timer, "load rules", throughput=False):
+            lang_rules = (
+                rules if rules is not None else load_rules(rules_file_path, rule_set)
+            )
+        if score_sent and score_doc:
+            (
+                doc_score,
+                sent_scores,
+                errors,
+            ) = score_utils_chaudhary.get_doc_and_sent_score(
+                sentences,
+                lang_rules,
+                verbose=verbose,
+                workers=workers,
+                report=report,
+                max_errors=max_errors,
+                errors_per_rule=errors_per_rule,
+                spill_bytes=spill_bytes,
+                timer=timer,
+                rule_stats=rule_stats,
+                bootstrap=bootstrap,
+                seed=bootstrap_seed,
+            )
+        elif score_sent:
+            sent_scores, errors = score_utils_chaudhary.get_sent_score(
+                sentences,
+                lang_rules,
+                verbose=verbose,
+                workers=workers,
+                report=report,
+                max_errors=max_errors,
+                errors_per_rule=errors_per_rule,
+                spill_bytes=spill_bytes,
+                timer=timer,
+                rule_stats=rule_stats,
             )
         else:
-            doc_score, error_tuples = score_utils_chaudhary.get_doc_score(
-                sentences, lang_rules, verbose=verbose
+            doc_score, errors = score_utils_chaudhary.get_doc_score(
+                sentences,
+                lang_rules,
+                verbose=verbose,
+                workers=workers,
+                report=report,
+                max_errors=max_errors,
+                errors_per_rule=errors_per_rule,
+                spill_bytes=spill_bytes,
+                timer=timer,
+                rule_stats=rule_stats,
+                bootstrap=bootstrap,
+                seed=bootstrap_seed,
             )
 
-    scores_path = output / "score.txt"
-    f = open(scores_path, "w")
+    if profile_rules:
+        scorer = scorer_module(rule_set)
+        rule_profile_path = output / "rule_profile.tsv"
+        logging.info(f"writing per-rule evaluation statistics to {rule_profile_path}")
+        rule_stats.write(rule_profile_path, scorer.error_rule_name)
 
-    # write L'AMBRE scores
-    f.write("L'AMBRE scores\n")
-    if score_sent:
-        logging.info(f"writing sentence-level L'AMBRE scores to {scores_path}")
-        for idx, _item in enumerate(sent_scores):
-            f.write(
-                f"sent_idx: {idx}\tlambre_score: {_item['joint_score']:.4f}\tsent: {_item['sent']}\n"
-            )
-    else:
-        logging.info(f"lambre_score: {doc_score['joint_score']:.4f}")
-        f.write(f"lambre_score: {doc_score['joint_score']:.4f}\n")
+    with timing_utils.stage(timer, "write scores"):
+        scores_path = output / "score.txt"
+        f = open(scores_path, "w")
 
-    # write L'AMBRE scores per rule
-    if report:
-        logging.info(f"writing sentence-level report to {scores_path}")
-        f.write("\nL'AMBRE score per rule\n")
+        # write L'AMBRE scores
+        f.write("L'AMBRE scores\n")
+        if score_doc:
+            logging.info(f"lambre_score: {doc_score['joint_score']:.4f}")
+            f.write(f"lambre_score: {doc_score['joint_score']:.4f}\n")
+        if bootstrap > 0:
+            stats = doc_score["bootstrap"]
+            bootstrap_str = (
+                f"mean: {stats['mean']:.4f}\tstd: {stats['std']:.4f}\t"
+                f"{stats['confidence']:.0%} interval: [{stats['ci_lower']:.4f}, {stats['ci_upper']:.4f}]"
+            )
+            logging.info(f"bootstrap ({bootstrap} resamples) {bootstrap_str}")
+            f.write(f"bootstrap ({bootstrap} resamples) {bootstrap_str}\n")
         if score_sent:
+            logging.info(f"writing sentence-level L'AMBRE scores to {scores_path}")
             for idx, _item in enumerate(sent_scores):
-                f.write(f"\n# sent_idx: {idx}")
-                f.write(f"\n# sent: {_item['sent']}")
-                for rule, score in _item["joint_report"].items():
+                f.write(
+                    f"sent_idx: {idx}\tlambre_score: {_item['joint_score']:.4f}\tsent: {_item['sent']}\n"
+                )
+
+        # write L'AMBRE scores per rule
+        if report:
+            logging.info(f"writing sentence-level report to {scores_path}")
+            f.write("\nL'AMBRE score per rule\n")
+            if score_doc:
+                doc_report = doc_score["joint_report"]
+                for rule, score in doc_report.items():
                     f.write(f"\n{rule}\t{score:.4f}")
+                if score_sent:
+                    f.write("\n")
 
-        else:
-            doc_report = doc_score["joint_report"]
-            for rule, score in doc_report.items():
-                f.write(f"\n{rule}\t{score:.4f}")
+            if score_sent:
+                for idx, _item in enumerate(sent_scores):
+                    f.write(f"\n# sent_idx: {idx}")
+                    f.write(f"\n# sent: {_item['sent']}")
+                    for rule, score in _item["joint_report"].items():
+                        f.write(f"\n{rule}\t{score:.4f}")
 
-    f.close()
+        f.close()
 
     """
     output txt and html visualizations of the grammatical errors
@@ -193,56 +515,172 @@ def compute_metric(
     errors_path = output / "errors"
     errors_path.mkdir(exist_ok=True, parents=True)
     logging.info(f"writing grammatical errors to {errors_path}")
-
-    if rule_set == "pratapa-etal-2021":
-        out_spans, out_depds = visualize.visualize_errors(error_tuples)
-        visualize.write_visualizations(errors_path / "errors.txt", out_spans, out_depds)
-        out_conll_str = visualize.visualize_conll_errors(error_tuples)
-        visualize.write_html_visualizations(errors_path / "errors.html", out_conll_str)
-    elif rule_set == "chaudhary-etal-2021":
-        relation_map = {}
-        with open(RELATION_MAP, "r") as inp:
-            for line in inp.readlines():
-                info = line.strip().split(";")
-                key = info[0].lower()
-                value = info[1]
-                relation_map[key] = (value, info[-1])
-                if "@x" in key:
-                    relation_map[key.split("@x")[0]] = (value, info[-1])
-        rule_links = {}
-        with open(RULE_LINKS, "r") as inp:
-            for line in inp.readlines():
-                info = line.strip().split(":")
-                rule_links[info[0]] = info[1]
-
-        out_spans, out_depds = visualize.visualize_errors_chau(
-            error_tuples, relation_map
+    scorer = scorer_module(rule_set)
+    if errors.sampled:
+        # exact per-rule error counts, the visualizations only show the sampled errors
+        logging.info(
+            f"visualizing a sample of {len(errors)} of {errors.n_errors} errors"
         )
-        visualize.write_visualizations(errors_path / "errors.txt", out_spans, out_depds)
-        (
-            out_conll_str_agree,
-            out_conll_str_wordorder,
-            out_conll_str_assignment,
-        ) = visualize.visualize_conll_errors_chau(
-            error_tuples, relation_map, rule_links[lg]
-        )
-        if len(out_conll_str_agree) > 0:
-            visualize.write_html_visualizations(
-                errors_path / "errors_agreement.html", out_conll_str_agree
-            )
-        if len(out_conll_str_wordorder) > 0:
-            visualize.write_html_visualizations(
-                errors_path / "errors_wordorder.html", out_conll_str_wordorder
+        with timing_utils.stage(timer, "write error counts", throughput=False):
+            error_utils.write_error_counts(
+                errors_path / "error_counts.txt", errors, scorer.error_rule_name
             )
-        if len(out_conll_str_assignment) > 0:
-            visualize.write_html_visualizations(
-                errors_path / "errors_marking.html", out_conll_str_assignment
+
+    if error_report == "db":
+        # the visualizations are rendered later from the store, see render.py
+        with timing_utils.stage(timer, "write error store"):
+            meta = {
+                "lang": lg,
+                "rule_set": rule_set,
+                "n_sents": len(sentences),
+                "n_errors": errors.n_errors,
+                "sampled": errors.sampled,
+                "sent_scores": score_sent,
+            }
+            if score_doc:
+                meta["score"] = doc_score["joint_score"]
+            error_utils.write_error_db(
+                errors_path / "errors.db",
+                sentences,
+                errors,
+                scorer.error_rule_name,
+                meta=meta,
+                sent_scores=(
+                    [sent_score["joint_score"] for sent_score in sent_scores]
+                    if score_sent
+                    else None
+                ),
             )
+    else:
+        write_error_reports(
+            errors_path,
+            sentences,
+            errors,
+            lg,
+            rule_set,
+            verbose=verbose,
+            timer=timer,
+            workers=workers,
+            html_page_size=html_page_size,
+            error_report=error_report,
+            ascii_max_words=ascii_max_words,
+        )
 
+    if score_doc:
+        doc_score_value = round(doc_score["joint_score"], 4)
     if score_sent:
-        return [round(sent_score["joint_score"], 4) for sent_score in sent_scores]
+        sent_score_values = [
+            round(sent_score["joint_score"], 4) for sent_score in sent_scores
+        ]
+
+    if bootstrap > 0:
+        # bootstrap statistics are returned after the scores
+        if score_sent:
+            return doc_score_value, sent_score_values, doc_score["bootstrap"]
+        return doc_score_value, doc_score["bootstrap"]
+    if score_sent and score_doc:
+        return doc_score_value, sent_score_values
+    elif score_sent:
+        return sent_score_values
     else:
-        return round(doc_score["joint_score"], 4)
+        return doc_score_value
+
+
+def write_error_reports(
+    errors_path: Path,
+    sentences,
+    errors: error_utils.ErrorRecords,
+    lg: str,
+    rule_set: str,
+    verbose: bool = False,
+    timer: timing_utils.StageTimer = None,
+    workers: int = 1,
+    html_page_size: int = 500,
+    error_report: str = "html",
+    ascii_max_words: int = 100,
+):
+    """
+    txt and html (or json, see compute_metric) visualizations of the error records in `errors_path`
+    `sentences` only needs the erroneous sentences, by sentence index (e.g. those read from an error store)
+    """
+    scorer = scorer_module(rule_set)
+
+    if error_report == "json":
+        with timing_utils.stage(timer, "visualize: json"):
+            error_utils.write_error_store(
+                errors_path / "errors.json", sentences, errors, scorer.error_rule_name
+            )
+            visualize.write_error_viewer(errors_path)
+
+    if rule_set == "pratapa-etal-2021":
+        # errors are grouped by sentence (and re-materialized for each visualization),
+        # every erroneous sentence is rendered once with all its errors
+        with timing_utils.stage(timer, "visualize: txt"):
+            visualize.write_ascii_visualizations(
+                errors_path / "errors.txt",
+                visualize.iter_sentence_error_markup(
+                    score_utils_pratapa.materialize_sentence_errors(sentences, errors)
+                ),
+                workers=workers,
+                max_words=ascii_max_words,
+            )
+        if error_report == "html":
+            with timing_utils.stage(timer, "visualize: html"):
+                visualize.write_html_reports(
+                    errors_path,
+                    visualize.iter_sentence_conll_errors(
+                        score_utils_pratapa.materialize_sentence_errors(
+                            sentences, errors
+                        )
+                    ),
+                    {"errors": "errors"},
+                    page_size=html_page_size,
+                )
+    elif rule_set == "chaudhary-etal-2021":
+        with timing_utils.stage(timer, "visualize: load resources", throughput=False):
+            relation_map = visualize.load_relation_map(RELATION_MAP)
+            rule_links = visualize.load_rule_links(RULE_LINKS)
+
+        with timing_utils.stage(timer, "visualize: txt"):
+            visualize.write_ascii_visualizations(
+                errors_path / "errors.txt",
+                visualize.iter_sentence_error_markup_chau(
+                    score_utils_chaudhary.materialize_sentence_errors(
+                        sentences, errors
+                    ),
+                    relation_map,
+                ),
+                workers=workers,
+                max_words=ascii_max_words,
+            )
+        if error_report == "html":
+            with timing_utils.stage(timer, "visualize: html"):
+                # html examples are streamed to the pages as they are generated
+                visualize.write_html_reports(
+                    errors_path,
+                    visualize.iter_sentence_conll_errors_chau(
+                        score_utils_chaudhary.materialize_sentence_errors(
+                            sentences, errors
+                        ),
+                        relation_map,
+                        rule_links[lg],
+                    ),
+                    {
+                        "agreement": "errors_agreement",
+                        "wordorder": "errors_wordorder",
+                        "assignment": "errors_marking",
+                    },
+                    intro=visualize.CHAU_HTML_INTRO,
+                    page_size=html_page_size,
+                )
+
+
+def report_timings(timer: timing_utils.StageTimer, output: Path):
+    """log the per-stage timings and store them in the output directory"""
+    logging.info(f"timings\n{timer.table()}")
+    timings_path = output / "timings.json"
+    logging.info(f"writing timings to {timings_path}")
+    timer.write_json(timings_path)
 
 
 def score(
@@ -251,41 +689,321 @@ def score(
     rule_set: str = "chaudhary-etal-2021",
     output: Path = "out",
     score_sent: bool = False,
+    score_doc: bool = False,
     report: bool = False,
     ssplit: bool = False,
     rules_path: Path = Path.home() / "lambre_files" / "rules",
     stanza_path: Path = Path.home() / "lambre_files" / "lambre_stanza_resources",
     verbose: bool = False,
+    workers: int = 1,
+    bootstrap: int = 0,
+    bootstrap_seed: int = None,
+    max_errors: int = None,
+    errors_per_rule: int = None,
+    timings: bool = False,
+    timing_hook: Callable[[dict], None] = None,
+    profile: bool = False,
+    profile_top: int = 30,
+    profile_rules: bool = False,
+    memory: bool = False,
+    memory_budget: int = None,
+    html_page_size: int = 500,
+    error_report: str = "html",
+    ascii_max_words: int = 100,
 ):
-    if not check_lang(lg=lg, stanza_path=stanza_path):
-        return
+    """
+    with `timings`, the per-stage timings are logged and stored in the output directory,
+    `timing_hook` is called with the timings (see timing_utils.StageTimer.to_dict)
+    with `memory`, the peak memory of every stage is tracked along with the timings
+    with `profile`, parsing and scoring are profiled (see profile_utils.profile_run),
+    with `profile_rules`, per-rule evaluation statistics are stored in the output directory
+    with `memory_budget` (in MB), the document is parsed in chunks and error records are spilled to disk
+    to stay under the budget (see memory_utils.MemoryBudget)
+    html visualizations are split into pages of `html_page_size` examples, 0 for a single file
+    with `error_report` json, errors are stored in a compact errors.json with a static viewer instead
+    with `error_report` db, errors are stored in errors.db, the visualizations are left to lambre-render
+    sentences longer than `ascii_max_words` are shown on a window around the erroneous tokens in errors.txt
+    """
+    timer = None
+    if timings or timing_hook or memory:
+        timer = timing_utils.StageTimer(track_memory=memory)
+    if memory_budget is not None:
+        memory_budget = memory_utils.MemoryBudget(memory_budget)
+
+    with timing_utils.stage(timer, "check language", throughput=False):
+        if not check_lang(lg=lg, stanza_path=stanza_path):
+            return
+
+    if profile and workers > 1:
+        logging.warning(
+            f"--profile does not cover the rule evaluation in worker processes"
+        )
 
     if ssplit:
         parser_input_doc = "".join(doc)
     else:
         parser_input_doc = "\n\n".join(doc)
-    sentences = parse_doc(
-        doc=parser_input_doc,
-        lg=lg,
-        stanza_path=stanza_path,
-        output=output,
-        ssplit=ssplit,
-        verbose=verbose,
-    )
-    scores = compute_metric(
-        sentences=sentences,
-        lg=lg,
-        score_sent=score_sent,
-        rule_set=rule_set,
-        rules_path=Path(rules_path),
-        report=report,
-        verbose=verbose,
-        output=Path(output),
-    )
+    with profile_utils.profile_run(Path(output), profile_top, enabled=profile):
+        sentences = parse_doc(
+            doc=parser_input_doc,
+            lg=lg,
+            stanza_path=stanza_path,
+            output=output,
+            ssplit=ssplit,
+            verbose=verbose,
+            timer=timer,
+            memory_budget=memory_budget,
+        )
+        scores = compute_metric(
+            sentences=sentences,
+            lg=lg,
+            score_sent=score_sent,
+            score_doc=score_doc,
+            rule_set=rule_set,
+            rules_path=Path(rules_path),
+            report=report,
+            verbose=verbose,
+            output=Path(output),
+            workers=workers,
+            bootstrap=bootstrap,
+            bootstrap_seed=bootstrap_seed,
+            max_errors=max_errors,
+            errors_per_rule=errors_per_rule,
+            timer=timer,
+            profile_rules=profile_rules,
+            memory_budget=memory_budget,
+            html_page_size=html_page_size,
+            error_report=error_report,
+            ascii_max_words=ascii_max_words,
+        )
+
+    if timer is not None:
+        timer.stop()
+    if timings or memory:
+        report_timings(timer, Path(output))
+    if timing_hook is not None:
+        timing_hook(timer.to_dict())
 
     return scores
 
 
+"""
+batch scoring
+jobs are grouped by language, each language's parser is loaded once, in the main process, and its .txt inputs
+are parsed there, while the jobs already parsed are scored (and visualized) across a pool of worker processes
+"""
+RULE_SETS = ["chaudhary-etal-2021", "pratapa-etal-2021"]
+# rules of the batch jobs, loaded once per process, language and rule set
+_batch_rules = {}
+
+
+def read_jobs(jobs_path: Path, rule_set: str) -> List[dict]:
+    """
+    batch jobs, one per line of the tab-separated `jobs_path`: language, input file, output directory,
+    and optionally the rule set (`rule_set` otherwise), blank lines and lines starting with # are skipped
+    """
+    jobs = []
+    with open(jobs_path, "r") as rf:
+        for line_num, line in enumerate(rf, 1):
+            if not line.strip() or line.startswith("#"):
+                continue
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) not in (3, 4) or (len(cols) == 4 and cols[3] not in RULE_SETS):
+                raise ValueError(
+                    f"{jobs_path}:{line_num}: expected language, input, output and optionally one of {', '.join(RULE_SETS)}"
+                )
+            jobs.append(
+                {
+                    "lg": cols[0],
+                    "input": Path(cols[1]),
+                    "output": Path(cols[2]),
+                    "rule_set": cols[3] if len(cols) == 4 else rule_set,
+                }
+            )
+    return jobs
+
+
+def _score_job(job: dict, options: dict, timer: timing_utils.StageTimer = None):
+    """
+    score (and visualize) a batch job whose input is parsed, at job["conllu"]
+    returns the scores, or the I/O or parse error the job failed with
+    """
+    try:
+        key = (job["lg"], job["rule_set"])
+        if key not in _batch_rules:
+            rules_file_path = (
+                bundle.rules_root(options["rules_path"])
+                / job["rule_set"]
+                / f"{job['lg']}.txt"
+            )
+            _batch_rules[key] = load_rules(rules_file_path, job["rule_set"])
+        memory_budget = None
+        if options["memory_budget"] is not None:
+            memory_budget = memory_utils.MemoryBudget(options["memory_budget"])
+        with timing_utils.stage(timer, "load conllu"):
+            sentences = pyconll.load_from_file(job["conllu"])
+        scores = compute_metric(
+            sentences=sentences,
+            lg=job["lg"],
+            rule_set=job["rule_set"],
+            output=job["output"],
+            timer=timer,
+            memory_budget=memory_budget,
+            rules=_batch_rules[key],
+            **{k: v for k, v in options.items() if k != "memory_budget"},
+        )
+        if timer is not None:
+            timer.stop()
+            report_timings(timer, job["output"])
+        return scores, None
+    except (OSError, ValueError) as e:
+        # missing or unreadable files and malformed CoNLL-U (pyconll errors are ValueErrors),
+        # anything else is a bug and is raised
+        return None, f"{type(e).__name__}: {e}"
+
+
+def _parse_job(
+    job: dict, args: dict, pipeline, timer: timing_utils.StageTimer = None
+) -> Path:
+    """parse the .txt input of a batch job with the `pipeline` of its language, returns the .conllu path"""
+    doc = ""
+    with open(job["input"], "r") as rf:
+        for line in rf:
+            doc += line
+            if not args["ssplit"]:
+                doc += "\n"
+    memory_budget = None
+    if args["memory_budget"] is not None:
+        memory_budget = memory_utils.MemoryBudget(args["memory_budget"])
+    parse_doc(
+        doc=doc,
+        lg=job["lg"],
+        stanza_path=args["stanza_path"],
+        output=job["output"],
+        ssplit=args["ssplit"],
+        verbose=args["verbose"],
+        file_name=job["input"].stem,
+        timer=timer,
+        memory_budget=memory_budget,
+        pipeline=pipeline,
+    )
+    return job["output"] / f"{job['input'].stem}.conllu"
+
+
+def run_batch(args: dict) -> bool:
+    """
+    run the jobs of args["batch"] (see read_jobs) with the other options of the command line,
+    every job's output directory is as if its input was scored on its own
+    with more than one worker, jobs are scored across a single pool of args["workers"] processes
+    (each job in a single process), returns whether all the jobs succeeded
+    """
+    try:
+        jobs = read_jobs(args["batch"], args["rule_set"])
+    except (OSError, ValueError) as e:
+        logging.warning(f"cannot read the jobs: {e}")
+        return False
+    if args["profile"]:
+        logging.warning("--profile is not supported with --batch, ignoring it")
+    options = {
+        key: args[key]
+        for key in [
+            "score_sent",
+            "score_doc",
+            "rules_path",
+            "report",
+            "verbose",
+            "bootstrap",
+            "bootstrap_seed",
+            "max_errors",
+            "errors_per_rule",
+            "profile_rules",
+            "memory_budget",
+            "html_page_size",
+            "error_report",
+            "ascii_max_words",
+        ]
+    }
+
+    pool = None
+    options["workers"] = args["workers"]
+    if args["workers"] > 1 and len(jobs) > 1:
+        # created before any parser is loaded, so the workers do not inherit it
+        pool = mp.Pool(args["workers"])
+        options["workers"] = 1
+
+    groups = {}
+    for job in jobs:
+        groups.setdefault(job["lg"], []).append(job)
+
+    results, failed = [], []
+    try:
+        for lg, lang_jobs in groups.items():
+            rules_path = bundle.rules_root(args["rules_path"])
+            pipeline = None
+            for job in lang_jobs:
+                if not (rules_path / job["rule_set"] / f"{lg}.txt").is_file():
+                    logging.warning(
+                        f"{lg} is not supported for rule set {job['rule_set']}, skipping {job['input']}"
+                    )
+                    failed.append(job)
+                    continue
+                job["output"].mkdir(exist_ok=True, parents=True)
+                timer = None
+                if args["timings"] or args["memory"]:
+                    timer = timing_utils.StageTimer(track_memory=args["memory"])
+
+                if job["input"].suffix == ".conllu":
+                    job["conllu"] = job["input"]
+                else:
+                    if pipeline is None and not check_lang(
+                        lg=lg, stanza_path=args["stanza_path"]
+                    ):
+                        failed.append(job)
+                        continue
+                    try:
+                        if pipeline is None:
+                            logging.info(f"loading the parser for {lg}")
+                            with timing_utils.stage(
+                                timer, "parse: model load", throughput=False
+                            ):
+                                pipeline = load_pipeline(
+                                    lg,
+                                    args["stanza_path"],
+                                    ssplit=args["ssplit"],
+                                    verbose=args["verbose"],
+                                )
+                        job["conllu"] = _parse_job(job, args, pipeline, timer)
+                    except (OSError, ValueError) as e:
+                        logging.warning(
+                            f"{job['input']} failed: {type(e).__name__}: {e}"
+                        )
+                        failed.append(job)
+                        continue
+
+                logging.info(f"scoring {job['input']} ({lg}, {job['rule_set']})")
+                if pool is not None:
+                    results.append(
+                        (job, pool.apply_async(_score_job, (job, options, timer)))
+                    )
+                else:
+                    results.append((job, _score_job(job, options, timer)))
+
+        for job, result in results:
+            scores, error = result.get() if pool is not None else result
+            if error is not None:
+                logging.warning(f"{job['input']} failed: {error}")
+                failed.append(job)
+            else:
+                logging.info(f"scored {job['input']}, see {job['output']}")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    logging.info(f"{len(jobs) - len(failed)} of {len(jobs)} jobs done")
+    return not failed
+
+
 def main():
 
     logging.basicConfig(
@@ -295,43 +1013,82 @@ def main():
     )
 
     args = vars(parse_args())
-
-    if not check_lang(lg=args["lg"], stanza_path=args["stanza_path"]):
+    if args["batch"] is not None:
+        if not run_batch(args):
+            exit(1)
         return
 
-    input = Path(args["input"])
+    timer = None
+    if args["timings"] or args["memory"]:
+        timer = timing_utils.StageTimer(track_memory=args["memory"])
+    memory_budget = None
+    if args["memory_budget"] is not None:
+        memory_budget = memory_utils.MemoryBudget(args["memory_budget"])
+
+    with timing_utils.stage(timer, "check language", throughput=False):
+        if not check_lang(lg=args["lg"], stanza_path=args["stanza_path"]):
+            return
+
     args["output"].mkdir(exist_ok=True)
-    if input.suffix == ".conllu":
-        # input CoNLL-U file, directly load the file
-        sentences = pyconll.load_from_file(input)
-    else:
-        # input txt file, parse
-        doc = ""
-        with open(input, "r") as rf:
-            for line in rf:
-                doc += line
-                if not args["ssplit"]:
-                    doc += "\n"
-        sentences = parse_doc(
-            doc=doc,
+    if args["profile"] and args["workers"] > 1:
+        logging.warning(
+            f"--profile does not cover the rule evaluation in worker processes"
+        )
+
+    with profile_utils.profile_run(
+        args["output"], args["profile_top"], enabled=args["profile"]
+    ):
+        input = Path(args["input"])
+        if input.suffix == ".conllu":
+            # input CoNLL-U file, directly load the file
+            with timing_utils.stage(timer, "load conllu"):
+                sentences = pyconll.load_from_file(input)
+        else:
+            # input txt file, parse
+            doc = ""
+            with open(input, "r") as rf:
+                for line in rf:
+                    doc += line
+                    if not args["ssplit"]:
+                        doc += "\n"
+            sentences = parse_doc(
+                doc=doc,
+                lg=args["lg"],
+                stanza_path=args["stanza_path"],
+                output=args["output"],
+                ssplit=args["ssplit"],
+                verbose=args["verbose"],
+                file_name=input.stem,
+                timer=timer,
+                memory_budget=memory_budget,
+            )
+
+        compute_metric(
+            sentences=sentences,
             lg=args["lg"],
-            stanza_path=args["stanza_path"],
-            output=args["output"],
-            ssplit=args["ssplit"],
+            score_sent=args["score_sent"],
+            score_doc=args["score_doc"],
+            rule_set=args["rule_set"],
+            rules_path=args["rules_path"],
+            report=args["report"],
             verbose=args["verbose"],
-            file_name=input.stem,
+            output=args["output"],
+            workers=args["workers"],
+            bootstrap=args["bootstrap"],
+            bootstrap_seed=args["bootstrap_seed"],
+            max_errors=args["max_errors"],
+            errors_per_rule=args["errors_per_rule"],
+            timer=timer,
+            profile_rules=args["profile_rules"],
+            memory_budget=memory_budget,
+            html_page_size=args["html_page_size"],
+            error_report=args["error_report"],
+            ascii_max_words=args["ascii_max_words"],
         )
 
-    compute_metric(
-        sentences=sentences,
-        lg=args["lg"],
-        score_sent=args["score_sent"],
-        rule_set=args["rule_set"],
-        rules_path=args["rules_path"],
-        report=args["report"],
-        verbose=args["verbose"],
-        output=args["output"],
-    )
+    if timer is not None:
+        timer.stop()
+        report_timings(timer, args["output"])
 
 
 if __name__ == "__main__":
@@ -4,23 +4,23 @@ tools: stanza
 """
 import logging
 from pathlib import Path
+from typing import Iterator, List
 
 import stanza
 from stanza.utils.conll import CoNLL
 
+from lambre import timing_utils
+from lambre.memory_utils import MemoryBudget
 
-def get_depd_tree(
-    doc: str,
+
+def load_pipeline(
     lg: str,
     stanza_model_path: Path,
     tokenize: bool = True,
     ssplit: bool = False,
     cuda: bool = False,
     verbose: bool = False,
-) -> str:
-
-    logging.info(f"generating SUD parse for the input document")
-
+):
     model_dir = str(stanza_model_path)
     if tokenize and ssplit:
         stanza_nlp = stanza.Pipeline(
@@ -43,9 +43,78 @@ def get_depd_tree(
             verbose=verbose,
         )
 
-    stanza_doc = stanza_nlp(doc)
-    doc_dict = stanza_doc.to_dict()
-    conll = CoNLL.convert_dict(doc_dict)
-    doc_conll_str = CoNLL.conll_as_string(conll)
+    return stanza_nlp
+
+
+def get_depd_tree(
+    doc: str,
+    lg: str,
+    stanza_model_path: Path,
+    tokenize: bool = True,
+    ssplit: bool = False,
+    cuda: bool = False,
+    verbose: bool = False,
+    timer: timing_utils.StageTimer = None,
+    pipeline=None,
+) -> str:
+
+    if pipeline is None:
+        logging.info(f"generating SUD parse for the input document")
+        with timing_utils.stage(timer, "parse: model load", throughput=False):
+            pipeline = load_pipeline(
+                lg, stanza_model_path, tokenize, ssplit, cuda, verbose
+            )
+
+    with timing_utils.stage(timer, "parse: annotate"):
+        stanza_doc = pipeline(doc)
+    with timing_utils.stage(timer, "parse: conll conversion"):
+        doc_dict = stanza_doc.to_dict()
+        conll = CoNLL.convert_dict(doc_dict)
+        doc_conll_str = CoNLL.conll_as_string(conll)
 
     return doc_conll_str
+
+
+def get_depd_trees(
+    blocks: List[str],
+    lg: str,
+    stanza_model_path: Path,
+    memory_budget: MemoryBudget,
+    tokenize: bool = True,
+    ssplit: bool = False,
+    cuda: bool = False,
+    verbose: bool = False,
+    timer: timing_utils.StageTimer = None,
+    pipeline=None,
+) -> Iterator[str]:
+    """
+    parse `blocks` (sentences, or paragraphs with `ssplit`) in chunks with a single pipeline,
+    the chunk size adapts to the memory in use (see memory_utils.MemoryBudget)
+    yields the CoNLL-U string of every chunk, they concatenate into the parse of the whole document
+    """
+
+    logging.info(
+        f"generating SUD parse for the input document in chunks, memory budget: {memory_budget.budget >> 20} MB"
+    )
+    if pipeline is None:
+        with timing_utils.stage(timer, "parse: model load", throughput=False):
+            pipeline = load_pipeline(
+                lg, stanza_model_path, tokenize, ssplit, cuda, verbose
+            )
+
+    start, chunk_size = 0, memory_budget.chunk_size
+    while start < len(blocks):
+        chunk = blocks[start : start + chunk_size]
+        yield get_depd_tree(
+            "\n\n".join(chunk),
+            lg,
+            stanza_model_path,
+            tokenize,
+            ssplit,
+            cuda,
+            verbose,
+            timer=timer,
+            pipeline=pipeline,
+        )
+        start += len(chunk)
+        chunk_size = memory_budget.next_chunk_size()
@@ -0,0 +1,80 @@
+"""
+opt-in profiling: a cProfile run of the scorer and per-rule evaluation statistics
+"""
+
+import cProfile
+import logging
+import pstats
+from contextlib import contextmanager
+from pathlib import Path
+
+
+@contextmanager
+def profile_run(output: Path, top: int = 30, enabled: bool = True):
+    """
+    cProfile the enclosed code, stores profile.prof (e.g. for snakeviz or pstats)
+    and a summary of the `top` functions by cumulative and own time in profile.txt
+    only the current process is profiled, not the --workers processes
+    does nothing unless `enabled`
+    """
+    if not enabled:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        prof_path, summary_path = output / "profile.prof", output / "profile.txt"
+        logging.info(f"writing profile to {prof_path} and {summary_path}")
+        profiler.dump_stats(prof_path)
+        with open(summary_path, "w") as wf:
+            stats = pstats.Stats(profiler, stream=wf)
+            stats.strip_dirs()
+            for sort_key, name in [("cumulative", "cumulative"), ("tottime", "own")]:
+                wf.write(f"top {top} functions by {name} time\n")
+                stats.sort_stats(sort_key).print_stats(top)
+
+
+class RuleStats:
+    """
+    per-rule number of evaluations, hits (evaluations where the rule applied)
+    and cumulative time spent matching the rule, keyed like error records
+    """
+
+    def __init__(self):
+        self.stats = {}
+
+    def add(self, key, hit: bool, elapsed: float):
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = [0, 0, 0.0]
+        stats[0] += 1
+        stats[1] += hit
+        stats[2] += elapsed
+
+    def merge(self, other: "RuleStats", keys=None):
+        """add the statistics of `other`, whose keys are mapped through `keys` if given (e.g. rule ids)"""
+        for key, (evaluations, hits, elapsed) in other.stats.items():
+            if keys is not None:
+                key = keys[key]
+            stats = self.stats.setdefault(key, [0, 0, 0.0])
+            stats[0] += evaluations
+            stats[1] += hits
+            stats[2] += elapsed
+
+    def write(self, file_path, rule_name):
+        """
+        tab-separated statistics, most expensive rules first, `rule_name` formats the rule keys
+        rules that cost a lot but rarely fire have a high time per hit
+        """
+        rows = sorted(self.stats.items(), key=lambda item: -item[1][2])
+        with open(file_path, "w") as wf:
+            wf.write("evaluations\thits\thit_rate\ttime_s\ttime_per_hit_us\trule\n")
+            for key, (evaluations, hits, elapsed) in rows:
+                hit_rate = hits / evaluations if evaluations > 0 else 0.0
+                time_per_hit = f"{1e6 * elapsed / hits:.2f}" if hits > 0 else "inf"
+                wf.write(
+                    f"{evaluations}\t{hits}\t{hit_rate:.4f}\t{elapsed:.6f}\t{time_per_hit}\t{rule_name(key)}\n"
+                )
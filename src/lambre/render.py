@@ -0,0 +1,204 @@
+"""
+render the error visualizations (errors.txt, html or json) of error stores written by lambre --error-report db
+the errors can be narrowed down by rule, language and sentence-level score, without parsing or scoring again
+"""
+
+import argparse
+import logging
+import re
+from pathlib import Path
+
+from lambre import error_utils
+from lambre.metric import scorer_module, write_error_reports
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="render error visualizations from error stores"
+    )
+    parser.add_argument(
+        "stores",
+        type=Path,
+        nargs="+",
+        help="error stores (errors.db), or the lambre output directories holding them",
+    )
+    parser.add_argument(
+        "--langs",
+        type=str,
+        nargs="+",
+        default=None,
+        help="only render the stores of these languages (ISO 639-1 codes)",
+    )
+    parser.add_argument(
+        "--rules",
+        type=str,
+        nargs="+",
+        default=None,
+        metavar="PATTERN",
+        help="only render the errors of rules whose name matches one of these regular expressions",
+    )
+    parser.add_argument(
+        "--min-score",
+        type=float,
+        default=None,
+        help="only render sentences with at least this sentence-level score (stores written with --score-sent)",
+    )
+    parser.add_argument(
+        "--max-score",
+        type=float,
+        default=None,
+        help="only render sentences with at most this sentence-level score (stores written with --score-sent)",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="output directory, a subdirectory per store if there are several (default: next to each store)",
+    )
+    parser.add_argument(
+        "--error-report",
+        type=str,
+        choices=["html", "json"],
+        default="html",
+        help="html visualizations, or a compact errors.json store with a static viewer (errors_viewer.html)",
+    )
+    parser.add_argument(
+        "--html-page-size",
+        type=int,
+        default=500,
+        metavar="N",
+        help="number of examples per html page, 0 for a single file",
+    )
+    parser.add_argument(
+        "--ascii-max-words",
+        type=int,
+        default=100,
+        metavar="N",
+        help="render sentences longer than N words in errors.txt on a window around the erroneous tokens, 0 to render them in full",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes for rendering errors.txt",
+    )
+    parser.add_argument("--verbose", action="store_true", help="verbose output")
+
+    return parser.parse_args()
+
+
+def find_store(path: Path) -> Path:
+    """errors.db, given as is, or in a lambre output directory (or its errors directory)"""
+    if not path.is_dir():
+        return path
+    if (path / "errors.db").is_file():
+        return path / "errors.db"
+    return path / "errors" / "errors.db"
+
+
+def rule_filter(patterns):
+    """predicate on the rule names, true if any of the `patterns` is found"""
+    if patterns is None:
+        return None
+    regex = re.compile("|".join(f"(?:{pattern})" for pattern in patterns))
+    return lambda name: regex.search(name) is not None
+
+
+def render(
+    store: Path,
+    output: Path,
+    rules=None,
+    min_score: float = None,
+    max_score: float = None,
+    error_report: str = "html",
+    html_page_size: int = 500,
+    ascii_max_words: int = 100,
+    workers: int = 1,
+    verbose: bool = False,
+):
+    """
+    visualizations of the errors in `store` (see error_utils.write_error_db), written to `output`
+    only the errors of `rules` (regular expressions on the rule names) and of sentences scored
+    within [`min_score`, `max_score`] are rendered, returns the number of rendered errors
+    """
+    meta = error_utils.read_error_db_meta(store)
+    sentences, errors = error_utils.read_error_db(
+        store, rule_filter(rules), min_score, max_score
+    )
+    logging.info(
+        f"rendering {len(errors)} errors in {len(sentences)} sentences from {store} to {output}"
+    )
+    output.mkdir(exist_ok=True, parents=True)
+    if meta["sampled"] and output != store.parent:
+        error_utils.write_error_counts(
+            output / "error_counts.txt",
+            errors,
+            scorer_module(meta["rule_set"]).error_rule_name,
+        )
+    write_error_reports(
+        output,
+        sentences,
+        errors,
+        meta["lang"],
+        meta["rule_set"],
+        verbose=verbose,
+        workers=workers,
+        html_page_size=html_page_size,
+        error_report=error_report,
+        ascii_max_words=ascii_max_words,
+    )
+    return len(errors)
+
+
+def main():
+
+    logging.basicConfig(
+        format="%(message)s",
+        level=logging.INFO,
+        handlers=[logging.StreamHandler()],
+    )
+
+    args = vars(parse_args())
+
+    stores = []
+    for path in args["stores"]:
+        store = find_store(path)
+        if not store.is_file():
+            logging.warning(f"no error store found at {path}")
+            exit(1)
+        meta = error_utils.read_error_db_meta(store)
+        if args["langs"] is not None and meta["lang"] not in args["langs"]:
+            continue
+        if (
+            args["min_score"] is not None or args["max_score"] is not None
+        ) and not meta["sent_scores"]:
+            logging.warning(
+                f"{store} has no sentence-level scores, write it with --score-sent to filter by score"
+            )
+            exit(1)
+        stores.append(store)
+
+    for idx, store in enumerate(stores):
+        if args["output"] is None:
+            output = store.parent
+        elif len(stores) > 1:
+            meta = error_utils.read_error_db_meta(store)
+            output = args["output"] / f"{idx}-{meta['lang']}-{meta['rule_set']}"
+        else:
+            output = args["output"]
+        render(
+            store,
+            output,
+            rules=args["rules"],
+            min_score=args["min_score"],
+            max_score=args["max_score"],
+            error_report=args["error_report"],
+            html_page_size=args["html_page_size"],
+            ascii_max_words=args["ascii_max_words"],
+            workers=args["workers"],
+            verbose=args["verbose"],
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,15 @@
 from collections import defaultdict
+from collections.abc import Mapping
 from copy import deepcopy
 from pathlib import Path
+from types import MappingProxyType
+
+
+def open_rules(file_path):
+    """rule files are read from disk, or straight from a bundle (see bundle.BundlePath)"""
+    if isinstance(file_path, str):
+        file_path = Path(file_path)
+    return file_path.open("r")
 
 
 def load_pratapa_etal_2021_rules(file_path: Path):
@@ -10,7 +19,7 @@ def load_pratapa_etal_2021_rules(file_path: Path):
 
     agr_rules = defaultdict(list)
     argstruct_rules = {}
-    with open(file_path, "r") as rf:
+    with open_rules(file_path) as rf:
         for line in rf:
             splits = line.strip().split("\t")
             rule_type = splits[2]
@@ -34,7 +43,7 @@ def load_chaudhury_etal_2021_rules(file_path: Path):
     """
 
     rules = {}
-    with open(file_path, "r") as rf:
+    with open_rules(file_path) as rf:
         # tr      chaudhary-etal-2021     wordorder       subject-verb  before      depheadpos_NOUN ### deppos_VERB depheadpos_PUNCT ### headpos_VERB       71
         # tr      chaudhary-etal-2021     agreement       gender-AUX req-agree       depheadpos_NOUN ### deppos_VERB depheadpos_PUNCT ### headpos_VERB       71
         for line in rf:
@@ -446,6 +455,39 @@ def printExamples(
                 sent_error_examples.append("\n")
 
 
+class RelationMap(Mapping):
+    """
+    frozen map of the lowercased relation and POS names to their readable names (see visualize.load_relation_map),
+    indexing the readable name of every raw rule feature looked up (see transformRulesIntoReadable)
+    it is read-only, so a single instance can be shared across calls and threads
+    """
+
+    def __init__(self, relations: dict):
+        self._relations = MappingProxyType(dict(relations))
+        # raw feature -> readable name, filling it is idempotent so concurrent lookups are safe
+        self._readable = {}
+
+    def __getitem__(self, key):
+        return self._relations[key]
+
+    def __iter__(self):
+        return iter(self._relations)
+
+    def __len__(self):
+        return len(self._relations)
+
+    def readable(self, info: str) -> str:
+        """readable name of a feature, looked up lowercased and then without its @ suffix, else the feature itself"""
+        value = self._readable.get(info)
+        if value is None:
+            relation = self._relations.get(info.lower())
+            if relation is None:
+                relation = self._relations.get(info.split("@")[0].lower())
+            value = info if relation is None else relation[0]
+            self._readable[info] = value
+        return value
+
+
 def transformRulesIntoReadable(feature, task, rel, relation_map):
     task = task.lower()
     if task == "wordorder":
@@ -470,6 +512,8 @@ def transformRulesIntoReadable(feature, task, rel, relation_map):
 
     def get_relation(info):
         lang_link = f"https://universaldependencies.org/"
+        if isinstance(relation_map, RelationMap):
+            return relation_map.readable(info), lang_link
         if info in relation_map or info.lower() in relation_map:
             (value, _) = relation_map.get(info.lower(), info.lower())
 
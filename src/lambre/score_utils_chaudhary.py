@@ -1,300 +1,280 @@
 import logging
+import multiprocessing as mp
+import time
 from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
 
 import numpy as np
 from tqdm import tqdm
 
 import lambre.rule_utils as utils
+from lambre import count_utils, error_utils, profile_utils, stat_utils, timing_utils
 
+"""
+rule types, the first element of every RuleCounts key
+"""
+AGREEMENT, WORDORDER, ASSIGNMENT, ARGSTRUCT = 0, 1, 2, 3
 
-def compute_joint_score(
-    agreement_aggr, wordorder_aggr, assignment_aggr, argstruct_aggr
-):
 
-    weights = []
-    scores = []
-    report = {}
+def compile_rules(lang_rule_all):
+    """
+    split the active/non-active features of every rule once, instead of for every token
+    compiled rules are hashable (active, non-active, label) tuples, so they can key error records
+    """
+    compiled = {}
+    for task, rulesPerModel in lang_rule_all.items():
+        compiled[task] = {}
+        for model, rules in rulesPerModel.items():
+            compiled[task][model] = [
+                (tuple(one_active), tuple(one_nonactive), label)
+                for one_active, one_nonactive, label in zip(
+                    *utils.extractFeaturesFromRules(rules)
+                )
+            ]
+    return compiled
+
+
+def _score_rows(keys, rule_ids, counts):
+    """
+    rows sorted in score order, with their rule types and match ratios
+    rules are ordered by type, then by agr_type and rule in order of first appearance in `rule_ids`
+    """
+    order = count_utils.score_order([keys[rule_id] for rule_id in rule_ids])
+    rule_ids, counts = rule_ids[order], counts[order]
+    sections = np.array([keys[rule_id][0] for rule_id in rule_ids], dtype=np.int64)
+    ratio, valid = count_utils.match_ratios(counts, require_total=sections == ARGSTRUCT)
+    return rule_ids, counts, sections, ratio, valid
 
+
+def compute_joint_score(keys, rule_ids, counts, report: bool = True):
+    """
+    uniform average over all applicable rules
+    `counts` holds the [mismatch, match, total] rows of the rules in `rule_ids`, `keys` maps rule ids to rules
+    """
+    rule_ids, counts, sections, ratio, valid = _score_rows(keys, rule_ids, counts)
+    score = count_utils.mean_score(ratio, valid)
+    if not report or not valid.any():
+        return score, {}
+
+    report = {}
     dim_score_match = defaultdict(lambda: 0)
     dim_score_total = defaultdict(lambda: 0)
-
-    for agr_type in agreement_aggr:
-        for dim in agreement_aggr[agr_type]:
-            mismatch, match, total = agreement_aggr[agr_type][dim]
-            if mismatch + match > 0:
-                agr_score, agr_weight = float(match) / (match + mismatch), 1
-                weights.append(agr_weight)
-                scores.append(agr_score)
-                dim_score_match[dim] += match
-                dim_score_total[dim] += total
-                report["agr = %s:%s" % (agr_type, dim)] = agr_score
-
-    for dim in wordorder_aggr:
-        mismatch, match, total = wordorder_aggr[dim]
-        if mismatch + match > 0:
-            agr_score, agr_weight = float(match) / (match + mismatch), 1
-            weights.append(agr_weight)
-            scores.append(agr_score)
-            dim_score_match[dim] += match
-            dim_score_total[dim] += total
+    for rule_id, (_, match, total), agr_score in zip(
+        rule_ids[valid], counts[valid].tolist(), ratio[valid].tolist()
+    ):
+        section, group, dim = keys[rule_id]
+        if section == AGREEMENT:
+            report["agr = %s:%s" % (group, dim)] = agr_score
+        elif section == WORDORDER:
             report["wo = %s" % (dim)] = agr_score
-
-    for dim in assignment_aggr:
-        mismatch, match, total = assignment_aggr[dim]
-        if mismatch + match > 0:
-            agr_score, agr_weight = float(match) / (match + mismatch), 1
-            weights.append(agr_weight)
-            scores.append(agr_score)
-            dim_score_match[dim] += match
-            dim_score_total[dim] += total
+        elif section == ASSIGNMENT:
             report["assignment = %s" % (dim)] = agr_score
-
-    for depd_type in argstruct_aggr:  # we only do for Case
-        for token_type in argstruct_aggr[depd_type]:
-            mismatch, match, total = argstruct_aggr[depd_type][token_type]["counts"]
-            if mismatch + match > 0 and total > 0:
-                score, weight = float(match) / (match + mismatch), 1
-                weights.append(weight)
-                scores.append(score)
-                report["args = %s:%s:%s" % (depd_type, token_type, "Case")] = score
+        else:  # we only do for Case
+            report["args = %s:%s:%s" % (group, dim, "Case")] = agr_score
+            continue
+        dim_score_match[dim] += match
+        dim_score_total[dim] += total
 
     for dim, match in dim_score_match.items():
         total = dim_score_total[dim]
         percentage_match = float(match) / total
         report[f"model: {dim}"] = percentage_match
 
-    total_weight = np.sum(weights)
-    if total_weight > 0:
-        return (
-            np.sum(
-                [
-                    score * weight / total_weight
-                    for score, weight in zip(scores, weights)
-                ]
-            ),
-            report,
-        )
-    else:
-        # no errors or correct examples found for the pre-specified rules
-        return 1.0, {}
+    return score, report
 
 
-def compute_score(aggr, task, argstruct_aggr):
-    weights = []
-    scores = []
-    agr_report = {}
-
-    dim_score_match = defaultdict(lambda: 0)
-    dim_score_total = defaultdict(lambda: 0)
-
-    if task == "agreement":
-        for agr_type in aggr:
-            for dim in aggr[agr_type]:
-                mismatch, match, total = aggr[agr_type][dim]
-                if mismatch + match > 0:
-                    agr_score, agr_weight = float(match) / (match + mismatch), 1
-                    weights.append(agr_weight)
-                    scores.append(agr_score)
-                    dim_score_match[dim] += match
-                    dim_score_total[dim] += total
-                    agr_report["agr = %s:%s" % (agr_type, dim)] = agr_score * 100.0
-    elif task == "wordorder":
-        for dim in aggr:
-            mismatch, match, total = aggr[dim]
-            if mismatch + match > 0:
-                agr_score, agr_weight = float(match) / (match + mismatch), 1
-                weights.append(agr_weight)
-                scores.append(agr_score)
-                dim_score_match[dim] += match
-                dim_score_total[dim] += total
-                agr_report["wordorder = %s" % (dim)] = agr_score * 100.0
-    elif task == "casemarking":
-        for dim in aggr:
-            mismatch, match, total = aggr[dim]
-            if mismatch + match > 0:
-                agr_score, agr_weight = float(match) / (match + mismatch), 1
-                weights.append(agr_weight)
-                scores.append(agr_score)
-                dim_score_match[dim] += match
-                dim_score_total[dim] += total
-                agr_report["assignment = %s" % (dim)] = agr_score * 100.0
-
-        for depd_type in argstruct_aggr:  # we only do for Case
-            for token_type in argstruct_aggr[depd_type]:
-                mismatch, match, total = argstruct_aggr[depd_type][token_type]["counts"]
-                if mismatch + match > 0 and total > 0:
-                    score, weight = float(match) / (match + mismatch), 1
-                    # weights.append(weight)
-                    # scores.append(score)
-                    agr_report["args=%s:%s:%s" % (depd_type, token_type, "Case")] = (
-                        score * 100.0
-                    )
+def compute_score(keys, rule_ids, counts, task, report: bool = True):
+    """
+    average over the rules of a single task, argstruct rules are only reported for casemarking
+    """
+    section = {
+        "agreement": AGREEMENT,
+        "wordorder": WORDORDER,
+        "casemarking": ASSIGNMENT,
+    }[task]
+    rule_ids, counts, sections, ratio, valid = _score_rows(keys, rule_ids, counts)
+    score = count_utils.mean_score(ratio, valid & (sections == section))
+    if not (valid & (sections == section)).any():
+        # no agreements nor disagreements found for the pre-specified rules
+        return 1.0, {}
+    if not report:
+        return score, {}
 
-    total_weight = np.sum(weights)
-    if total_weight > 0:
-        return (
-            np.sum(
-                [
-                    score * weight / total_weight
-                    for score, weight in zip(scores, weights)
-                ]
-            ),
-            agr_report,
-        )
-    # no agreements nor disagreements found for the pre-specified rules
-    return 1.0, {}
+    agr_report = {}
+    for rule_id, agr_score in zip(rule_ids[valid], ratio[valid].tolist()):
+        rule_section, group, dim = keys[rule_id]
+        if rule_section != section and not (
+            section == ASSIGNMENT and rule_section == ARGSTRUCT
+        ):
+            continue
+        if rule_section == AGREEMENT:
+            agr_report["agr = %s:%s" % (group, dim)] = agr_score * 100.0
+        elif rule_section == WORDORDER:
+            agr_report["wordorder = %s" % (dim)] = agr_score * 100.0
+        elif rule_section == ASSIGNMENT:
+            agr_report["assignment = %s" % (dim)] = agr_score * 100.0
+        else:
+            agr_report["args=%s:%s:%s" % (group, dim, "Case")] = agr_score * 100.0
+
+    return score, agr_report
+
+
+def compute_sent_scores(keys, sent_idx, rule_ids, counts, n_sents: int):
+    """
+    joint and per-task scores of every sentence from sparse (sentence, rule) count rows
+    """
+    group_ids = {}
+    groups = np.array(
+        [group_ids.setdefault(key[:2], len(group_ids)) for key in keys], dtype=np.int64
+    )
+    sections = np.array([key[0] for key in keys], dtype=np.int64)
+    order = count_utils.sent_score_order(sent_idx, sections[rule_ids], groups[rule_ids])
+    sent_idx, rule_ids, counts = sent_idx[order], rule_ids[order], counts[order]
+
+    sections = sections[rule_ids]
+    ratio, valid = count_utils.match_ratios(counts, require_total=sections == ARGSTRUCT)
+    return {
+        "agr_score": count_utils.sent_mean_scores(
+            sent_idx, ratio, valid & (sections == AGREEMENT), n_sents
+        ),
+        "wo_score": count_utils.sent_mean_scores(
+            sent_idx, ratio, valid & (sections == WORDORDER), n_sents
+        ),
+        "assignment_score": count_utils.sent_mean_scores(
+            sent_idx, ratio, valid & (sections == ASSIGNMENT), n_sents
+        ),
+        "joint_score": count_utils.sent_mean_scores(sent_idx, ratio, valid, n_sents),
+    }
 
 
 def checkAgreementScores(
-    lang_rule_all, token, sent, featuresInDatapoint, agreement_aggr, sent_agreement_aggr
+    lang_rule_all, token, sent, featuresInDatapoint, counts, rule_stats=None
 ):
+    """
+    returns the violated rules as ((task, model, rule), observed value, expected value) tuples
+    with `rule_stats` (see profile_utils.RuleStats), every rule evaluation is counted and timed
+    """
     task = "agreement"
+    violations = []
     if task in lang_rule_all:
         rulesPerAgreement = lang_rule_all[task]
 
-        agreement_rules_per_sent, error = {}, False
         for (
             model,
             rules,
         ) in rulesPerAgreement.items():  # gender-NOUN:[], Person:[], Number:[]
             # model_feature = model.split("-")[0].title()
-            # if model_feature not in agreement_rules_per_sent:
-            agreement_rules_per_sent[model] = []
             obsAgreement = utils.checkModelApplicable(task, model, token, sent)
             if (
                 obsAgreement != -1
             ):  # -1 denotes that rule is not applicable to this datapoint e.g. for testing Gender agreement, gender is not present
-                (
-                    active_features,
-                    nonactive_features,
-                    labels,
-                ) = utils.extractFeaturesFromRules(rules)
-                for one_rule_active, one_rule_nonactive, label in zip(
-                    active_features, nonactive_features, labels
-                ):
+                for rule in rules:
                     # one_rule_active contains the active features for this rule
+                    one_rule_active, one_rule_nonactive, _ = rule
                     label = 1  # For agreement we only retain rules for required-agreement, so label is always set to 1
-                    if utils.isGrammarRuleApplicable(
+                    if rule_stats is not None:
+                        start = time.perf_counter()
+                    applicable = utils.isGrammarRuleApplicable(
                         featuresInDatapoint,
                         one_rule_active,
                         one_rule_nonactive,
                         prop=model,
-                    ):
+                    )
+                    if rule_stats is not None:
+                        rule_stats.add(
+                            (task, model, rule), applicable, time.perf_counter() - start
+                        )
+                    if applicable:
                         agr_type = "%s-%s-%s" % (
                             token.deprel,
                             token.upos,
                             sent[token.head].upos,
                         )  # rel, dep, head
-                        if agr_type not in agreement_aggr:
-                            agreement_aggr[agr_type] = {}
-                        if agr_type not in sent_agreement_aggr:
-                            sent_agreement_aggr[agr_type] = {}
-
-                        if model not in agreement_aggr[agr_type]:
-                            agreement_aggr[agr_type][model] = [0] * 3
-                        if model not in sent_agreement_aggr[agr_type]:
-                            sent_agreement_aggr[agr_type][model] = [0] * 3
+                        rule_id = counts.rule_id((AGREEMENT, agr_type, model))
 
                         if obsAgreement == label:
-                            agreement_aggr[agr_type][model][1] += 1
-                            sent_agreement_aggr[agr_type][model][1] += 1
+                            counts.add(rule_id, True)
 
                         else:
-                            agreement_aggr[agr_type][model][0] += 1
-                            agreement_rules_per_sent[model].append(
+                            counts.add(rule_id, False)
+                            violations.append(
                                 (
-                                    one_rule_active,
-                                    one_rule_nonactive,
-                                    "req-agree",
+                                    (task, model, rule),
+                                    utils.getFeatureValue(model, token.feats),
+                                    utils.getFeatureValue(
+                                        model, sent[token.head].feats
+                                    ),
                                 )
                             )
-                            sent_agreement_aggr[agr_type][model][0] += 1
-                            error = True
-                        agreement_aggr[agr_type][model][2] += 1
-                        sent_agreement_aggr[agr_type][model][2] += 1
-
-        return agreement_rules_per_sent, error
 
-    return None, False
+    return violations
 
 
 def checkWordOrderScores(
-    lang_rule_all, token, sent, featuresInDatapoint, wordorder_aggr, sent_wordorder_aggr
+    lang_rule_all, token, sent, featuresInDatapoint, counts, rule_stats=None
 ):
+    """
+    returns the violated rules as ((task, model, rule), observed order, expected order) tuples
+    """
     task = "wordorder"
+    violations = []
     if task in lang_rule_all:
-        error = False
         rulesPerWordOrder = lang_rule_all[task]
 
-        wordorder_rules_per_sent = {}
         for (
             model,
             rules,
         ) in (
             rulesPerWordOrder.items()
         ):  # subject-verb:[], object-verb:[], adjective-noun:[], noun-adposition:[], numeral-noun:[]
-            wordorder_rules_per_sent[model] = []
             obsWordOrder = utils.checkModelApplicable(task, model, token, sent)
             if (
                 obsWordOrder != -1
             ):  # -1 denotes that rule is not applicable to this datapoint e.g. for testing subject-verb agreement, subj is not present
-                (
-                    active_features,
-                    nonactive_features,
-                    labels,
-                ) = utils.extractFeaturesFromRules(rules)
-                for one_rule_active, one_rule_nonactive, label in zip(
-                    active_features, nonactive_features, labels
-                ):
+                for rule in rules:
                     # one_rule_active contains the active features for this rule
-                    if utils.isGrammarRuleApplicable(
+                    one_rule_active, one_rule_nonactive, label = rule
+                    if rule_stats is not None:
+                        start = time.perf_counter()
+                    applicable = utils.isGrammarRuleApplicable(
                         featuresInDatapoint, one_rule_active, one_rule_nonactive
-                    ):
-                        if model not in wordorder_aggr:
-                            wordorder_aggr[model] = [0] * 3
-                        if model not in sent_wordorder_aggr:
-                            sent_wordorder_aggr[model] = [0] * 3
+                    )
+                    if rule_stats is not None:
+                        rule_stats.add(
+                            (task, model, rule), applicable, time.perf_counter() - start
+                        )
+                    if applicable:
+                        rule_id = counts.rule_id((WORDORDER, None, model))
 
                         if obsWordOrder == label:
-                            wordorder_aggr[model][1] += 1
-                            sent_wordorder_aggr[model][1] += 1
+                            counts.add(rule_id, True)
 
                         else:
-                            wordorder_aggr[model][0] += 1
-                            wordorder_rules_per_sent[model].append(
-                                (one_rule_active, one_rule_nonactive, label)
+                            counts.add(rule_id, False)
+                            violations.append(
+                                ((task, model, rule), obsWordOrder, label)
                             )
-                            sent_wordorder_aggr[model][0] += 1
-                            error = True
-                        wordorder_aggr[model][2] += 1
-                        sent_wordorder_aggr[model][2] += 1
 
-        return wordorder_rules_per_sent, error
-
-    return None, False
+    return violations
 
 
 def checkAssignmentScores(
-    lang_rule_all,
-    token,
-    sent,
-    featuresInDatapoint,
-    assignment_aggr,
-    argstruct_aggr,
-    sent_assignment_aggr,
+    lang_rule_all, token, sent, featuresInDatapoint, counts, rule_stats=None
 ):
+    """
+    returns the violated rules as ((task, model, rule), observed case, expected case) tuples
+    """
     task = "casemarking"
+    violations = []
     if task in lang_rule_all:
-        error = False
         rulesPerAssignment = lang_rule_all[task]
 
-        assignment_rules_per_sent = {}
         for model, rules in rulesPerAssignment.items():  # NOUN:[], PROPN:[], PRON:[]
             obsCase = utils.checkModelApplicable(task, model, token, sent)
             if (
                 obsCase != -1
             ):  # -1 denotes that rule is not applicable to this datapoint e.g. for testing subject-verb agreement, subj is not present
-                assignment_rules_per_sent[model] = []
                 if token.head == "0" and token.head:
                     agr_type = None
                 else:
@@ -304,72 +284,63 @@ def checkAssignmentScores(
                         sent[token.head].upos,
                     )  # rel, dep, head
 
-                (
-                    active_features,
-                    nonactive_features,
-                    labels,
-                ) = utils.extractFeaturesFromRules(rules)
-                for one_rule_active, one_rule_nonactive, label in zip(
-                    active_features, nonactive_features, labels
-                ):
+                for rule in rules:
                     # one_rule_active contains the active features for this rule
-                    if utils.isGrammarRuleApplicable(
+                    one_rule_active, one_rule_nonactive, label = rule
+                    if rule_stats is not None:
+                        start = time.perf_counter()
+                    applicable = utils.isGrammarRuleApplicable(
                         featuresInDatapoint, one_rule_active, one_rule_nonactive
-                    ):
-                        if agr_type and agr_type not in argstruct_aggr:
-                            argstruct_aggr[agr_type] = {}
-                            argstruct_aggr[agr_type]["depd"] = {
-                                "feat_value": label,
-                                "counts": [0, 0, 0],
-                            }
-
-                        if model not in assignment_aggr:
-                            assignment_aggr[model] = [0] * 3
-                        if model not in sent_assignment_aggr:
-                            sent_assignment_aggr[model] = [0] * 3
+                    )
+                    if rule_stats is not None:
+                        rule_stats.add(
+                            (task, model, rule), applicable, time.perf_counter() - start
+                        )
+                    if applicable:
+                        rule_id = counts.rule_id((ASSIGNMENT, None, model))
+                        if agr_type:
+                            argstruct_id = counts.rule_id((ARGSTRUCT, agr_type, "depd"))
 
                         if obsCase == label:
-                            assignment_aggr[model][1] += 1
-                            sent_assignment_aggr[model][1] += 1
+                            counts.add(rule_id, True)
                             if agr_type:
-                                argstruct_aggr[agr_type]["depd"]["counts"][1] += 1
+                                counts.add(argstruct_id, True)
 
                         else:
-                            assignment_aggr[model][0] += 1
-                            sent_assignment_aggr[model][0] += 1
-                            assignment_rules_per_sent[model].append(
-                                (one_rule_active, one_rule_nonactive, label)
-                            )
+                            counts.add(rule_id, False)
+                            violations.append(((task, model, rule), obsCase, label))
                             if agr_type:
-                                argstruct_aggr[agr_type]["depd"]["counts"][0] += 1
-                            error = True
+                                counts.add(argstruct_id, False)
 
-                        assignment_aggr[model][2] += 1
-                        sent_assignment_aggr[model][2] += 1
+    return violations
 
-                        if agr_type:
-                            argstruct_aggr[agr_type]["depd"]["counts"][2] += 1
-
-        return assignment_rules_per_sent, error
-
-    return None, False
 
-
-def get_sent_score(data, lang_rule_all, verbose: bool = False):
+def _aggregate(
+    data,
+    lang_rule_all,
+    sent_indices,
+    score_sent: bool = False,
+    verbose: bool = False,
+    error_limits: dict = None,
+    timed: bool = False,
+    profile_rules: bool = False,
+):
     """
-    computes the grammar error metric at sentence level
+    counts for the sentences at `sent_indices`, with `score_sent` counts are also kept per sentence
+    `lang_rule_all` are compiled rules (see compile_rules)
+    errors are recorded as compact records referencing sentences in `data` by index,
+    `error_limits` are passed on to error_utils.ErrorRecords
+    with `timed`, the (wall, cpu) time spent in feature extraction and rule matching is accumulated per token
+    with `profile_rules`, per-rule evaluation statistics are returned (see profile_utils.RuleStats)
     """
 
-    logging.info(f"computing sentence-level lambre score")
-
-    scores = []
-    sent_error_examples = []
-
-    for sent in tqdm(data, disable=not verbose):
-        agreement_aggr = {}
-        wordorder_aggr = {}
-        assignment_aggr = {}
-        argstruct_aggr = {}
+    counts = count_utils.RuleCounts(track_sentences=score_sent)
+    errors = error_utils.ErrorRecords(**(error_limits or {}))
+    sent_texts = []
+    stage_times = {"feature extraction": [0.0, 0.0], "rule matching": [0.0, 0.0]}
+    rule_stats = profile_utils.RuleStats() if profile_rules else None
+    for sent_idx in tqdm(sent_indices, disable=not verbose):
+        sent = data[sent_idx]
 
         # Add the head-dependents
         dep_data_token = defaultdict(list)
@@ -379,200 +350,296 @@ def get_sent_score(data, lang_rule_all, verbose: bool = False):
             dep_data_token[token.head].append(token.id)
             sent_tokens.append(token.form)
 
-        for token in sent:
+        for token_num, token in enumerate(sent):
+
+            if timed:
+                start = timing_utils.clock()
             featuresInDatapoint = utils.extractFeatures(
                 token_num, token, sent, dep_data_token, use_lexical=True
             )
+            if timed:
+                start = timing_utils.lap(stage_times["feature extraction"], start)
 
             # Checking agreement for Gender, Person, Number
-            agreement_rules_not_followed, isAgreeError = checkAgreementScores(
-                lang_rule_all, token, sent, featuresInDatapoint, agreement_aggr, {}
-            )
-
             # Checking word order for subject-verb, object-verb, adj-noun, noun-adp, numeral-noun
-            wordorder_rules_not_followed, isWordOrderError = checkWordOrderScores(
-                lang_rule_all, token, sent, featuresInDatapoint, wordorder_aggr, {}
-            )
-
             # Checking casemarking for nouns, propernouns, pronouns,
-            assignment_rules_not_followed, isAssignmentError = checkAssignmentScores(
-                lang_rule_all,
-                token,
-                sent,
-                featuresInDatapoint,
-                assignment_aggr,
-                argstruct_aggr,
-                {},
-            )
-
-            if isAgreeError or isWordOrderError or isAssignmentError:
-                sent_error_examples += [
-                    (
-                        sent,
-                        token,
-                        isAgreeError,
-                        isWordOrderError,
-                        isAssignmentError,
-                        agreement_rules_not_followed,
-                        wordorder_rules_not_followed,
-                        assignment_rules_not_followed,
+            head_num = id2index.get(token.head, -1)
+            for checkScores in (
+                checkAgreementScores,
+                checkWordOrderScores,
+                checkAssignmentScores,
+            ):
+                for key, observed, expected in checkScores(
+                    lang_rule_all, token, sent, featuresInDatapoint, counts, rule_stats
+                ):
+                    errors.add(
+                        sent_idx,
+                        token_num,
+                        head_num,
+                        errors.rule_id(key),
+                        observed,
+                        expected,
                     )
-                ]
+            if timed:
+                timing_utils.lap(stage_times["rule matching"], start)
 
-        agr_score, agr_report = compute_score(
-            agreement_aggr, task="agreement", argstruct_aggr=None
-        )
-        wo_score, wo_report = compute_score(
-            wordorder_aggr, task="wordorder", argstruct_aggr=None
-        )
-        am_score, am_report = compute_score(
-            assignment_aggr, task="casemarking", argstruct_aggr=argstruct_aggr
-        )
+        counts.end_sentence(sent_idx)
+        if score_sent:
+            sent_texts.append(" ".join(sent_tokens))
+
+    counts.flush()
+    return counts, sent_texts, errors, stage_times, rule_stats
 
-        score, report = compute_joint_score(
-            agreement_aggr, wordorder_aggr, assignment_aggr, argstruct_aggr
-        )
-        scores.append(
-            {
-                "agr_score": agr_score,
-                "agr_report": agr_report,
-                "wo_score": wo_score,
-                "wo_report": wo_report,
-                "assignment_score": am_score,
-                "assignment_report": am_report,
-                "joint_score": score,
-                "joint_report": report,
-                "sent": " ".join(sent_tokens),
-            }
-        )
 
-    return scores, sent_error_examples
+"""
+parallel scoring
+the sentences and rules are placed in module state before the pool is created,
+so forked workers share them copy-on-write instead of receiving pickled copies
+"""
+_shared = {}
 
 
-def get_doc_score(data, lang_rule_all, verbose: bool = False):
+def _init_worker(
+    data, lang_rule_all, score_sent, error_limits=None, timed=False, profile_rules=False
+):
+    # only used with non-fork start methods (e.g. spawn on macOS/Windows)
+    _shared["data"] = data
+    _shared["rules"] = lang_rule_all
+    _shared["score_sent"] = score_sent
+    _shared["error_limits"] = error_limits
+    _shared["timed"] = timed
+    _shared["profile_rules"] = profile_rules
+
+
+def _worker(sent_indices):
+    return _aggregate(
+        _shared["data"],
+        _shared["rules"],
+        sent_indices,
+        _shared["score_sent"],
+        error_limits=_shared["error_limits"],
+        timed=_shared["timed"],
+        profile_rules=_shared["profile_rules"],
+    )
+
+
+def _run_parallel(
+    data,
+    lang_rule_all,
+    score_sent: bool,
+    workers: int,
+    verbose: bool,
+    error_limits: dict = None,
+    timed: bool = False,
+    profile_rules: bool = False,
+):
     """
-    computes grammar error metric at document level
+    partitions the sentences into contiguous chunks and scores them across a process pool
+    chunk results are returned in input order
     """
+    n_sents = len(data)
+    n_chunks = min(n_sents, workers * 4)
+    bounds = np.linspace(0, n_sents, n_chunks + 1, dtype=int)
+    chunks = [range(bounds[i], bounds[i + 1]) for i in range(n_chunks)]
+
+    if "fork" in mp.get_all_start_methods():
+        _init_worker(
+            data, lang_rule_all, score_sent, error_limits, timed, profile_rules
+        )
+        pool = mp.get_context("fork").Pool(workers)
+    else:
+        pool = mp.Pool(
+            workers,
+            initializer=_init_worker,
+            initargs=(
+                data,
+                lang_rule_all,
+                score_sent,
+                error_limits,
+                timed,
+                profile_rules,
+            ),
+        )
 
-    logging.info(f"computing document-level lambre score")
+    results = []
+    try:
+        with tqdm(total=n_sents, disable=not verbose) as pbar:
+            for chunk, result in zip(chunks, pool.imap(_worker, chunks)):
+                results.append(result)
+                pbar.update(len(chunk))
+    finally:
+        pool.close()
+        pool.join()
+        _shared.clear()
+
+    return results
+
+
+def error_rule_name(key) -> str:
+    """readable error rule key, in the column order of the rules file"""
+    task, model, (one_active, one_nonactive, label) = key
+    return "\t".join(
+        [
+            task,
+            model,
+            label,
+            " ### ".join(one_active) or "NA",
+            " ### ".join(one_nonactive) or "NA",
+        ]
+    )
 
-    agreement_aggr = {}
-    argstruct_aggr = {}
-    wordorder_aggr = {}
-    assignment_aggr = {}
-    sent_error_examples = []
-    for sent in tqdm(data, disable=not verbose):
 
-        # Add the head-dependents
-        dep_data_token = defaultdict(list)
-        sent_tokens = []
-        id2index = sent._ids_to_indexes
-        for token_num, token in enumerate(sent):
-            dep_data_token[token.head].append(token.id)
-            sent_tokens.append(token.form)
+def materialize_errors(data, errors):
+    """
+    re-materialize error records into the tuples used by the visualizations, one per erroneous token:
+    (sent, token, isAgreeError, isWordOrderError, isAssignmentError,
+     agreement_rules_not_followed, wordorder_rules_not_followed, assignment_rules_not_followed)
+    sentences are only looked up in `data` as the tuples are consumed
+    """
+    for _, error in _materialize(data, errors):
+        yield error
+
+
+def materialize_sentence_errors(data, errors):
+    """error tuples (see materialize_errors) grouped by sentence, as (sent, error tuples) pairs"""
+    for _, sent_errors in groupby(_materialize(data, errors), key=itemgetter(0)):
+        sent_errors = [error for _, error in sent_errors]
+        yield sent_errors[0][0], sent_errors
+
+
+def _materialize(data, errors):
+    """(sentence index, error tuple) pairs, see materialize_errors"""
+    records = errors.records
+    for start, end in errors.groups():
+        sent_idx, token_num = records[start, : error_utils.HEAD_NUM].tolist()
+        rules_not_followed = {"agreement": {}, "wordorder": {}, "casemarking": {}}
+        for rule_id in records[start:end, error_utils.RULE_ID].tolist():
+            task, model, (one_active, one_nonactive, label) = errors.keys[rule_id]
+            if task == "agreement":
+                label = "req-agree"
+            rules_not_followed[task].setdefault(model, []).append(
+                (one_active, one_nonactive, label)
+            )
 
-        sent_agreement_aggr = {}
-        sent_argstruct_aggr = {}
-        sent_wordorder_aggr = {}
-        sent_assignment_aggr = {}
-        for token_num, token in enumerate(sent):
+        sent = data[sent_idx]
+        yield sent_idx, (
+            sent,
+            sent[token_num],
+            len(rules_not_followed["agreement"]) > 0,
+            len(rules_not_followed["wordorder"]) > 0,
+            len(rules_not_followed["casemarking"]) > 0,
+            rules_not_followed["agreement"],
+            rules_not_followed["wordorder"],
+            rules_not_followed["casemarking"],
+        )
 
-            featuresInDatapoint = utils.extractFeatures(
-                token_num, token, sent, dep_data_token, use_lexical=True
-            )
 
-            # Checking agreement for Gender, Person, Number
-            agreement_rules_not_followed, isAgreeError = checkAgreementScores(
+def _score(
+    data,
+    lang_rule_all,
+    score_sent: bool,
+    verbose: bool,
+    workers: int,
+    compiled: bool = False,
+    error_limits: dict = None,
+    timer: timing_utils.StageTimer = None,
+    rule_stats: profile_utils.RuleStats = None,
+):
+    """
+    single traversal over `data`, returns rule counts, sentence texts (if requested) and errors
+    with a `timer`, the traversal is timed as a whole and split into feature extraction and rule matching,
+    the split is summed over workers (cpu time of the workers, wall time spent in each worker)
+    with `rule_stats`, the per-rule evaluation statistics of all workers are added to it
+    """
+    if not compiled:
+        with timing_utils.stage(timer, "scoring: compile rules", throughput=False):
+            lang_rule_all = compile_rules(lang_rule_all)
+    timed, profile_rules = timer is not None, rule_stats is not None
+    with timing_utils.stage(timer, "scoring: rule evaluation"):
+        if workers > 1 and len(data) > 1:
+            counts = count_utils.RuleCounts(track_sentences=score_sent)
+            errors = error_utils.ErrorRecords(**(error_limits or {}))
+            sent_texts, stage_times, chunk_rule_stats = [], [], []
+            for (
+                chunk_counts,
+                chunk_texts,
+                chunk_errors,
+                chunk_times,
+                chunk_stats,
+            ) in _run_parallel(
+                data,
                 lang_rule_all,
-                token,
-                sent,
-                featuresInDatapoint,
-                agreement_aggr,
-                sent_agreement_aggr,
-            )
-
-            # Checking word order for subject-verb, object-verb, adj-noun, noun-adp, numeral-noun
-            wordorder_rules_not_followed, isWordOrderError = checkWordOrderScores(
+                score_sent,
+                workers,
+                verbose,
+                error_limits,
+                timed,
+                profile_rules,
+            ):
+                counts.merge(chunk_counts)
+                errors.merge(chunk_errors)
+                sent_texts += chunk_texts
+                stage_times.append(chunk_times)
+                chunk_rule_stats.append(chunk_stats)
+        else:
+            counts, sent_texts, errors, chunk_times, chunk_stats = _aggregate(
+                data,
                 lang_rule_all,
-                token,
-                sent,
-                featuresInDatapoint,
-                wordorder_aggr,
-                sent_wordorder_aggr,
+                range(len(data)),
+                score_sent,
+                verbose=verbose,
+                error_limits=error_limits,
+                timed=timed,
+                profile_rules=profile_rules,
             )
-            # utils.printExamples(
-            #     wordorder_rules_not_followed,
-            #     sent_tokens,
-            #     token,
-            #     token_num,
-            #     sent,
-            #     id2index,
-            #     sent_error_examples,
-            #     task="wordorder",
-            # )
+            stage_times, chunk_rule_stats = [chunk_times], [chunk_stats]
 
-            # Checking casemarking for nouns, propernouns, pronouns,
-            assignment_rules_not_followed, isAssignmentError = checkAssignmentScores(
-                lang_rule_all,
-                token,
-                sent,
-                featuresInDatapoint,
-                assignment_aggr,
-                argstruct_aggr,
-                sent_assignment_aggr,
-            )
-            # utils.printExamples(
-            #     assignment_rules_not_followed,
-            #     sent_tokens,
-            #     token,
-            #     token_num,
-            #     sent,
-            #     id2index,
-            #     sent_error_examples,
-            #     task="casemarking",
-            # )
-
-            if isAgreeError or isWordOrderError or isAssignmentError:
-                sent_error_examples += [
-                    (
-                        sent,
-                        token,
-                        isAgreeError,
-                        isWordOrderError,
-                        isAssignmentError,
-                        agreement_rules_not_followed,
-                        wordorder_rules_not_followed,
-                        assignment_rules_not_followed,
-                    )
-                ]
+    if timed:
+        for chunk_times in stage_times:
+            for name, (wall, cpu) in chunk_times.items():
+                timer.add(f"scoring: {name}", wall, cpu)
+    if profile_rules:
+        for chunk_stats in chunk_rule_stats:
+            rule_stats.merge(chunk_stats)
 
-        sent_score, sent_report = compute_joint_score(
-            sent_agreement_aggr,
-            sent_wordorder_aggr,
-            sent_assignment_aggr,
-            sent_argstruct_aggr,
-        )
-        # fout.write(f'sent score: {sent_score} \t sent: {" ".join(sent_tokens)}\n')
-        # sent_score_examples.append((sent_score, sent_error_examples, " ".join(sent_tokens)))
-        # sorted error sents
-        # sent_score_examples.sort()
-        # for (sent_score, sent_error_examples, sent) in sent_score_examples[:500]:
-        #     fout.write(f"score: {sent_score} \t sent: {sent}\n")
-        #     fout.write(f'{"".join(sent_error_examples)}\n\n')
-    score, report = compute_joint_score(
-        agreement_aggr, wordorder_aggr, assignment_aggr, argstruct_aggr
-    )
-    agr_score, agr_report = compute_score(
-        agreement_aggr, task="agreement", argstruct_aggr=None
-    )
-    wo_score, wo_report = compute_score(
-        wordorder_aggr, task="wordorder", argstruct_aggr=None
-    )
-    argstruct_score, argstruct_report = compute_score(
-        assignment_aggr, task="casemarking", argstruct_aggr=argstruct_aggr
+    return counts, sent_texts, errors
+
+
+def require_total(keys) -> np.ndarray:
+    """rules that only count towards the score if they have a non-zero total"""
+    return np.array([key[0] == ARGSTRUCT for key in keys], dtype=bool)
+
+
+def _bootstrap_summary(counts, n_sents: int, n_resamples: int, seed: int = None):
+    """bootstrap distribution of the document-level joint score over resampled sentences"""
+    scores = stat_utils.bootstrap_scores(
+        counts.sentence_counts(), n_sents, require_total(counts.keys), n_resamples, seed
     )
+    return stat_utils.summarize(scores)
+
+
+def _doc_score_dict(
+    counts,
+    report: bool = True,
+    n_sents: int = 0,
+    bootstrap: int = 0,
+    seed: int = None,
+    timer: timing_utils.StageTimer = None,
+):
+    with timing_utils.stage(timer, "scoring: document scores", throughput=False):
+        keys, rule_ids, doc_counts = counts.keys, np.arange(len(counts)), counts.counts
+        score, joint_report = compute_joint_score(keys, rule_ids, doc_counts, report)
+        agr_score, agr_report = compute_score(
+            keys, rule_ids, doc_counts, task="agreement", report=report
+        )
+        wo_score, wo_report = compute_score(
+            keys, rule_ids, doc_counts, task="wordorder", report=report
+        )
+        argstruct_score, argstruct_report = compute_score(
+            keys, rule_ids, doc_counts, task="casemarking", report=report
+        )
 
-    score_dict = {
+    doc_score = {
         "agr_score": agr_score,
         "agr_report": agr_report,
         "wo_score": wo_score,
@@ -580,6 +647,183 @@ def get_doc_score(data, lang_rule_all, verbose: bool = False):
         "argstruct_score": argstruct_score,
         "argstruct_report": argstruct_report,
         "joint_score": score,
-        "joint_report": report,
+        "joint_report": joint_report,
     }
-    return score_dict, sent_error_examples
+    if bootstrap > 0:
+        with timing_utils.stage(timer, "scoring: bootstrap", throughput=False):
+            doc_score["bootstrap"] = _bootstrap_summary(
+                counts, n_sents, bootstrap, seed
+            )
+
+    return doc_score
+
+
+def _sent_score_dicts(
+    counts, sent_texts, report: bool = True, timer: timing_utils.StageTimer = None
+):
+    """
+    per-sentence scores are computed for all sentences at once, the readable reports only if requested
+    """
+    with timing_utils.stage(timer, "scoring: sentence scores"):
+        sent_idx, rule_ids, sent_counts = counts.sentence_counts()
+        scores = compute_sent_scores(
+            counts.keys, sent_idx, rule_ids, sent_counts, len(sent_texts)
+        )
+        bounds = np.searchsorted(sent_idx, np.arange(len(sent_texts) + 1))
+
+        sent_scores = []
+        for idx, sent in enumerate(sent_texts):
+            sent_score = {name: values[idx] for name, values in scores.items()}
+            sent_score["sent"] = sent
+            if report:
+                rows = slice(bounds[idx], bounds[idx + 1])
+                args = (counts.keys, rule_ids[rows], sent_counts[rows])
+                _, sent_score["agr_report"] = compute_score(*args, task="agreement")
+                _, sent_score["wo_report"] = compute_score(*args, task="wordorder")
+                _, sent_score["assignment_report"] = compute_score(
+                    *args, task="casemarking"
+                )
+                _, sent_score["joint_report"] = compute_joint_score(*args)
+            sent_scores.append(sent_score)
+
+    return sent_scores
+
+
+def get_sent_score(
+    data,
+    lang_rule_all,
+    verbose: bool = False,
+    workers: int = 1,
+    report: bool = True,
+    max_errors: int = None,
+    errors_per_rule: int = None,
+    spill_bytes: int = None,
+    timer: timing_utils.StageTimer = None,
+    rule_stats: profile_utils.RuleStats = None,
+):
+    """
+    computes the grammar error metric at sentence level
+    with `max_errors`/`errors_per_rule`, only a sample of the errors is kept (see error_utils.ErrorRecords)
+    with `spill_bytes`, error records beyond that size are spilled to a temporary file
+    with a `timer`, the scoring stages are timed (see timing_utils.StageTimer)
+    with `rule_stats`, per-rule evaluation statistics are added to it (see profile_utils.RuleStats)
+    """
+
+    logging.info(f"computing sentence-level lambre score")
+
+    counts, sent_texts, errors = _score(
+        data,
+        lang_rule_all,
+        True,
+        verbose,
+        workers,
+        error_limits={
+            "max_errors": max_errors,
+            "errors_per_rule": errors_per_rule,
+            "spill_bytes": spill_bytes,
+        },
+        timer=timer,
+        rule_stats=rule_stats,
+    )
+    return _sent_score_dicts(counts, sent_texts, report, timer), errors
+
+
+def get_doc_score(
+    data,
+    lang_rule_all,
+    verbose: bool = False,
+    workers: int = 1,
+    report: bool = True,
+    bootstrap: int = 0,
+    seed: int = None,
+    max_errors: int = None,
+    errors_per_rule: int = None,
+    spill_bytes: int = None,
+    timer: timing_utils.StageTimer = None,
+    rule_stats: profile_utils.RuleStats = None,
+):
+    """
+    computes grammar error metric at document level
+    with `bootstrap` > 0, the document score is also computed over as many resamples of the sentences
+    with `max_errors`/`errors_per_rule`, only a sample of the errors is kept (see error_utils.ErrorRecords)
+    with `spill_bytes`, error records beyond that size are spilled to a temporary file
+    with a `timer`, the scoring stages are timed (see timing_utils.StageTimer)
+    with `rule_stats`, per-rule evaluation statistics are added to it (see profile_utils.RuleStats)
+    """
+
+    logging.info(f"computing document-level lambre score")
+
+    counts, _, errors = _score(
+        data,
+        lang_rule_all,
+        bootstrap > 0,
+        verbose,
+        workers,
+        error_limits={
+            "max_errors": max_errors,
+            "errors_per_rule": errors_per_rule,
+            "spill_bytes": spill_bytes,
+        },
+        timer=timer,
+        rule_stats=rule_stats,
+    )
+    return (
+        _doc_score_dict(counts, report, len(data), bootstrap, seed, timer),
+        errors,
+    )
+
+
+def get_doc_and_sent_score(
+    data,
+    lang_rule_all,
+    verbose: bool = False,
+    workers: int = 1,
+    report: bool = True,
+    bootstrap: int = 0,
+    seed: int = None,
+    max_errors: int = None,
+    errors_per_rule: int = None,
+    spill_bytes: int = None,
+    timer: timing_utils.StageTimer = None,
+    rule_stats: profile_utils.RuleStats = None,
+):
+    """
+    computes grammar error metric at document and sentence level in a single pass
+    with `bootstrap` > 0, the document score is also computed over as many resamples of the sentences
+    with `max_errors`/`errors_per_rule`, only a sample of the errors is kept (see error_utils.ErrorRecords)
+    with `spill_bytes`, error records beyond that size are spilled to a temporary file
+    with a `timer`, the scoring stages are timed (see timing_utils.StageTimer)
+    with `rule_stats`, per-rule evaluation statistics are added to it (see profile_utils.RuleStats)
+    """
+
+    logging.info(f"computing document and sentence-level lambre scores")
+
+    counts, sent_texts, errors = _score(
+        data,
+        lang_rule_all,
+        True,
+        verbose,
+        workers,
+        error_limits={
+            "max_errors": max_errors,
+            "errors_per_rule": errors_per_rule,
+            "spill_bytes": spill_bytes,
+        },
+        timer=timer,
+        rule_stats=rule_stats,
+    )
+    return (
+        _doc_score_dict(counts, report, len(data), bootstrap, seed, timer),
+        _sent_score_dicts(counts, sent_texts, report, timer),
+        errors,
+    )
+
+
+def get_rule_counts(data, compiled_rules, verbose: bool = False, workers: int = 1):
+    """
+    per-sentence rule counts (see count_utils.RuleCounts) for rules prepared with compile_rules,
+    lets several outputs be scored with the same rules
+    """
+
+    counts, _, _ = _score(data, compiled_rules, True, verbose, workers, compiled=True)
+    return counts
@@ -1,10 +1,14 @@
 import logging
+import time
 from collections import defaultdict
-from copy import deepcopy
+from itertools import groupby
+from operator import itemgetter
 
 import numpy as np
 from tqdm import tqdm
 
+from lambre import count_utils, error_utils, profile_utils, stat_utils, timing_utils
+
 
 def getFeatureValue(feat, feats):
     if feat not in feats:
@@ -21,133 +25,163 @@ def get_feat_str(feat_dict):
     )
 
 
-def compute_argstruct_score(argstruct_aggr):
-    """ """
-    weights = []
-    scores = []
-    report = {}
-    for depd_type in argstruct_aggr:
-        for feat in argstruct_aggr[depd_type]:
-            for token_type in argstruct_aggr[depd_type][feat]:
-                mismatch, match, total = argstruct_aggr[depd_type][feat][token_type][
-                    "counts"
-                ]
-                if mismatch + match > 0 and total > 0:
-                    score, weight = float(match) / (match + mismatch), 1
-                    weights.append(weight)
-                    scores.append(score)
-                    report["args=%s:%s:%s" % (depd_type, token_type, feat)] = score
-
-    total_weight = np.sum(weights)
-    if total_weight > 0:
-        return (
-            np.sum(
-                [
-                    score * weight / total_weight
-                    for score, weight in zip(scores, weights)
-                ]
-            ),
-            report,
-        )
-    # no errors or correct examples found for the pre-specified rules
-    return 1.0, {}
+"""
+rule types, the first element of every RuleCounts key
+"""
+AGREEMENT, ARGSTRUCT = 0, 1
+
+
+def _score_rows(keys, rule_ids, counts):
+    """rows sorted by rule id (i.e. rules file order), with their rule types and match ratios"""
+    order = np.argsort(rule_ids, kind="stable")
+    rule_ids, counts = rule_ids[order], counts[order]
+    sections = np.array([keys[rule_id][0] for rule_id in rule_ids], dtype=np.int64)
+    ratio, valid = count_utils.match_ratios(counts, require_total=sections == ARGSTRUCT)
+    return rule_ids, counts, sections, ratio, valid
+
+
+def _report_key(key):
+    section, rule_type, name = key
+    if section == AGREEMENT:
+        return "agr=%s:%s" % (rule_type, name), name
+    feat, token_type = name
+    return "args=%s:%s:%s" % (rule_type, token_type, feat), feat
+
+
+def compute_argstruct_score(keys, rule_ids, counts, report: bool = True):
+    """
+    `counts` holds the [mismatch, match, total] rows of the rules in `rule_ids`, `keys` maps rule ids to rules
+    """
+    rule_ids, counts, sections, ratio, valid = _score_rows(keys, rule_ids, counts)
+    valid &= sections == ARGSTRUCT
+    if not valid.any():
+        # no errors or correct examples found for the pre-specified rules
+        return 1.0, {}
+    score = count_utils.mean_score(ratio, valid)
+    if not report:
+        return score, {}
+    return score, {
+        _report_key(keys[rule_id])[0]: rule_score
+        for rule_id, rule_score in zip(rule_ids[valid], ratio[valid].tolist())
+    }
 
 
-def compute_agreement_score(agreement_aggr):
+def compute_agreement_score(keys, rule_ids, counts, report: bool = True):
     """
     each agreement type (dep-rel, dim) percentages are computed individually and average is returned
     """
-    agr_weights = []
-    agr_scores = []
-    agr_report = {}
-    for agr_type in agreement_aggr:
-        for dim in agreement_aggr[agr_type]:
-            mismatch, match, total = agreement_aggr[agr_type][dim]
-            if mismatch + match > 0:
-                agr_score, agr_weight = float(match) / (match + mismatch), 1
-                agr_weights.append(agr_weight)
-                agr_scores.append(agr_score)
-                agr_report["agr=%s:%s" % (agr_type, dim)] = agr_score
-
-    total_weight = np.sum(agr_weights)
-    if total_weight > 0:
-        return (
-            np.sum(
-                [
-                    score * weight / total_weight
-                    for score, weight in zip(agr_scores, agr_weights)
-                ]
-            ),
-            agr_report,
-        )
-    # no agreements nor disagreements found for the pre-specified rules
-    return 1.0, {}
+    rule_ids, counts, sections, ratio, valid = _score_rows(keys, rule_ids, counts)
+    valid &= sections == AGREEMENT
+    if not valid.any():
+        # no agreements nor disagreements found for the pre-specified rules
+        return 1.0, {}
+    score = count_utils.mean_score(ratio, valid)
+    if not report:
+        return score, {}
+    return score, {
+        _report_key(keys[rule_id])[0]: rule_score
+        for rule_id, rule_score in zip(rule_ids[valid], ratio[valid].tolist())
+    }
+
 
+def compute_joint_score(keys, rule_ids, counts, report: bool = True):
 
-def compute_joint_score(agreement_aggr, argstruct_aggr):
+    rule_ids, counts, sections, ratio, valid = _score_rows(keys, rule_ids, counts)
+    score = count_utils.mean_score(ratio, valid)
+    if not report or not valid.any():
+        return score, {}
 
-    weights = []
-    scores = []
     report = {}
     dim_score_match = defaultdict(lambda: 0)
     dim_score_total = defaultdict(lambda: 0)
-
-    for agr_type in agreement_aggr:
-        for dim in agreement_aggr[agr_type]:
-            mismatch, match, total = agreement_aggr[agr_type][dim]
-            if mismatch + match > 0:
-                agr_score, agr_weight = float(match) / (match + mismatch), 1
-                weights.append(agr_weight)
-                scores.append(agr_score)
-                dim_score_match[dim] += match
-                dim_score_total[dim] += total
-                report["agr=%s:%s" % (agr_type, dim)] = agr_score
-
-    for depd_type in argstruct_aggr:
-        for feat in argstruct_aggr[depd_type]:
-            for token_type in argstruct_aggr[depd_type][feat]:
-                mismatch, match, total = argstruct_aggr[depd_type][feat][token_type][
-                    "counts"
-                ]
-                if mismatch + match > 0 and total > 0:
-                    score, weight = float(match) / (match + mismatch), 1
-                    weights.append(weight)
-                    scores.append(score)
-                    dim_score_match[feat] += match
-                    dim_score_total[feat] += total
-                    report["args=%s:%s:%s" % (depd_type, token_type, feat)] = score
+    for rule_id, (_, match, total), rule_score in zip(
+        rule_ids[valid], counts[valid].tolist(), ratio[valid].tolist()
+    ):
+        report_key, dim = _report_key(keys[rule_id])
+        report[report_key] = rule_score
+        dim_score_match[dim] += match
+        dim_score_total[dim] += total
 
     for dim, match in dim_score_match.items():
         total = dim_score_total[dim]
         percentage_match = float(match) / total
         report[f"model: {dim}"] = percentage_match
 
-    total_weight = np.sum(weights)
-    if total_weight > 0:
-        return (
-            np.sum(
-                [
-                    score * weight / total_weight
-                    for score, weight in zip(scores, weights)
-                ]
-            ),
-            report,
-        )
-    else:
-        # no errors or correct examples found for the pre-specified rules
-        return 1.0, {}
+    return score, report
 
 
-def check_argstruct_rule(token, head_token_idx, argstruct_dict, sent):
+def compute_sent_scores(keys, sent_idx, rule_ids, counts, n_sents: int):
+    """
+    joint and per-type scores of every sentence from sparse (sentence, rule) count rows
+    """
+    order = np.lexsort((rule_ids, sent_idx))
+    sent_idx, rule_ids, counts = sent_idx[order], rule_ids[order], counts[order]
+
+    sections = np.array([key[0] for key in keys], dtype=np.int64)[rule_ids]
+    ratio, valid = count_utils.match_ratios(counts, require_total=sections == ARGSTRUCT)
+    return {
+        "agr_score": count_utils.sent_mean_scores(
+            sent_idx, ratio, valid & (sections == AGREEMENT), n_sents
+        ),
+        "argstruct_score": count_utils.sent_mean_scores(
+            sent_idx, ratio, valid & (sections == ARGSTRUCT), n_sents
+        ),
+        "joint_score": count_utils.sent_mean_scores(sent_idx, ratio, valid, n_sents),
+    }
+
+
+def index_rules(lang_agr, lang_argstruct):
+    """
+    static rule metadata shared by all sentences
+    rules are numbered in file order, counts are kept in a RuleCounts table indexed by rule id
+    """
+    keys = []
+    agreement_index = {}  # agr_type -> [(feat, rule_id)]
+    for agr_type in lang_agr:
+        agreement_index[agr_type] = []
+        for feat in dict.fromkeys(lang_agr[agr_type]):
+            agreement_index[agr_type].append((feat, len(keys)))
+            keys.append((AGREEMENT, agr_type, feat))
+
+    argstruct_index = {}  # depd_type -> [(feat, {token_type: (rule_id, feat_value)})]
+    for depd_type in lang_argstruct:
+        argstruct_index[depd_type] = []
+        for feat in lang_argstruct[depd_type]:
+            depd_feat_value, head_feat_value = lang_argstruct[depd_type][feat]
+            rules = {}
+            for token_type, feat_value in [
+                ("depd", depd_feat_value),
+                ("head", head_feat_value),
+            ]:
+                rules[token_type] = (len(keys), feat_value)
+                keys.append((ARGSTRUCT, depd_type, (feat, token_type)))
+            argstruct_index[depd_type].append((feat, rules))
+
+    return {
+        "agreement": agreement_index,
+        "argstruct": argstruct_index,
+        "keys": keys,
+    }
+
+
+def check_argstruct_rule(
+    token, head_token_idx, argstruct_index, counts, sent, rule_stats=None
+):
+    """
+    returns the violated rules as (rule_id, observed value, expected value) tuples
+    with `rule_stats` (see profile_utils.RuleStats), every rule evaluation is counted and timed by rule id,
+    the time of a feature is split evenly between its dependent and head rules
+    """
     depd_type = "%s-%s-%s" % (
         token.deprel,
         token.upos,
         sent[head_token_idx].upos,
     )
-    errors_in_features = []
     errors = []
-    if depd_type in argstruct_dict:
-        for feat in argstruct_dict[depd_type]:
+    if depd_type in argstruct_index:
+        for feat, rules in argstruct_index[depd_type]:
+            if rule_stats is not None:
+                start = time.perf_counter()
             token_feat_value = token.feats[feat] if feat in token.feats else None
             head_feat_value = (
                 sent[head_token_idx].feats[feat]
@@ -156,60 +190,74 @@ def check_argstruct_rule(token, head_token_idx, argstruct_dict, sent):
             )
             isRuleErrorDepd, isRuleErrorHead = False, False
 
-            depd_dict_value = argstruct_dict[depd_type][feat]["depd"]
-            if token_feat_value != None and depd_dict_value["feat_value"] != "-":
-                if (
-                    len(
-                        token_feat_value & set(depd_dict_value["feat_value"].split(","))
-                    )
-                    == 0
-                ):
+            depd_rule_id, depd_rule_value = rules["depd"]
+            if token_feat_value != None and depd_rule_value != "-":
+                if len(token_feat_value & set(depd_rule_value.split(","))) == 0:
                     isRuleErrorDepd = True
 
             """ checking for error in argument structure rule w.r.t head """
-            head_dict_value = argstruct_dict[depd_type][feat]["head"]
-            if head_feat_value != None and head_dict_value["feat_value"] != "-":
-                if (
-                    len(head_feat_value & set(head_dict_value["feat_value"].split(",")))
-                    == 0
-                ):
+            head_rule_id, head_rule_value = rules["head"]
+            if head_feat_value != None and head_rule_value != "-":
+                if len(head_feat_value & set(head_rule_value.split(","))) == 0:
                     isRuleErrorHead = True
 
             """ depd argument structure rule """
-            if not isRuleErrorDepd:
-                argstruct_dict[depd_type][feat]["depd"]["counts"][1] += 1
-            else:
-                argstruct_dict[depd_type][feat]["depd"]["counts"][0] += 1
-                errors += [(sent, feat, token.id, token_feat_value, head_token_idx, "")]
-            if argstruct_dict[depd_type][feat]["depd"]["feat_value"] != "-":
-                # only if there is a rule on feat values
-                argstruct_dict[depd_type][feat]["depd"]["counts"][2] += 1
+            # the total only counts if there is a rule on feat values
+            counts.add(depd_rule_id, not isRuleErrorDepd, depd_rule_value != "-")
+            if isRuleErrorDepd:
+                errors += [
+                    (
+                        depd_rule_id,
+                        getFeatureValue(feat, token.feats),
+                        depd_rule_value,
+                    )
+                ]
 
             """ head argument structure rule """
-            if not isRuleErrorHead:
-                argstruct_dict[depd_type][feat]["head"]["counts"][1] += 1
-            else:
-                argstruct_dict[depd_type][feat]["head"]["counts"][0] += 1
-                errors += [(sent, feat, token.id, "", head_token_idx, head_feat_value)]
-                errors_in_features.append(feat)
-
-            if argstruct_dict[depd_type][feat]["head"]["feat_value"] != "-":
-                # only if there is a rule on feat values
-                argstruct_dict[depd_type][feat]["head"]["counts"][2] += 1
-
-    return errors_in_features, errors
-
+            counts.add(head_rule_id, not isRuleErrorHead, head_rule_value != "-")
+            if isRuleErrorHead:
+                errors += [
+                    (
+                        head_rule_id,
+                        getFeatureValue(feat, sent[head_token_idx].feats),
+                        head_rule_value,
+                    )
+                ]
 
-def check_agreement(token, head_token_idx, agreement_dict, sent):
+            if rule_stats is not None:
+                elapsed = (time.perf_counter() - start) / 2
+                rule_stats.add(
+                    depd_rule_id,
+                    token_feat_value != None and depd_rule_value != "-",
+                    elapsed,
+                )
+                rule_stats.add(
+                    head_rule_id,
+                    head_feat_value != None and head_rule_value != "-",
+                    elapsed,
+                )
+
+    return errors
+
+
+def check_agreement(
+    token, head_token_idx, agreement_index, counts, sent, rule_stats=None
+):
+    """
+    returns the violated rules as (rule_id, observed value, expected value) tuples,
+    the expected value being the value of the head
+    with `rule_stats` (see profile_utils.RuleStats), every rule evaluation is counted and timed by rule id
+    """
     errors = []
     agr_type = "%s-%s-%s" % (
         token.deprel,
         token.upos,
         sent[head_token_idx].upos,
     )
-    errors_in_features = []
-    if agr_type in agreement_dict:
-        for feat in agreement_dict[agr_type]:
+    if agr_type in agreement_index:
+        for feat, rule_id in agreement_index[agr_type]:
+            if rule_stats is not None:
+                start = time.perf_counter()
             isDisagreement = False
             token_feat_value = token.feats[feat] if feat in token.feats else None
             head_feat_value = (
@@ -222,160 +270,348 @@ def check_agreement(token, head_token_idx, agreement_dict, sent):
                     isDisagreement = True
                     errors += [
                         (
-                            sent,
-                            feat,
-                            token.id,
-                            token_feat_value,
-                            head_token_idx,
-                            head_feat_value,
+                            rule_id,
+                            getFeatureValue(feat, token.feats),
+                            getFeatureValue(feat, sent[head_token_idx].feats),
                         )
                     ]
 
-            if not isDisagreement:
-                agreement_dict[agr_type][feat][1] += 1
+            counts.add(rule_id, not isDisagreement)
+            if rule_stats is not None:
+                rule_stats.add(
+                    rule_id,
+                    token_feat_value != None and head_feat_value != None,
+                    time.perf_counter() - start,
+                )
+
+    return errors
+
+
+def _score(
+    data,
+    rule_index,
+    score_sent: bool,
+    verbose: bool,
+    error_limits: dict = None,
+    timer: timing_utils.StageTimer = None,
+    rule_stats: profile_utils.RuleStats = None,
+):
+    """
+    single traversal over `data`, returns rule counts, sentence texts (if requested) and errors
+    errors are recorded as compact records referencing sentences in `data` by index,
+    `error_limits` are passed on to error_utils.ErrorRecords
+    with a `timer`, the traversal is timed as rule matching
+    with `rule_stats`, the per-rule evaluation statistics are added to it
+    """
+
+    counts = count_utils.RuleCounts(rule_index["keys"], track_sentences=score_sent)
+    errors = error_utils.ErrorRecords(**(error_limits or {}))
+    sent_texts = []
+    id_stats = profile_utils.RuleStats() if rule_stats is not None else None
+    with timing_utils.stage(timer, "scoring: rule matching"):
+        for sent_idx, sent in enumerate(tqdm(data, disable=not verbose)):
+            id2index = sent._ids_to_indexes
+            for token_num, token in enumerate(sent):
+                if token.head != "0" and token.head is not None:
+                    anns = [token.upos, token.deprel, sent[token.head].upos]
+                    if not None in anns:
+                        head_num = id2index[token.head]
+                        for check_rule, index in [
+                            (check_agreement, rule_index["agreement"]),
+                            (check_argstruct_rule, rule_index["argstruct"]),
+                        ]:
+                            for rule_id, observed, expected in check_rule(
+                                token, token.head, index, counts, sent, id_stats
+                            ):
+                                errors.add(
+                                    sent_idx,
+                                    token_num,
+                                    head_num,
+                                    errors.rule_id(rule_index["keys"][rule_id]),
+                                    observed,
+                                    expected,
+                                )
+
+            counts.end_sentence(sent_idx)
+            if score_sent:
+                sent_texts.append(" ".join([token.form for token in sent]))
+
+        counts.flush()
+    if rule_stats is not None:
+        rule_stats.merge(id_stats, keys=rule_index["keys"])
+    return counts, sent_texts, errors
+
+
+def error_rule_name(key) -> str:
+    """readable error rule key"""
+    section, rule_type, name = key
+    if section == AGREEMENT:
+        return "\t".join(["agreement", rule_type, name])
+    feat, token_type = name
+    return "\t".join(["argstruct", rule_type, feat, token_type])
+
+
+def materialize_errors(data, errors):
+    """
+    re-materialize error records into the tuples used by the visualizations:
+    (sent, feat, token_id, token_feat_value, head_token_id, head_feat_value)
+    sentences are only looked up in `data` as the tuples are consumed
+    """
+    for _, error in _materialize(data, errors):
+        yield error
+
+
+def materialize_sentence_errors(data, errors):
+    """error tuples (see materialize_errors) grouped by sentence, as (sent, error tuples) pairs"""
+    for _, sent_errors in groupby(_materialize(data, errors), key=itemgetter(0)):
+        sent_errors = [error for _, error in sent_errors]
+        yield sent_errors[0][0], sent_errors
+
+
+def _materialize(data, errors):
+    """(sentence index, error tuple) pairs, see materialize_errors"""
+    records = errors.records
+    # records may be memory-mapped (see error_utils.ErrorRecords), they are converted in blocks
+    for start in range(0, len(records), 4096):
+        for sent_idx, token_num, head_num, rule_id, *_ in records[
+            start : start + 4096
+        ].tolist():
+            sent = data[sent_idx]
+            token, head_token = sent[token_num], sent[head_num]
+            section, _, name = errors.keys[rule_id]
+            if section == AGREEMENT:
+                feat = name
+                token_feat_value, head_feat_value = (
+                    token.feats[feat],
+                    head_token.feats[feat],
+                )
             else:
-                agreement_dict[agr_type][feat][0] += 1
-                errors_in_features.append(feat)
+                feat, token_type = name
+                if token_type == "depd":
+                    token_feat_value, head_feat_value = token.feats[feat], ""
+                else:
+                    token_feat_value, head_feat_value = "", head_token.feats[feat]
+            yield sent_idx, (
+                sent,
+                feat,
+                token.id,
+                token_feat_value,
+                token.head,
+                head_feat_value,
+            )
 
-            agreement_dict[agr_type][feat][2] += 1
 
-    return errors_in_features, errors
+def require_total(keys) -> np.ndarray:
+    """rules that only count towards the score if they have a non-zero total"""
+    return np.array([key[0] == ARGSTRUCT for key in keys], dtype=bool)
 
 
-def get_sent_score(data, lang_agr, lang_argstruct, verbose: bool = False):
+def _bootstrap_summary(counts, n_sents: int, n_resamples: int, seed: int = None):
+    """bootstrap distribution of the document-level joint score over resampled sentences"""
+    scores = stat_utils.bootstrap_scores(
+        counts.sentence_counts(), n_sents, require_total(counts.keys), n_resamples, seed
+    )
+    return stat_utils.summarize(scores)
+
+
+def _doc_score_dict(
+    counts,
+    report: bool = True,
+    n_sents: int = 0,
+    bootstrap: int = 0,
+    seed: int = None,
+    timer: timing_utils.StageTimer = None,
+):
+    with timing_utils.stage(timer, "scoring: document scores", throughput=False):
+        keys, rule_ids, doc_counts = counts.keys, np.arange(len(counts)), counts.counts
+        score, joint_report = compute_joint_score(keys, rule_ids, doc_counts, report)
+        agr_score, agr_report = compute_agreement_score(
+            keys, rule_ids, doc_counts, report
+        )
+        argstruct_score, argstruct_report = compute_argstruct_score(
+            keys, rule_ids, doc_counts, report
+        )
+
+    doc_score = {
+        "agr_score": agr_score,
+        "agr_report": agr_report,
+        "argstruct_score": argstruct_score,
+        "argstruct_report": argstruct_report,
+        "joint_score": score,
+        "joint_report": joint_report,
+    }
+    if bootstrap > 0:
+        with timing_utils.stage(timer, "scoring: bootstrap", throughput=False):
+            doc_score["bootstrap"] = _bootstrap_summary(
+                counts, n_sents, bootstrap, seed
+            )
+
+    return doc_score
+
+
+def _sent_score_dicts(
+    counts, sent_texts, report: bool = True, timer: timing_utils.StageTimer = None
+):
+    """
+    per-sentence scores are computed for all sentences at once, the readable reports only if requested
+    """
+    with timing_utils.stage(timer, "scoring: sentence scores"):
+        sent_idx, rule_ids, sent_counts = counts.sentence_counts()
+        scores = compute_sent_scores(
+            counts.keys, sent_idx, rule_ids, sent_counts, len(sent_texts)
+        )
+        bounds = np.searchsorted(sent_idx, np.arange(len(sent_texts) + 1))
+
+        sent_scores = []
+        for idx, sent in enumerate(sent_texts):
+            sent_score = {name: values[idx] for name, values in scores.items()}
+            sent_score["sent"] = sent
+            if report:
+                rows = slice(bounds[idx], bounds[idx + 1])
+                args = (counts.keys, rule_ids[rows], sent_counts[rows])
+                _, sent_score["agr_report"] = compute_agreement_score(*args)
+                _, sent_score["argstruct_report"] = compute_argstruct_score(*args)
+                _, sent_score["joint_report"] = compute_joint_score(*args)
+            sent_scores.append(sent_score)
+
+    return sent_scores
+
+
+def get_sent_score(
+    data,
+    lang_agr,
+    lang_argstruct,
+    verbose: bool = False,
+    report: bool = True,
+    max_errors: int = None,
+    errors_per_rule: int = None,
+    spill_bytes: int = None,
+    timer: timing_utils.StageTimer = None,
+    rule_stats: profile_utils.RuleStats = None,
+):
     """
     computes the grammar error metric at sentence level
+    with `max_errors`/`errors_per_rule`, only a sample of the errors is kept (see error_utils.ErrorRecords)
+    with `spill_bytes`, error records beyond that size are spilled to a temporary file
+    with a `timer`, the scoring stages are timed (see timing_utils.StageTimer)
+    with `rule_stats`, per-rule evaluation statistics are added to it (see profile_utils.RuleStats)
     """
 
     logging.info(f"computing sentence-level lambre score")
 
-    scores = []
-    error_tuples = []
-
-    for sent in tqdm(data, disable=not verbose):
-
-        agreement_aggr = {}
-        for agr_type in lang_agr:
-            agreement_aggr[agr_type] = {}
-            for dim_type in lang_agr[agr_type]:
-                agreement_aggr[agr_type][dim_type] = [0] * 3
-
-        argstruct_aggr = {}
-        for depd_type in lang_argstruct:
-            argstruct_aggr[depd_type] = {}
-            for feat in lang_argstruct[depd_type]:
-                depd_feat_value, head_feat_value = lang_argstruct[depd_type][feat]
-                argstruct_aggr[depd_type][feat] = {
-                    "depd": {
-                        "feat_value": depd_feat_value,
-                        "counts": [0, 0, 0],
-                    },
-                    "head": {
-                        "feat_value": head_feat_value,
-                        "counts": [0, 0, 0],
-                    },
-                }
-
-        sent_tokens = []
-        for token in sent:
-            sent_tokens.append(token.form)
-
-        for token in sent:
-            if token.head != "0" and token.head is not None:
-                anns = [token.upos, token.deprel, sent[token.head].upos]
-                if not None in anns:
-                    token_error_feats, token_error_tuples = check_agreement(
-                        token,
-                        token.head,
-                        agreement_aggr,
-                        sent,
-                    )
-                    error_tuples.extend(token_error_tuples)
-                    token_error_feats, token_error_tuples = check_argstruct_rule(
-                        token,
-                        token.head,
-                        argstruct_aggr,
-                        sent,
-                    )
-                    error_tuples.extend(token_error_tuples)
-
-        agr_score, agr_report = compute_agreement_score(agreement_aggr)
-        argstruct_score, argstruct_report = compute_argstruct_score(argstruct_aggr)
-        score, report = compute_joint_score(agreement_aggr, argstruct_aggr)
-
-        scores.append(
-            {
-                "agr_score": agr_score,
-                "agr_report": agr_report,
-                "argstruct_score": argstruct_score,
-                "argstruct_report": argstruct_report,
-                "joint_score": score,
-                "joint_report": report,
-                "sent": " ".join(sent_tokens),
-            }
-        )
-
-    return scores, error_tuples
-
-
-def get_doc_score(data, lang_agr, lang_argstruct, verbose: bool = False):
+    rule_index = index_rules(lang_agr, lang_argstruct)
+    counts, sent_texts, errors = _score(
+        data,
+        rule_index,
+        True,
+        verbose,
+        error_limits={
+            "max_errors": max_errors,
+            "errors_per_rule": errors_per_rule,
+            "spill_bytes": spill_bytes,
+        },
+        timer=timer,
+        rule_stats=rule_stats,
+    )
+    return _sent_score_dicts(counts, sent_texts, report, timer), errors
+
+
+def get_doc_score(
+    data,
+    lang_agr,
+    lang_argstruct,
+    verbose: bool = False,
+    report: bool = True,
+    bootstrap: int = 0,
+    seed: int = None,
+    max_errors: int = None,
+    errors_per_rule: int = None,
+    spill_bytes: int = None,
+    timer: timing_utils.StageTimer = None,
+    rule_stats: profile_utils.RuleStats = None,
+):
     """
     computes grammar error metric at document level
+    with `bootstrap` > 0, the document score is also computed over as many resamples of the sentences
+    with `max_errors`/`errors_per_rule`, only a sample of the errors is kept (see error_utils.ErrorRecords)
+    with `spill_bytes`, error records beyond that size are spilled to a temporary file
+    with a `timer`, the scoring stages are timed (see timing_utils.StageTimer)
+    with `rule_stats`, per-rule evaluation statistics are added to it (see profile_utils.RuleStats)
     """
 
     logging.info(f"computing document-level lambre score")
 
-    """ agreement counts are accumulated for the entire document """
-    agreement_aggr = {}
-    for agr_type in lang_agr:
-        agreement_aggr[agr_type] = {}
-        for dim_type in lang_agr[agr_type]:
-            agreement_aggr[agr_type][dim_type] = [0] * 3
+    rule_index = index_rules(lang_agr, lang_argstruct)
+    counts, _, errors = _score(
+        data,
+        rule_index,
+        bootstrap > 0,
+        verbose,
+        error_limits={
+            "max_errors": max_errors,
+            "errors_per_rule": errors_per_rule,
+            "spill_bytes": spill_bytes,
+        },
+        timer=timer,
+        rule_stats=rule_stats,
+    )
+    return (
+        _doc_score_dict(counts, report, len(data), bootstrap, seed, timer),
+        errors,
+    )
 
-    argstruct_aggr = {}
-    for depd_type in lang_argstruct:
-        argstruct_aggr[depd_type] = {}
-        for feat in lang_argstruct[depd_type]:
-            depd_feat_value, head_feat_value = lang_argstruct[depd_type][feat]
-            argstruct_aggr[depd_type][feat] = {
-                "depd": {
-                    "feat_value": depd_feat_value,
-                    "counts": [0, 0, 0],
-                },
-                "head": {
-                    "feat_value": head_feat_value,
-                    "counts": [0, 0, 0],
-                },
-            }
-
-    error_tuples = []
-    for sent in tqdm(data, disable=not verbose):
-        for token in sent:
-            if token.head != "0" and token.head is not None:
-                anns = [token.upos, token.deprel, sent[token.head].upos]
-                if not None in anns:
-                    token_error_feats, token_error_tuples = check_agreement(
-                        token, token.head, agreement_aggr, sent
-                    )
-                    error_tuples.extend(token_error_tuples)
-                    token_error_feats, token_error_tuples = check_argstruct_rule(
-                        token,
-                        token.head,
-                        argstruct_aggr,
-                        sent,
-                    )
-                    error_tuples.extend(token_error_tuples)
 
-    score, report = compute_joint_score(agreement_aggr, argstruct_aggr)
-    agr_score, agr_report = compute_agreement_score(agreement_aggr)
-    argstruct_score, argstruct_report = compute_argstruct_score(argstruct_aggr)
+def get_doc_and_sent_score(
+    data,
+    lang_agr,
+    lang_argstruct,
+    verbose: bool = False,
+    report: bool = True,
+    bootstrap: int = 0,
+    seed: int = None,
+    max_errors: int = None,
+    errors_per_rule: int = None,
+    spill_bytes: int = None,
+    timer: timing_utils.StageTimer = None,
+    rule_stats: profile_utils.RuleStats = None,
+):
+    """
+    computes grammar error metric at document and sentence level in a single pass
+    with `bootstrap` > 0, the document score is also computed over as many resamples of the sentences
+    with `max_errors`/`errors_per_rule`, only a sample of the errors is kept (see error_utils.ErrorRecords)
+    with `spill_bytes`, error records beyond that size are spilled to a temporary file
+    with a `timer`, the scoring stages are timed (see timing_utils.StageTimer)
+    with `rule_stats`, per-rule evaluation statistics are added to it (see profile_utils.RuleStats)
+    """
 
-    score_dict = {
-        "agr_score": agr_score,
-        "agr_report": agr_report,
-        "argstruct_score": argstruct_score,
-        "argstruct_report": argstruct_report,
-        "joint_score": score,
-        "joint_report": report,
-    }
-    return score_dict, error_tuples
+    logging.info(f"computing document and sentence-level lambre scores")
+
+    rule_index = index_rules(lang_agr, lang_argstruct)
+    counts, sent_texts, errors = _score(
+        data,
+        rule_index,
+        True,
+        verbose,
+        error_limits={
+            "max_errors": max_errors,
+            "errors_per_rule": errors_per_rule,
+            "spill_bytes": spill_bytes,
+        },
+        timer=timer,
+        rule_stats=rule_stats,
+    )
+    return (
+        _doc_score_dict(counts, report, len(data), bootstrap, seed, timer),
+        _sent_score_dicts(counts, sent_texts, report, timer),
+        errors,
+    )
+
+
+def get_rule_counts(data, rule_index, verbose: bool = False):
+    """
+    per-sentence rule counts (see count_utils.RuleCounts) for rules prepared with index_rules,
+    lets several outputs be scored with the same rules
+    """
+
+    counts, _, _ = _score(data, rule_index, True, verbose)
+    return counts
@@ -0,0 +1,171 @@
+"""
+resampling statistics over per-sentence rule counts
+"""
+
+import numpy as np
+from scipy import sparse
+
+from lambre.count_utils import MISMATCH, MATCH, TOTAL
+
+# upper bound on the number of (resample, sentence) weights held in memory at once
+MAX_BATCH_ELEMENTS = 1 << 22
+
+
+def count_matrix(sent_idx, rule_ids, counts, n_sents: int, require_total: np.ndarray):
+    """
+    (n_sents, 3 * n_rules) sparse matrix with the [mismatch | match | total] counts of every sentence,
+    totals are only kept for the rules in `require_total`
+    """
+    n_rules = len(require_total)
+    keep_total = require_total[rule_ids]
+    rows = np.concatenate([sent_idx, sent_idx, sent_idx[keep_total]])
+    cols = np.concatenate(
+        [
+            MISMATCH * n_rules + rule_ids,
+            MATCH * n_rules + rule_ids,
+            TOTAL * n_rules + rule_ids[keep_total],
+        ]
+    )
+    values = np.concatenate(
+        [counts[:, MISMATCH], counts[:, MATCH], counts[keep_total, TOTAL]]
+    ).astype(np.float64)
+    return sparse.csr_matrix((values, (rows, cols)), shape=(n_sents, 3 * n_rules))
+
+
+def joint_scores(doc_counts: np.ndarray, require_total: np.ndarray) -> np.ndarray:
+    """
+    joint score (uniform average of the per-rule match ratios) of every row in a (batch, 3 * n_rules) count matrix
+    """
+    mismatch, match, total = np.split(doc_counts, 3, axis=1)
+    events = mismatch + match
+    valid = events > 0
+    valid &= ~require_total | (total > 0)
+    ratio = np.zeros(match.shape)
+    np.divide(match, events, out=ratio, where=valid)
+    n_valid = valid.sum(axis=1)
+    # no errors or correct examples found for the pre-specified rules
+    return np.where(n_valid > 0, ratio.sum(axis=1) / np.maximum(n_valid, 1), 1.0)
+
+
+def resample_weights(rng, n_resamples: int, n_sents: int) -> np.ndarray:
+    """(n_resamples, n_sents) number of times each sentence is drawn in a resample with replacement"""
+    draws = rng.integers(0, n_sents, size=(n_resamples, n_sents))
+    draws += np.arange(n_resamples)[:, None] * n_sents
+    return np.bincount(draws.ravel(), minlength=n_resamples * n_sents).reshape(
+        n_resamples, n_sents
+    )
+
+
+def _batch_size(n_resamples: int, n_sents: int, n_rules: int) -> int:
+    return max(1, min(n_resamples, MAX_BATCH_ELEMENTS // max(n_sents, 3 * n_rules, 1)))
+
+
+def bootstrap_scores(
+    sent_counts, n_sents: int, require_total: np.ndarray, n_resamples: int, seed=None
+) -> np.ndarray:
+    """
+    document-level joint scores of `n_resamples` bootstrap resamples of the sentences,
+    `sent_counts` are the sparse (sent_idx, rule_id, counts) rows of RuleCounts.sentence_counts
+    """
+    if n_sents == 0:
+        return np.ones(n_resamples)
+    rng = np.random.default_rng(seed)
+    matrix = count_matrix(*sent_counts, n_sents, require_total).T.tocsr()
+    batch_size = _batch_size(n_resamples, n_sents, len(require_total))
+
+    scores = np.empty(n_resamples)
+    for start in range(0, n_resamples, batch_size):
+        end = min(start + batch_size, n_resamples)
+        weights = resample_weights(rng, end - start, n_sents)
+        doc_counts = (matrix @ weights.T.astype(np.float64)).T
+        scores[start:end] = joint_scores(doc_counts, require_total)
+    return scores
+
+
+def summarize(scores: np.ndarray, confidence: float = 0.95):
+    """mean, standard deviation and percentile interval of resampled scores"""
+    alpha = 100 * (1 - confidence) / 2
+    ci_lower, ci_upper = np.percentile(scores, [alpha, 100 - alpha]).tolist()
+    return {
+        "n_resamples": len(scores),
+        "mean": float(np.mean(scores)),
+        "std": float(np.std(scores, ddof=1)) if len(scores) > 1 else 0.0,
+        "confidence": confidence,
+        "ci_lower": ci_lower,
+        "ci_upper": ci_upper,
+    }
+
+
+def _doc_scores(matrices, require_total: np.ndarray) -> np.ndarray:
+    """document-level joint score of every system"""
+    doc_counts = np.vstack([np.asarray(matrix.sum(axis=0)) for matrix in matrices])
+    return joint_scores(doc_counts, require_total)
+
+
+def paired_bootstrap(matrices, require_total: np.ndarray, n_resamples: int, seed=None):
+    """
+    two-sided p-values of the score differences between every pair of systems,
+    the aligned sentences of all systems are resampled jointly and the differences are tested against a zero mean
+    `matrices` are count_matrix outputs with the same (n_sents, 3 * n_rules) shape
+    returns the (n_systems,) document scores and a (n_systems, n_systems) p-value matrix
+    """
+    rng = np.random.default_rng(seed)
+    n_sents = matrices[0].shape[0]
+    scores = _doc_scores(matrices, require_total)
+    delta = scores[:, None] - scores[None, :]
+    if n_sents == 0:
+        return scores, np.ones(delta.shape)
+    transposed = [matrix.T.tocsr() for matrix in matrices]
+    batch_size = _batch_size(n_resamples, n_sents, len(require_total))
+
+    exceed = np.zeros(delta.shape, dtype=np.int64)
+    for start in range(0, n_resamples, batch_size):
+        end = min(start + batch_size, n_resamples)
+        weights = resample_weights(rng, end - start, n_sents).T.astype(np.float64)
+        resampled = np.stack(
+            [joint_scores((matrix @ weights).T, require_total) for matrix in transposed]
+        )
+        resampled_delta = resampled[:, None, :] - resampled[None, :, :]
+        # bootstrap differences are centered on the observed difference to simulate the null hypothesis
+        exceed += np.sum(
+            np.abs(resampled_delta - delta[..., None]) + 1e-12
+            >= np.abs(delta)[..., None],
+            axis=-1,
+        )
+    return scores, (exceed + 1) / (n_resamples + 1)
+
+
+def approximate_randomization(
+    matrices, require_total: np.ndarray, n_resamples: int, seed=None
+):
+    """
+    two-sided p-values of the score differences between every pair of systems,
+    the outputs of the two systems are randomly swapped per sentence
+    `matrices` are count_matrix outputs with the same (n_sents, 3 * n_rules) shape
+    returns the (n_systems,) document scores and a (n_systems, n_systems) p-value matrix
+    """
+    rng = np.random.default_rng(seed)
+    n_systems, n_sents = len(matrices), matrices[0].shape[0]
+    doc_counts = [np.asarray(matrix.sum(axis=0)) for matrix in matrices]
+    scores = joint_scores(np.vstack(doc_counts), require_total)
+    batch_size = _batch_size(n_resamples, n_sents, len(require_total))
+
+    p_values = np.ones((n_systems, n_systems))
+    for i in range(n_systems):
+        for j in range(i + 1, n_systems):
+            delta = abs(scores[i] - scores[j])
+            # swapping a sentence moves its count difference from one system to the other
+            diff_matrix = (matrices[j] - matrices[i]).T.tocsr()
+            exceed = 0
+            for start in range(0, n_resamples, batch_size):
+                end = min(start + batch_size, n_resamples)
+                swaps = rng.integers(0, 2, size=(n_sents, end - start)).astype(
+                    np.float64
+                )
+                shift = (diff_matrix @ swaps).T
+                permuted_delta = joint_scores(
+                    doc_counts[i] + shift, require_total
+                ) - joint_scores(doc_counts[j] - shift, require_total)
+                exceed += np.sum(np.abs(permuted_delta) + 1e-12 >= delta)
+            p_values[i, j] = p_values[j, i] = (exceed + 1) / (n_resamples + 1)
+    return scores, p_values
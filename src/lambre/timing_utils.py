@@ -0,0 +1,174 @@
+"""
+per-stage wall and cpu timings (and optionally peak memory) of a scoring run
+"""
+
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from lambre.memory_utils import MB, peak_rss
+
+
+def clock():
+    return time.perf_counter(), time.process_time()
+
+
+def lap(elapsed, start):
+    """add the (wall, cpu) time since `start` to `elapsed` and return the current clock"""
+    now = clock()
+    elapsed[0] += now[0] - start[0]
+    elapsed[1] += now[1] - start[1]
+    return now
+
+
+class StageTimer:
+    """
+    wall and cpu time of named pipeline stages, kept in the order stages are first entered.
+    a stage can be entered several times, its times add up.
+    throughput (sentences and tokens per second) is computed from the corpus size, once known
+    the total is measured from the creation of the timer
+
+    with `track_memory`, python allocations are traced (tracemalloc, which slows down the run) and every stage
+    records the peak of traced memory, the peak allocated on top of what was in use when the stage started
+    and the peak resident memory of the process so far. memory is only tracked in the current process
+    """
+
+    def __init__(self, track_memory: bool = False):
+        self.stages = {}
+        self.n_sents = None
+        self.n_tokens = None
+        self.start = clock()
+        self.track_memory = track_memory
+        self._tracing = track_memory and not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str, throughput: bool = True):
+        elapsed = [0.0, 0.0]
+        memory = None
+        if self.track_memory and tracemalloc.is_tracing():
+            traced_start = tracemalloc.get_traced_memory()[0]
+            # python < 3.9 only has the peak since tracing started
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+        start = clock()
+        try:
+            yield
+        finally:
+            lap(elapsed, start)
+            if self.track_memory and tracemalloc.is_tracing():
+                traced_peak = tracemalloc.get_traced_memory()[1]
+                memory = (traced_peak, traced_peak - traced_start, peak_rss())
+            self.add(name, *elapsed, throughput, memory)
+
+    def add(
+        self,
+        name: str,
+        wall: float,
+        cpu: float,
+        throughput: bool = True,
+        memory: tuple = None,
+    ):
+        """`memory` is a (peak traced, peak allocated, peak rss) tuple in bytes"""
+        stage = self.stages.setdefault(
+            name, {"wall": 0.0, "cpu": 0.0, "throughput": throughput}
+        )
+        stage["wall"] += wall
+        stage["cpu"] += cpu
+        if memory is not None:
+            for key, value in zip(["peak_traced", "peak_alloc", "peak_rss"], memory):
+                if value is not None:
+                    stage[key] = max(stage.get(key, 0), value)
+
+    def __getstate__(self):
+        # cpu clocks are per process, a timer sent to another process (e.g. a worker) carries
+        # the time elapsed so far and the total goes on from there, tracing is restarted there
+        state = self.__dict__.copy()
+        state["start"] = [0.0, 0.0]
+        lap(state["start"], self.start)
+        state["_tracing"] = False
+        return state
+
+    def __setstate__(self, state):
+        elapsed = state.pop("start")
+        now = clock()
+        self.__dict__.update(state)
+        self.start = (now[0] - elapsed[0], now[1] - elapsed[1])
+        self._tracing = self.track_memory and not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+
+    def stop(self):
+        """stop tracing allocations, if started by this timer"""
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def set_corpus_size(self, sentences):
+        self.n_sents = len(sentences)
+        self.n_tokens = sum(len(sent) for sent in sentences)
+
+    def to_dict(self):
+        stages = {}
+        for name, stage in self.stages.items():
+            record = {"wall": stage["wall"], "cpu": stage["cpu"]}
+            if stage["throughput"] and self.n_sents is not None and stage["wall"] > 0:
+                record["sents_per_sec"] = self.n_sents / stage["wall"]
+                record["tokens_per_sec"] = self.n_tokens / stage["wall"]
+            for key in ["peak_traced", "peak_alloc", "peak_rss"]:
+                if key in stage:
+                    record[f"{key}_mb"] = stage[key] / MB
+            stages[name] = record
+        total = [0.0, 0.0]
+        lap(total, self.start)
+        total = {"wall": total[0], "cpu": total[1]}
+        if self.track_memory:
+            peaks = [stage.get("peak_traced", 0) for stage in self.stages.values()]
+            total["peak_traced_mb"] = max(peaks, default=0) / MB
+            rss = peak_rss()
+            if rss is not None:
+                total["peak_rss_mb"] = rss / MB
+        return {
+            "n_sents": self.n_sents,
+            "n_tokens": self.n_tokens,
+            "stages": stages,
+            "total": total,
+        }
+
+    def table(self) -> str:
+        columns = [("sents_per_sec", "sents/s"), ("tokens_per_sec", "tokens/s")]
+        if self.track_memory:
+            columns += [("peak_alloc_mb", "alloc (MB)"), ("peak_rss_mb", "rss (MB)")]
+        timings = self.to_dict()
+        width = max([32] + [len(name) + 2 for name in timings["stages"]])
+        lines = [
+            f"{'stage':<{width}}{'wall (s)':>10}{'cpu (s)':>10}"
+            + "".join(f"{header:>12}" for _, header in columns)
+        ]
+        rows = list(timings["stages"].items()) + [("total", timings["total"])]
+        for name, record in rows:
+            values = [record.get(key) for key, _ in columns]
+            lines.append(
+                f"{name:<{width}}{record['wall']:>10.3f}{record['cpu']:>10.3f}"
+                + "".join(
+                    f"{'-' if value is None else f'{value:.1f}':>12}"
+                    for value in values
+                )
+            )
+        return "\n".join(lines)
+
+    def write_json(self, file_path):
+        with open(file_path, "w") as wf:
+            json.dump(self.to_dict(), wf, indent=2)
+
+
+@contextmanager
+def stage(timer: StageTimer, name: str, throughput: bool = True):
+    """time `name` on `timer`, does nothing without a timer"""
+    if timer is None:
+        yield
+    else:
+        with timer.stage(name, throughput):
+            yield
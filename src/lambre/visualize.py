@@ -1,21 +1,55 @@
-from collections import defaultdict
-from copy import deepcopy
+import multiprocessing as mp
+import shutil
+from collections import Counter
+from functools import lru_cache, partial
 from pathlib import Path
+from types import MappingProxyType
 from typing import List, Tuple
 
 import pyconll
 from ipymarkup import format_dep_ascii_markup, format_span_ascii_markup
 
-from lambre import rule_utils
+from lambre import ascii_utils, rule_utils
 
 
-def visualize_errors(error_tuples: List) -> Tuple[List, List]:
+@lru_cache(maxsize=None)
+def load_relation_map(file_path: Path) -> rule_utils.RelationMap:
     """
-    Visualization of errors using pratapa-etal-2021 rules
+    readable names of the rule features, used to explain the chaudhary-etal-2021 rules
+    read once per file, the frozen map is shared by every caller
+    """
+    relation_map = {}
+    with open(file_path, "r") as inp:
+        for line in inp.readlines():
+            info = line.strip().split(";")
+            key = info[0].lower()
+            value = info[1]
+            relation_map[key] = (value, info[-1])
+            if "@x" in key:
+                relation_map[key.split("@x")[0]] = (value, info[-1])
+    return rule_utils.RelationMap(relation_map)
+
+
+@lru_cache(maxsize=None)
+def load_rule_links(file_path: Path):
+    """links to the rule browser, per language, read once per file into a read-only map"""
+    rule_links = {}
+    with open(file_path, "r") as inp:
+        for line in inp.readlines():
+            info = line.strip().split(":")
+            rule_links[info[0]] = info[1]
+    return MappingProxyType(rule_links)
+
+
+def _error_tags(sent, token_ids) -> dict:
+    """POS tags of the tokens in `token_ids`, by their position in the sentence"""
+    return {idx: token.upos for idx, token in enumerate(sent) if token.id in token_ids}
+
+
+def iter_error_markup(error_tuples: List):
+    """
+    ascii markup of errors using pratapa-etal-2021 rules, as (words, POS tags of the marked tokens, depd anns) triples
     """
-    out_spans = []
-    out_depds = []
-
     for (
         sent,
         feat,
@@ -27,16 +61,6 @@ def visualize_errors(error_tuples: List) -> Tuple[List, List]:
 
         words = [token.form for token in sent]
 
-        """ span anns with POS for dependent and head tokens """
-        spans = []
-        offset = 0
-        for token in sent:
-            if token.id in [token_idx, head_token_idx]:
-                spans += [(offset, offset + len(token.form), token.upos)]
-            offset += len(token.form) + 1
-        text = " ".join(words)
-        out_spans += [list(format_span_ascii_markup(text, spans))]
-
         """ depd anns with dependency label and feature values for depd and head tokens """
         depd_anns = [
             (
@@ -45,19 +69,46 @@ def visualize_errors(error_tuples: List) -> Tuple[List, List]:
                 f"{sent[token_idx].deprel} (depd: {feat}={';'.join(list(token_feat_value))}, head: {feat}={';'.join(list(head_feat_value))})",
             )
         ]
-        out_depds += [list(format_dep_ascii_markup(words, depd_anns))]
+        yield words, _error_tags(sent, [token_idx, head_token_idx]), depd_anns
 
-    return out_spans, out_depds
 
-
-def visualize_errors_chau(error_tuples, relation_map) -> Tuple[List, List, List]:
+def iter_sentence_error_markup(sentence_errors):
     """
-    Visualization of errors using chaudhary-etal-2021 rules
+    ascii markup of errors using pratapa-etal-2021 rules, once per sentence (see score_utils_pratapa.materialize_sentence_errors)
+    with all its erroneous tokens and their heads marked
     """
-    out_spans = []
-    out_depds = []
+    for sent, errors in sentence_errors:
+        words = [token.form for token in sent]
+        token_ids = set()
+        rules = {}
+        for (
+            _,
+            feat,
+            token_idx,
+            token_feat_value,
+            head_token_idx,
+            head_feat_value,
+        ) in errors:
+            token_ids.update([token_idx, head_token_idx])
+            rules.setdefault((head_token_idx, token_idx), []).append(
+                f"depd: {feat}={';'.join(list(token_feat_value))}, head: {feat}={';'.join(list(head_feat_value))}"
+            )
 
-    for (
+        """ one depd ann per erroneous token, with every rule it violates """
+        depd_anns = [
+            (
+                int(head_token_idx) - 1,
+                int(token_idx) - 1,
+                f"{sent[token_idx].deprel} ({'; '.join(labels)})",
+            )
+            for (head_token_idx, token_idx), labels in rules.items()
+        ]
+        yield words, _error_tags(sent, token_ids), depd_anns
+
+
+def _chau_rule_labels(error_tuple, sent_tokens, relation_map) -> List[Tuple[str, str]]:
+    """(description, error type) of every rule violated by the token of a chaudhary-etal-2021 error tuple"""
+    (
         sent,
         token,
         isAgreeError,
@@ -66,116 +117,230 @@ def visualize_errors_chau(error_tuples, relation_map) -> Tuple[List, List, List]
         agreement_rules_not_followed,
         wordorder_rules_not_followed,
         assignment_rules_not_followed,
-    ) in error_tuples:
-
-        # Add the head-dependents
-        dep_data_token = defaultdict(list)
-        sent_tokens = []
+    ) = error_tuple
+
+    labels = []
+    if isAgreeError:
+        for feat, (
+            _,
+            _,
+            token_feat_value,
+            head_feat_value,
+        ) in findWordsWhereAgreementNotFollowed(
+            agreement_rules_not_followed, sent, sent_tokens, token, relation_map
+        ).items():
+            labels.append(
+                (
+                    f"depd: {feat}={token_feat_value}, head: {feat}={head_feat_value}",
+                    f"agreement-{feat}",
+                )
+            )
+    if isWordOrderError:
+        for feat in findWordsWhereWordOrderNotFollowed(
+            wordorder_rules_not_followed, sent, sent_tokens, token, relation_map
+        ):
+            labels.append(("word order violated", f"wordorder-{feat}"))
+    if isAssignmentError:
+        for feat, (
+            _,
+            _,
+            token_feat_value,
+            expected_label,
+        ) in findWordsWhereMarkingNotFollowed(
+            assignment_rules_not_followed, sent, sent_tokens, token, relation_map
+        ).items():
+            labels.append(
+                (
+                    f"depd: Case={token_feat_value}, expected label: Case={expected_label}",
+                    f"assignment-{feat}",
+                )
+            )
+    return labels
 
-        for token_num, token_ in enumerate(sent):
-            dep_data_token[token_.head].append(token_.id)
-            sent_tokens.append(token_.form)
 
-        if isAgreeError:
-            agreement_examples_per_rules = findWordsWhereAgreementNotFollowed(
-                agreement_rules_not_followed, sent, sent_tokens, token, relation_map
-            )
+def iter_error_markup_chau(error_tuples, relation_map):
+    """
+    ascii markup of errors using chaudhary-etal-2021 rules, as (words, POS tags of the marked tokens, depd anns) triples
+    """
+    for error_tuple in error_tuples:
+        sent, token = error_tuple[:2]
+        sent_tokens = [token_.form for token_ in sent]
+        labels = _chau_rule_labels(error_tuple, sent_tokens, relation_map)
 
-        if isWordOrderError:
-            wordorder_examples_per_rules = findWordsWhereWordOrderNotFollowed(
-                wordorder_rules_not_followed, sent, sent_tokens, token, relation_map
-            )
-        if isAssignmentError:
-            casemarking_examples_per_rules = findWordsWhereMarkingNotFollowed(
-                assignment_rules_not_followed, sent, sent_tokens, token, relation_map
+        """ depd anns with dependency label and feature values for depd and head tokens """
+        token_idx, head_token_idx = token.id, token.head
+        depd_anns = [
+            (
+                int(head_token_idx) - 1,
+                int(token_idx) - 1,
+                f"{sent[token_idx].deprel} ({label})",
             )
+            for label, _ in labels
+        ]
+        yield sent_tokens, _error_tags(sent, [token_idx, head_token_idx]), depd_anns
 
-        """ span anns with POS for dependent and head tokens """
-        spans = []
-        offset = 0
-        token_idx, head_token_idx = token.id, token.head
-        for token in sent:
-            if token.id in [token_idx, head_token_idx]:
-                spans += [(offset, offset + len(token.form), token.upos)]
-            offset += len(token.form) + 1
-        text = " ".join(sent_tokens)
-        out_spans += [list(format_span_ascii_markup(text, spans))]
 
+def iter_sentence_error_markup_chau(sentence_errors, relation_map):
+    """
+    ascii markup of errors using chaudhary-etal-2021 rules, once per sentence (see score_utils_chaudhary.materialize_sentence_errors)
+    with all its erroneous tokens and their heads marked
+    """
+    for sent, errors in sentence_errors:
+        sent_tokens = [token.form for token in sent]
+        token_ids = set()
         depd_anns = []
-        error_types = []
-        if isAgreeError:
-            for feat, (
-                _,
-                _,
-                _,
-                token_feat_value,
-                head_feat_value,
-            ) in agreement_examples_per_rules.items():
-                """depd anns with dependency label and feature values for depd and head tokens"""
-                depd_anns.append(
-                    (
-                        int(head_token_idx) - 1,
-                        int(token_idx) - 1,
-                        f"{sent[token_idx].deprel} (depd: {feat}={token_feat_value}, head: {feat}={head_feat_value})",
-                    )
+        for error_tuple in errors:
+            token = error_tuple[1]
+            token_ids.update([token.id, token.head])
+            labels = _chau_rule_labels(error_tuple, sent_tokens, relation_map)
+            """ one depd ann per erroneous token, with every rule it violates """
+            depd_anns.append(
+                (
+                    int(token.head) - 1,
+                    int(token.id) - 1,
+                    f"{token.deprel} ({'; '.join(label for label, _ in labels)})",
                 )
-                error_types.append(f"agreement-{feat}")
-        if isWordOrderError:
-            for feat, _ in wordorder_examples_per_rules.items():
-                """depd anns with dependency label and feature values for depd and head tokens"""
-                depd_anns.append(
-                    (
-                        int(head_token_idx) - 1,
-                        int(token_idx) - 1,
-                        f"{sent[token_idx].deprel} (word order violated)",
-                    )
-                )
-                error_types.append(f"wordorder-{feat}")
-        if isAssignmentError:
-            for feat, (
-                _,
-                _,
-                _,
-                token_feat_value,
-                expected_label,
-            ) in casemarking_examples_per_rules.items():
-                """depd anns with dependency label and feature values for depd and head tokens"""
-                depd_anns.append(
-                    (
-                        int(head_token_idx) - 1,
-                        int(token_idx) - 1,
-                        f"{sent[token_idx].deprel} (depd: Case={token_feat_value}, expected label: Case={expected_label})",
-                    )
-                )
-                error_types.append(f"assignment-{feat}")
+            )
+        yield sent_tokens, _error_tags(sent, token_ids), depd_anns
 
-        out_depds += [list(format_dep_ascii_markup(sent_tokens, depd_anns))]
 
+def render_ascii(markup, max_words: int = None, context: int = 5) -> Tuple[List, List]:
+    """
+    POS span and dependency lines of an error markup (see iter_error_markup)
+    sentences longer than `max_words` are rendered on a window of `context` words around the marked tokens
+    (see ascii_utils.format_window)
+    """
+    words, tags, depd_anns = markup
+    if max_words and len(words) > max_words:
+        return ascii_utils.format_window(words, tags, depd_anns, context)
+
+    spans = []
+    offset = 0
+    for idx, word in enumerate(words):
+        if idx in tags:
+            spans += [(offset, offset + len(word), tags[idx])]
+        offset += len(word) + 1
+    return (
+        list(format_span_ascii_markup(" ".join(words), spans)),
+        list(format_dep_ascii_markup(words, depd_anns)),
+    )
+
+
+def _render_chunk(markups, max_words=None, context=5):
+    return [render_ascii(markup, max_words, context) for markup in markups]
+
+
+def _render_all(markups) -> Tuple[List, List]:
+    out_spans = []
+    out_depds = []
+    for span_ann, depd_ann in _render_chunk(markups):
+        out_spans += [span_ann]
+        out_depds += [depd_ann]
     return out_spans, out_depds
 
 
+def visualize_errors(error_tuples: List) -> Tuple[List, List]:
+    """
+    Visualization of errors using pratapa-etal-2021 rules
+    """
+    return _render_all(iter_error_markup(error_tuples))
+
+
+def visualize_sentence_errors(sentence_errors) -> Tuple[List, List]:
+    """
+    Visualization of errors using pratapa-etal-2021 rules, once per sentence
+    """
+    return _render_all(iter_sentence_error_markup(sentence_errors))
+
+
+def visualize_errors_chau(error_tuples, relation_map) -> Tuple[List, List, List]:
+    """
+    Visualization of errors using chaudhary-etal-2021 rules
+    """
+    return _render_all(iter_error_markup_chau(error_tuples, relation_map))
+
+
+def visualize_sentence_errors_chau(sentence_errors, relation_map) -> Tuple[List, List]:
+    """
+    Visualization of errors using chaudhary-etal-2021 rules, once per sentence
+    """
+    return _render_all(iter_sentence_error_markup_chau(sentence_errors, relation_map))
+
+
+def _write_visualization(wf, span_ann: List, depd_ann: List):
+    wf.write("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~\n\n")
+    wf.write("----POS tagged sentence----\n\n")
+    wf.write("\n".join(span_ann))
+    wf.write("\n\n")
+    wf.write("----Dependency parse----\n\n")
+    wf.write("\n".join(depd_ann))
+    wf.write("\n\n~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~\n")
+
+
 def write_visualizations(file_path: str, spans: List, depds: List):
     with open(file_path, "w") as wf:
         for span_ann, depd_ann in zip(spans, depds):
-            wf.write("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~\n\n")
-            wf.write("----POS tagged sentence----\n\n")
-            wf.write("\n".join(span_ann))
-            wf.write("\n\n")
-            wf.write("----Dependency parse----\n\n")
-            wf.write("\n".join(depd_ann))
-            wf.write("\n\n~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~\n")
-
-
-def get_conll_str(sent: pyconll.unit.sentence.Sentence, token_id: int) -> str:
+            _write_visualization(wf, span_ann, depd_ann)
+
+
+def _chunks(items, size: int):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def write_ascii_visualizations(
+    file_path: str,
+    markups,
+    workers: int = 1,
+    max_words: int = None,
+    context: int = 5,
+    chunk_size: int = 256,
+):
+    """
+    render the error markups (see iter_error_markup) and write them as write_visualizations does
+    with `workers` > 1, chunks of `chunk_size` markups are rendered across a process pool and written in input order
+    sentences longer than `max_words` are rendered on a window of `context` words (see render_ascii)
+    """
+    render = partial(_render_chunk, max_words=max_words, context=context)
+    chunks = _chunks(markups, chunk_size)
+    with open(file_path, "w") as wf:
+        if workers > 1:
+            # markups are plain lists and strings, cheap to send to the workers
+            ctx = mp.get_context(
+                "fork" if "fork" in mp.get_all_start_methods() else "spawn"
+            )
+            pool = ctx.Pool(workers)
+            try:
+                for rendered in pool.imap(render, chunks):
+                    for span_ann, depd_ann in rendered:
+                        _write_visualization(wf, span_ann, depd_ann)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for chunk in chunks:
+                for span_ann, depd_ann in render(chunk):
+                    _write_visualization(wf, span_ann, depd_ann)
+
+
+def get_sentence_conll_str(sent: pyconll.unit.sentence.Sentence, token_ids) -> str:
+    """CoNLL-U block of a sentence with the tokens in `token_ids` (and their heads) marked ***"""
+    head_ids = {sent[token_id].head for token_id in token_ids}
     html_sents = ['<pre><code class="language-conllu">']
     for token in sent:
-        if token.id == token_id:
+        if token.id in token_ids:
             splits = token.conll().split("\t")
             splits[1] = f"***{splits[1]}***"
             splits[4] = "_"
             splits[8:] = ["_"] * 2
             html_sents += ["\t".join(splits)]
-        elif token.id == sent[token_id].head:
+        elif token.id in head_ids:
             splits = token.conll().split("\t")
             splits[1] = f"***{splits[1]}***"
             splits[4] = "_"
@@ -195,8 +360,12 @@ def get_conll_str(sent: pyconll.unit.sentence.Sentence, token_id: int) -> str:
     return "\n".join(html_sents)
 
 
-def visualize_conll_errors(error_tuples: List):
-    conll_str = []
+def get_conll_str(sent: pyconll.unit.sentence.Sentence, token_id: int) -> str:
+    return get_sentence_conll_str(sent, [token_id])
+
+
+def iter_conll_errors(error_tuples: List):
+    """html examples of errors using pratapa-etal-2021 rules, as (report, rules, html) triples"""
     for idx, (
         sent,
         feat,
@@ -205,141 +374,240 @@ def visualize_conll_errors(error_tuples: List):
         head_token_idx,
         head_feat_value,
     ) in enumerate(error_tuples):
-        conll_str += [f"<div class='bibtex' id='{idx}'>"]
+        conll_str = [f"<div class='bibtex' id='{idx}'>"]
         conll_str += [get_conll_str(sent, token_idx)]
         conll_str += ["</div>"]
-    return "\n".join(conll_str)
+        yield "errors", [feat], "\n".join(conll_str)
 
 
-def visualize_conll_errors_chau(error_tuples, relation_map, lang_id):
-    agreement_conll_strs, wordorder_conll_strs, casemarking_conll_strs = [], [], []
+def iter_sentence_conll_errors(sentence_errors):
+    """
+    html examples of errors using pratapa-etal-2021 rules, once per sentence with all its errors,
+    as (report, rules, html) triples
+    """
+    for idx, (sent, errors) in enumerate(sentence_errors):
+        feats, descriptions, token_ids = [], [], []
+        for (
+            _,
+            feat,
+            token_idx,
+            token_feat_value,
+            head_token_idx,
+            head_feat_value,
+        ) in errors:
+            if feat not in feats:
+                feats.append(feat)
+            descriptions.append(
+                f"{feat} of {sent[token_idx].form} ({';'.join(list(token_feat_value))}) and {sent[head_token_idx].form} ({';'.join(list(head_feat_value))})"
+            )
+            token_ids.append(token_idx)
+        conll_str = [f"<h3> Errors in {', '.join(descriptions)} </h3>"]
+        conll_str += [f"<div class='bibtex' id='{idx}'>"]
+        conll_str += [get_sentence_conll_str(sent, token_ids)]
+        conll_str += ["</div>"]
+        yield "errors", feats, "\n".join(conll_str)
 
-    idx = 0
-    agreement_conll_strs += [
-        f"<h1> The tokens of interest (i.e. have errors according to our rules) are marked in ***, hover over the ***-marked tokens for more grammar information </h1>\n"
-        f"<h2> Click on the following links for information on the rules </h2>\n"
-    ]
-    wordorder_conll_strs += [
-        f"<h1> The tokens of interest (i.e. have errors according to our rules) are marked in ***, hover over the ***-marked tokens for more grammar information </h1>\n"
-        f"<h2> Click on the following links for information on the rules </h2>\n"
-    ]
-    casemarking_conll_strs += [
-        f"<h1> The tokens of interest (i.e. have errors according to our rules) are marked in ***, hover over the ***-marked tokens for more grammar information </h1>\n"
-        f"<h2> Click on the following links for information on the rules </h2>\n"
-    ]
 
-    for (
-        sent,
-        token,
-        isAgreeError,
-        isWordOrderError,
-        isAssignmentError,
-        agreement_rules_not_followed,
-        wordorder_rules_not_followed,
-        assignment_rules_not_followed,
-    ) in error_tuples:
-        # Add the head-dependents
-        dep_data_token = defaultdict(list)
-        sent_tokens = []
-        error_types = []
-        autolex_page = f"https://aditi138.github.io/auto-lex-learn/"
-        try:
+def visualize_conll_errors(error_tuples: List):
+    return "\n".join(html for _, _, html in iter_conll_errors(error_tuples))
+
+
+def visualize_sentence_conll_errors(sentence_errors: List):
+    return "\n".join(html for _, _, html in iter_sentence_conll_errors(sentence_errors))
+
+
+CHAU_HTML_INTRO = (
+    f"<h1> The tokens of interest (i.e. have errors according to our rules) are marked in ***, hover over the ***-marked tokens for more grammar information </h1>\n"
+    f"<h2> Click on the following links for information on the rules </h2>\n"
+)
+
+
+def _chau_reports(error_tuple):
+    """(report, is error, findWords* function, rules not followed) of a chaudhary-etal-2021 error tuple"""
+    return [
+        (
+            "agreement",
+            error_tuple[2],
+            findWordsWhereAgreementNotFollowed,
+            error_tuple[5],
+        ),
+        (
+            "wordorder",
+            error_tuple[3],
+            findWordsWhereWordOrderNotFollowed,
+            error_tuple[6],
+        ),
+        (
+            "assignment",
+            error_tuple[4],
+            findWordsWhereMarkingNotFollowed,
+            error_tuple[7],
+        ),
+    ]
 
-            for token_num, token_ in enumerate(sent):
-                dep_data_token[token_.head].append(token_.id)
-                sent_tokens.append(token_.form)
 
-            if isAgreeError:
-                agreement_examples_per_rules = findWordsWhereAgreementNotFollowed(
-                    agreement_rules_not_followed, sent, sent_tokens, token, relation_map
-                )
-                erro_feats = list(agreement_examples_per_rules.keys())
-
-                agreement_conll_strs += [
-                    f'<h3> Error in morphological agreement for <b> {", ".join(erro_feats)} </b> i.e. the ***-marked tokens should have matching gender values </h3>\n'
-                ]
-                agreement_conll_strs += [f"<table>\n"]
-                for erro_feat in erro_feats:
-                    prop = erro_feat.split("-")[0].title()
-                    pos = erro_feat.split("-")[1]
-                    rule_page = (
-                        f"{autolex_page}/{lang_id}/Agreement/{prop}/{pos}/{pos}.html"
+def _chau_conll_html(report, erro_feats, sent, token_ids, idx, lang_id):
+    """(error types, html) of an example of `report` errors, with links to the rule pages"""
+    autolex_page = f"https://aditi138.github.io/auto-lex-learn/"
+    if report == "agreement":
+        conll_strs = [
+            f'<h3> Error in morphological agreement for <b> {", ".join(erro_feats)} </b> i.e. the ***-marked tokens should have matching gender values </h3>\n'
+        ]
+    elif report == "wordorder":
+        conll_strs = [
+            f'<h3> Error in word order for <b> {", ".join(erro_feats)} </b> i.e. the token and its syntactic head are not in the correct order </h3>'
+        ]
+    else:
+        conll_strs = [
+            f'<h3> Error in case marking for <b> {", ".join(erro_feats)} </b> i.e. the case value for *** marked token is not correct </h3>'
+        ]
+    conll_strs += [f"<table>\n"]
+
+    error_types = []
+    for erro_feat in erro_feats:
+        if report == "agreement":
+            prop = erro_feat.split("-")[0].title()
+            pos = erro_feat.split("-")[1]
+            rule_page = f"{autolex_page}/{lang_id}/Agreement/{prop}/{pos}/{pos}.html"
+            conll_strs += [
+                f'<tr> {prop} agreement in {pos} </tr> <tr> <a href="{rule_page}">Click here</a></tr>\n'
+            ]
+        elif report == "wordorder":
+            rule_page = (
+                f"{autolex_page}/{lang_id}/WordOrder/{erro_feat}/{erro_feat}.html"
+            )
+            conll_strs += [
+                f'<tr> word order for {erro_feat} </tr> <tr> <a href="{rule_page}">Click here</a></tr>\n'
+            ]
+        else:
+            rule_page = (
+                f"{autolex_page}/{lang_id}/CaseMarking/{erro_feat}/{erro_feat}.html"
+            )
+            conll_strs += [
+                f'<tr> case marking for {erro_feat} </tr> <tr> <a href="{rule_page}">Click here</a></tr>\n'
+            ]
+        error_types.append(f"{report}-{erro_feat}")
+    conll_strs += [f"</table>"]
+    conll_strs += [f"<div class='bibtex' id='{idx}'>"]
+    conll_strs += [get_sentence_conll_str(sent, token_ids)]
+    conll_strs += ["</div>"]
+    return error_types, "\n".join(conll_strs)
+
+
+def iter_conll_errors_chau(error_tuples, relation_map, lang_id):
+    """
+    html examples of errors using chaudhary-etal-2021 rules, as (report, rules, html) triples
+    the report is one of agreement, wordorder and assignment
+    """
+    idx = 0
+    for error_tuple in error_tuples:
+        sent, token = error_tuple[:2]
+        try:
+            sent_tokens = [token_.form for token_ in sent]
+            for report, is_error, find_words, rules_not_followed in _chau_reports(
+                error_tuple
+            ):
+                if is_error:
+                    erro_feats = list(
+                        find_words(
+                            rules_not_followed,
+                            sent,
+                            sent_tokens,
+                            token,
+                            relation_map,
+                        ).keys()
                     )
-                    agreement_conll_strs += [
-                        f'<tr> {prop} agreement in {pos} </tr> <tr> <a href="{rule_page}">Click here</a></tr>\n'
-                    ]
-                    error_types.append(f"agreement-{erro_feat}")
-                agreement_conll_strs += [f"</table>"]
-                agreement_conll_strs += [f"<div class='bibtex' id='{idx}'>"]
-                agreement_conll_strs += [get_conll_str(sent, token.id)]
-                agreement_conll_strs += ["</div>"]
-
-            if isWordOrderError:
-                wordorder_examples_per_rules = findWordsWhereWordOrderNotFollowed(
-                    wordorder_rules_not_followed, sent, sent_tokens, token, relation_map
-                )
-                erro_feats = list(wordorder_examples_per_rules.keys())
-                wordorder_conll_strs += [
-                    f'<h3> Error in word order for <b> {", ".join(erro_feats)} </b> i.e. the token and its syntactic head are not in the correct order </h3>'
-                ]
-                wordorder_conll_strs += [f"<table>\n"]
-
-                for erro_feat in erro_feats:
-                    rule_page = f"{autolex_page}/{lang_id}/WordOrder/{erro_feat}/{erro_feat}.html"
-                    wordorder_conll_strs += [
-                        f'<tr> word order for {erro_feat} </tr> <tr> <a href="{rule_page}">Click here</a></tr>\n'
-                    ]
-                    error_types.append(f"wordorder-{erro_feat}")
-                wordorder_conll_strs += [f"</table>"]
-                wordorder_conll_strs += [f"<div class='bibtex' id='{idx}'>"]
-                wordorder_conll_strs += [get_conll_str(sent, token.id)]
-                wordorder_conll_strs += ["</div>"]
-
-            if isAssignmentError:
-                casemarking_examples_per_rules = findWordsWhereMarkingNotFollowed(
-                    assignment_rules_not_followed,
-                    sent,
-                    sent_tokens,
-                    token,
-                    relation_map,
-                )
-                erro_feats = list(casemarking_examples_per_rules.keys())
-                casemarking_conll_strs += [
-                    f'<h3> Error in case marking for <b> {", ".join(erro_feats)} </b> i.e. the case value for *** marked token is not correct </h3>'
-                ]
-                casemarking_conll_strs += [f"<table>\n"]
-
-                for erro_feat in erro_feats:
-                    rule_page = f"{autolex_page}/{lang_id}/CaseMarking/{erro_feat}/{erro_feat}.html"
-                    casemarking_conll_strs += [
-                        f'<tr> case marking for {erro_feat} </tr> <tr> <a href="{rule_page}">Click here</a></tr>\n'
-                    ]
-                    error_types.append(f"assignment-{erro_feat}")
-                casemarking_conll_strs += [f"</table>"]
-                casemarking_conll_strs += [f"<div class='bibtex' id='{idx}'>"]
-                casemarking_conll_strs += [get_conll_str(sent, token.id)]
-                casemarking_conll_strs += ["</div>"]
+                    error_types, html = _chau_conll_html(
+                        report, erro_feats, sent, [token.id], idx, lang_id
+                    )
+                    yield report, error_types, html
         except Exception as e:
             continue
         idx += 1
+
+
+def iter_sentence_conll_errors_chau(sentence_errors, relation_map, lang_id):
+    """
+    html examples of errors using chaudhary-etal-2021 rules, once per sentence and report
+    with all the erroneous tokens and violated rules, as (report, rules, html) triples
+    """
+    for idx, (sent, errors) in enumerate(sentence_errors):
+        sent_tokens = [token.form for token in sent]
+        # per report, the violated rules (in order) and the erroneous tokens
+        reports = {
+            report: ({}, []) for report in ["agreement", "wordorder", "assignment"]
+        }
+        for error_tuple in errors:
+            token = error_tuple[1]
+            try:
+                for report, is_error, find_words, rules_not_followed in _chau_reports(
+                    error_tuple
+                ):
+                    if is_error:
+                        erro_feats, token_ids = reports[report]
+                        erro_feats.update(
+                            dict.fromkeys(
+                                find_words(
+                                    rules_not_followed,
+                                    sent,
+                                    sent_tokens,
+                                    token,
+                                    relation_map,
+                                )
+                            )
+                        )
+                        token_ids.append(token.id)
+            except Exception as e:
+                continue
+        for report, (erro_feats, token_ids) in reports.items():
+            if token_ids:
+                error_types, html = _chau_conll_html(
+                    report, list(erro_feats), sent, token_ids, idx, lang_id
+                )
+                yield report, error_types, html
+
+
+def _join_chau_reports(examples):
+    conll_strs = {
+        "agreement": [CHAU_HTML_INTRO],
+        "wordorder": [CHAU_HTML_INTRO],
+        "assignment": [CHAU_HTML_INTRO],
+    }
+    for report, _, html in examples:
+        conll_strs[report] += [html]
     return (
-        "\n".join(agreement_conll_strs),
-        "\n".join(wordorder_conll_strs),
-        "\n".join(casemarking_conll_strs),
+        "\n".join(conll_strs["agreement"]),
+        "\n".join(conll_strs["wordorder"]),
+        "\n".join(conll_strs["assignment"]),
+    )
+
+
+def visualize_conll_errors_chau(error_tuples, relation_map, lang_id):
+    return _join_chau_reports(
+        iter_conll_errors_chau(error_tuples, relation_map, lang_id)
+    )
+
+
+def visualize_sentence_conll_errors_chau(sentence_errors, relation_map, lang_id):
+    return _join_chau_reports(
+        iter_sentence_conll_errors_chau(sentence_errors, relation_map, lang_id)
     )
 
 
+@lru_cache(maxsize=None)
+def load_html_templates() -> Tuple[str, str]:
+    """header and footer of the html visualizations, read once"""
+    templates_path = Path(__file__).parent.resolve() / "html_templates"
+    with open(templates_path / "header.html", "r") as rf:
+        header = rf.read()
+    with open(templates_path / "footer.html", "r") as rf:
+        footer = rf.read()
+    return header, footer
+
+
 def write_html_visualizations(file_path: Path, conll_examples: str):
 
-    # load header and footer content
-    with open(
-        f"{Path(__file__).parent.resolve()}/html_templates/header.html", "r"
-    ) as rf:
-        HEADER = "".join(rf.readlines())
-    with open(
-        f"{Path(__file__).parent.resolve()}/html_templates/footer.html", "r"
-    ) as rf:
-        FOOTER = "".join(rf.readlines())
+    HEADER, FOOTER = load_html_templates()
 
     with open(file_path, "w") as wf:
         wf.write(f"{HEADER}\n")
@@ -347,6 +615,153 @@ def write_html_visualizations(file_path: Path, conll_examples: str):
         wf.write(f"{FOOTER}\n")
 
 
+def write_error_viewer(errors_path: Path):
+    """static page that renders the error store (errors.json, see error_utils.write_error_store) in the browser"""
+    shutil.copyfile(
+        Path(__file__).parent.resolve() / "html_templates" / "viewer.html",
+        Path(errors_path) / "errors_viewer.html",
+    )
+
+
+class HTMLReport:
+    """
+    streams html examples to pages of `page_size` examples ({name}_{page}.html),
+    with an index page ({name}.html) that links to the pages and counts the examples per rule
+    with `page_size` 0, all examples are written to {name}.html, as write_html_visualizations does
+    """
+
+    def __init__(
+        self, errors_path: Path, name: str, intro: str = "", page_size: int = 500
+    ):
+        self.errors_path = Path(errors_path)
+        self.name = name
+        self.intro = intro
+        self.page_size = page_size
+        self.n_examples = 0
+        self.n_pages = 0
+        self.rule_counts = Counter()
+        # page of the first example of each rule
+        self.rule_pages = {}
+        self._wf = None
+        self._page_pieces = 0
+        self._page_examples = 0
+
+    def page_name(self, page: int) -> str:
+        if self.page_size == 0:
+            return f"{self.name}.html"
+        return f"{self.name}_{page}.html"
+
+    def _write(self, html: str):
+        # pieces of a page are separated by new lines
+        if self._page_pieces > 0:
+            self._wf.write("\n")
+        self._wf.write(html)
+        self._page_pieces += 1
+
+    def _navigation(self, last: bool) -> str:
+        links = [f'<a href="{self.name}.html">index</a>']
+        if self.n_pages > 1:
+            links += [f'<a href="{self.page_name(self.n_pages - 1)}">previous</a>']
+        if not last:
+            links += [f'<a href="{self.page_name(self.n_pages + 1)}">next</a>']
+        return f"<p> page {self.n_pages}: {' | '.join(links)} </p>"
+
+    def _open_page(self):
+        header, _ = load_html_templates()
+        self.n_pages += 1
+        self._wf = open(self.errors_path / self.page_name(self.n_pages), "w")
+        self._wf.write(f"{header}\n")
+        self._page_pieces = 0
+        self._page_examples = 0
+        if self.page_size > 0:
+            self._write(self._navigation(last=True))
+        if self.intro:
+            self._write(self.intro)
+
+    def _close_page(self, last: bool):
+        _, footer = load_html_templates()
+        if self.page_size > 0:
+            self._write(self._navigation(last))
+        self._wf.write(f"\n{footer}\n")
+        self._wf.close()
+        self._wf = None
+
+    def add(self, html: str, rules: List[str] = ()):
+        if self._wf is None:
+            self._open_page()
+        elif self.page_size > 0 and self._page_examples == self.page_size:
+            self._close_page(last=False)
+            self._open_page()
+        self._write(html)
+        self._page_examples += 1
+        self.n_examples += 1
+        for rule in rules:
+            self.rule_counts[rule] += 1
+            self.rule_pages.setdefault(rule, self.n_pages)
+
+    def _write_index(self):
+        header, footer = load_html_templates()
+        lines = [
+            f"<h2> {self.n_examples} examples in {self.n_pages} pages of up to {self.page_size} </h2>",
+            "<table>",
+            "<tr> <th>rule</th> <th>examples</th> <th>first page</th> </tr>",
+        ]
+        for rule, count in self.rule_counts.most_common():
+            page = self.rule_pages[rule]
+            lines += [
+                f'<tr> <td>{rule}</td> <td>{count}</td> <td><a href="{self.page_name(page)}">{page}</a></td> </tr>'
+            ]
+        lines += ["</table>", "<p>"]
+        lines += [
+            f'<a href="{self.page_name(page)}">page {page}</a>'
+            for page in range(1, self.n_pages + 1)
+        ]
+        lines += ["</p>"]
+        with open(self.errors_path / f"{self.name}.html", "w") as wf:
+            wf.write(f"{header}\n")
+            if self.intro:
+                wf.write(f"{self.intro}\n")
+            wf.write("\n".join(lines))
+            wf.write(f"\n{footer}\n")
+
+    def close(self):
+        if self.page_size == 0:
+            # a single page, written even without examples
+            if self._wf is None:
+                self._open_page()
+            self._close_page(last=True)
+            return
+        if self._wf is not None:
+            self._close_page(last=True)
+        self._write_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_html_reports(
+    errors_path: Path, examples, file_names: dict, intro: str = "", page_size: int = 500
+):
+    """
+    stream (report, rules, html) examples (see iter_conll_errors and iter_conll_errors_chau)
+    to an HTMLReport per report, named by `file_names`
+    """
+    reports = {
+        report: HTMLReport(errors_path, name, intro, page_size)
+        for report, name in file_names.items()
+    }
+    try:
+        for report, rules, html in examples:
+            reports[report].add(html, rules)
+    finally:
+        for html_report in reports.values():
+            html_report.close()
+    return reports
+
+
 def findWordsWhereAgreementNotFollowed(
     rules_not_followed, sent, sent_tokens, token, relation_map
 ):
@@ -359,7 +774,7 @@ def findWordsWhereAgreementNotFollowed(
         if len(info) == 0:
             continue
         for (one_active, one_nonactive, label) in info:
-            sent_example_tokens = deepcopy(sent_tokens)
+            sent_example_tokens = list(sent_tokens)
             token_feature_value = rule_utils.getFeatureValue(model, token.feats)
             sent_example_tokens[token_num] = (
                 "***"
@@ -381,14 +796,17 @@ def findWordsWhereAgreementNotFollowed(
             # sent_error_examples.append(
             #     f"{model} agreement not followed by tokens marked *** because following rule was not satisfied:\n"
             # )
-            # Readable active features
-            active_text, nonactive_text = getActiveFeatures(
-                one_active, one_nonactive, "agreement", model, relation_map
-            )
+            # Readable active features, only computed when shown
             rules_per_features[model] = (
                 sent_example_tokens,
-                active_text,
-                nonactive_text,
+                partial(
+                    getActiveFeatures,
+                    one_active,
+                    one_nonactive,
+                    "agreement",
+                    model,
+                    relation_map,
+                ),
                 token_feature_value,
                 headtoken_feature_value,
             )
@@ -416,7 +834,7 @@ def findWordsWhereWordOrderNotFollowed(
             else:
                 not_label = "before"
 
-            sent_example_tokens = deepcopy(sent_tokens)
+            sent_example_tokens = list(sent_tokens)
             sent_example_tokens[token_num] = (
                 "***" + sent_example_tokens[token_num] + f"({dep})***"
             )
@@ -430,14 +848,17 @@ def findWordsWhereWordOrderNotFollowed(
             # sent_error_examples.append(
             #     f"{model} order not followed for tokens marked ***, predicted order is {label} but observed is {not_label}. because following rule was not satisfied:\n"
             # )
-            # Readable active features
-            active_text, nonactive_text = getActiveFeatures(
-                one_active, one_nonactive, "wordorder", model, relation_map
-            )
+            # Readable active features, only computed when shown
             rules_per_features[model] = (
                 sent_example_tokens,
-                active_text,
-                nonactive_text,
+                partial(
+                    getActiveFeatures,
+                    one_active,
+                    one_nonactive,
+                    "wordorder",
+                    model,
+                    relation_map,
+                ),
                 None,
                 None,
             )
@@ -456,7 +877,7 @@ def findWordsWhereMarkingNotFollowed(
         if len(info) == 0:
             continue
         for (one_active, one_nonactive, label) in info:
-            sent_example_tokens = deepcopy(sent_tokens)
+            sent_example_tokens = list(sent_tokens)
             value = rule_utils.getFeatureValue("Case", token.feats)
             sent_example_tokens[token_num] = (
                 "***"
@@ -468,14 +889,17 @@ def findWordsWhereMarkingNotFollowed(
             # sent_error_examples.append(
             #     f"{model} agreement not followed by tokens marked *** because following rule was not satisfied:\n"
             # )
-            # Readable active features
-            active_text, nonactive_text = getActiveFeatures(
-                one_active, one_nonactive, "assignment", model, relation_map
-            )
+            # Readable active features, only computed when shown
             rules_per_features[model] = (
                 sent_example_tokens,
-                active_text,
-                nonactive_text,
+                partial(
+                    getActiveFeatures,
+                    one_active,
+                    one_nonactive,
+                    "assignment",
+                    model,
+                    relation_map,
+                ),
                 value,
                 label,
             )
@@ -0,0 +1,226 @@
+"""
+downloads against a local stand-in server (http.server): resume after a dropped connection,
+restarts when the range is ignored or not satisfiable, checksums, retries and atomic archive installs
+"""
+
+import hashlib
+import http.server
+import io
+import re
+import tarfile
+import threading
+import time
+import urllib.error
+
+import pytest
+
+from lambre.download import fetch, fetch_extract
+
+DATA = bytes(range(256)) * 64
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """
+    serves the files of the server, each request of a path takes the next mode of its plan:
+    ok, cut (half the body, then the connection is dropped), norange (the Range header is ignored)
+    or an HTTP error code, the plan ends with ok
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.lstrip("/")
+        self.server.requests.append((path, self.headers.get("Range")))
+        plan = self.server.plans.get(path, [])
+        mode = plan.pop(0) if plan else "ok"
+        if path not in self.server.files:
+            self.send_error(404)
+            return
+        if mode.isdigit():
+            self.send_error(int(mode))
+            return
+        data = self.server.files[path]
+        start = 0
+        match = re.match(r"bytes=(\d+)-", self.headers.get("Range") or "")
+        if match and mode != "norange":
+            start = int(match.group(1))
+            if start >= len(data):
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}"
+            )
+        else:
+            self.send_response(200)
+        body = data[start:]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if mode == "cut":
+            self.wfile.write(body[: len(body) // 2])
+            self.wfile.flush()
+            self.connection.shutdown(2)
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.files, server.plans, server.requests = {}, {}, []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def waits(monkeypatch):
+    """the backoff waits, without waiting"""
+    waits = []
+    monkeypatch.setattr(time, "sleep", waits.append)
+    return waits
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def tar_archive(files: dict) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def test_resume_after_dropped_connection(server, tmp_path, waits):
+    server.files["de.txt"] = DATA
+    server.plans["de.txt"] = ["cut"]
+    file_path = tmp_path / "de.txt"
+
+    fetch(f"{server.url}/de.txt", file_path, sha256(DATA), backoff=0.5)
+
+    assert file_path.read_bytes() == DATA
+    assert not (tmp_path / "de.txt.part").exists()
+    # the second attempt asks for the missing half only
+    assert server.requests == [
+        ("de.txt", None),
+        ("de.txt", f"bytes={len(DATA) // 2}-"),
+    ]
+    assert waits == [0.5]
+
+
+def test_restart_when_range_is_ignored(server, tmp_path, waits):
+    server.files["de.txt"] = DATA
+    server.plans["de.txt"] = ["norange"]
+    file_path = tmp_path / "de.txt"
+    part_path = tmp_path / "de.txt.part"
+    part_path.write_bytes(b"stale partial download")
+
+    fetch(f"{server.url}/de.txt", file_path, sha256(DATA))
+
+    # the full body was written over the partial file, not appended to it
+    assert file_path.read_bytes() == DATA
+    assert not part_path.exists()
+    assert server.requests == [("de.txt", "bytes=22-")]
+    assert waits == []
+
+
+def test_restart_on_unsatisfiable_range(server, tmp_path, waits):
+    server.files["de.txt"] = DATA
+    file_path = tmp_path / "de.txt"
+    part_path = tmp_path / "de.txt.part"
+    part_path.write_bytes(DATA + b"longer than the resource")
+
+    fetch(f"{server.url}/de.txt", file_path, sha256(DATA))
+
+    assert file_path.read_bytes() == DATA
+    assert not part_path.exists()
+    assert server.requests == [
+        ("de.txt", f"bytes={len(DATA) + 24}-"),
+        ("de.txt", None),
+    ]
+
+
+def test_checksum_mismatch(server, tmp_path, waits):
+    server.files["de.txt"] = DATA
+    file_path = tmp_path / "de.txt"
+
+    with pytest.raises(ValueError, match="checksum mismatch"):
+        fetch(f"{server.url}/de.txt", file_path, sha256(b"other"), retries=2)
+
+    # every attempt downloads from scratch, nothing corrupt is kept
+    assert not file_path.exists()
+    assert not (tmp_path / "de.txt.part").exists()
+    assert server.requests == [("de.txt", None)] * 3
+    assert waits == [1.0, 2.0]
+
+
+def test_retry_server_errors_with_backoff(server, tmp_path, waits):
+    server.files["de.txt"] = DATA
+    server.plans["de.txt"] = ["503", "500"]
+    file_path = tmp_path / "de.txt"
+
+    fetch(f"{server.url}/de.txt", file_path, backoff=0.25)
+
+    assert file_path.read_bytes() == DATA
+    assert not (tmp_path / "de.txt.part").exists()
+    assert len(server.requests) == 3
+    assert waits == [0.25, 0.5]
+
+
+def test_server_errors_exhaust_retries(server, tmp_path, waits):
+    server.files["de.txt"] = DATA
+    server.plans["de.txt"] = ["503"] * 3
+    file_path = tmp_path / "de.txt"
+
+    with pytest.raises(urllib.error.HTTPError):
+        fetch(f"{server.url}/de.txt", file_path, retries=2)
+
+    assert not file_path.exists()
+    assert len(server.requests) == 3
+
+
+def test_client_errors_are_not_retried(server, tmp_path, waits):
+    with pytest.raises(urllib.error.HTTPError):
+        fetch(f"{server.url}/missing.txt", tmp_path / "missing.txt")
+
+    assert len(server.requests) == 1
+    assert waits == []
+
+
+def test_archive_install_is_atomic(server, tmp_path, waits):
+    archive = tar_archive({"de/model.pt": DATA, "de/config.json": b"{}"})
+    server.files["de.tar.gz"] = archive
+    server.plans["de.tar.gz"] = ["cut"]
+    parser_dir = tmp_path / "lambre_stanza_resources"
+    (parser_dir / "de").mkdir(parents=True)
+    (parser_dir / "de" / "model.pt").write_bytes(b"previous model")
+
+    # an interrupted download leaves the previous install as it was
+    with pytest.raises((OSError, ValueError)):
+        fetch_extract(f"{server.url}/de.tar.gz", parser_dir, sha256(archive), retries=0)
+    assert [entry.name for entry in parser_dir.iterdir()] == ["de"]
+    assert (parser_dir / "de" / "model.pt").read_bytes() == b"previous model"
+
+    # so does a corrupt one
+    with pytest.raises(ValueError, match="checksum mismatch"):
+        fetch_extract(
+            f"{server.url}/de.tar.gz", parser_dir, sha256(b"other"), retries=0
+        )
+    assert [entry.name for entry in parser_dir.iterdir()] == ["de"]
+    assert (parser_dir / "de" / "model.pt").read_bytes() == b"previous model"
+
+    fetch_extract(f"{server.url}/de.tar.gz", parser_dir, sha256(archive))
+    assert [entry.name for entry in parser_dir.iterdir()] == ["de"]
+    assert sorted(entry.name for entry in (parser_dir / "de").iterdir()) == [
+        "config.json",
+        "model.pt",
+    ]
+    assert (parser_dir / "de" / "model.pt").read_bytes() == DATA
@@ -0,0 +1,84 @@
+"""
+scoring of the parsed sample in data/conllu with small rule sets: the process pool gives the same
+scores as scoring in the main process, and scoring documents and sentences in a single pass gives
+the same scores as scoring them separately
+"""
+
+from pathlib import Path
+
+import pyconll
+import pytest
+
+from lambre import score_utils_chaudhary, score_utils_pratapa
+from lambre.metric import load_rules
+
+CONLLU = Path(__file__).parent.parent / "data" / "conllu" / "de.conllu"
+
+CHAUDHARY_RULES = """\
+de	chaudhary-etal-2021	agreement	Gender-NOUN	req-agree	NA	NA	10
+de	chaudhary-etal-2021	agreement	Gender-NOUN	req-agree	headfeat_Number_Plur	headfeat_Number_Sing	10
+de	chaudhary-etal-2021	agreement	Number-ADJ	req-agree	NA	depdeppos_NOUN	10
+de	chaudhary-etal-2021	wordorder	subject-verb	before	headfeat_VERB_VerbForm_Fin ### depfeat_Case_Nom	NA	10
+de	chaudhary-etal-2021	wordorder	subject-verb	after	NA	depfeat_Gender_Masc	10
+de	chaudhary-etal-2021	wordorder	noun-adposition	after	NA	NA	10
+de	chaudhary-etal-2021	casemarking	NOUN	Dat	NA	NA	10
+de	chaudhary-etal-2021	casemarking	NOUN	Gen	deppos_NOUN	depheadpos_ADP	10
+"""
+
+PRATAPA_RULES = """\
+de	pratapa-etal-2021	agreement	det-DET-NOUN	Case
+de	pratapa-etal-2021	agreement	det-DET-NOUN	Number
+de	pratapa-etal-2021	agreement	det-DET-NOUN	Gender
+de	pratapa-etal-2021	argstruct	subj-PROPN-VERB	Person	3	Nom
+de	pratapa-etal-2021	argstruct	comp:obj-PRON-VERB	Case	Acc	Acc
+"""
+
+
+@pytest.fixture(scope="module")
+def data():
+    return pyconll.load_from_file(str(CONLLU))
+
+
+def rules(tmp_path, rule_set: str, text: str) -> tuple:
+    """the rules, as the positional arguments of the scorer of `rule_set`"""
+    file_path = tmp_path / f"{rule_set}.txt"
+    file_path.write_text(text)
+    lang_rules = load_rules(file_path, rule_set)
+    if rule_set == "pratapa-etal-2021":
+        return lang_rules
+    return (lang_rules,)
+
+
+def test_pool_matches_serial(data, tmp_path):
+    lang_rules = rules(tmp_path, "chaudhary-etal-2021", CHAUDHARY_RULES)
+
+    serial, serial_errors = score_utils_chaudhary.get_doc_score(
+        data, *lang_rules, workers=1
+    )
+    pooled, pooled_errors = score_utils_chaudhary.get_doc_score(
+        data, *lang_rules, workers=2
+    )
+
+    assert serial["joint_score"] < 1.0
+    assert pooled == serial
+    assert len(pooled_errors) == len(serial_errors)
+
+
+@pytest.mark.parametrize(
+    "scorer, rule_set, text",
+    [
+        (score_utils_chaudhary, "chaudhary-etal-2021", CHAUDHARY_RULES),
+        (score_utils_pratapa, "pratapa-etal-2021", PRATAPA_RULES),
+    ],
+)
+def test_single_pass_matches_separate(data, tmp_path, scorer, rule_set, text):
+    lang_rules = rules(tmp_path, rule_set, text)
+
+    doc_score, _ = scorer.get_doc_score(data, *lang_rules)
+    sent_scores, _ = scorer.get_sent_score(data, *lang_rules)
+    single_doc, single_sents, _ = scorer.get_doc_and_sent_score(data, *lang_rules)
+
+    assert len(single_sents) == len(data)
+    assert any(sent["joint_score"] < 1.0 for sent in single_sents)
+    assert single_doc == doc_score
+    assert single_sents == sent_scores